@@ -1,25 +1,167 @@
 from browser import ActionPlanner, Coordinate,ScrollBar,BrowserState
 from typing import Optional,Union,cast
-from PIL import Image
+from PIL import Image, ImageChops, ImageDraw
 import io
+import logging
 import os
+import asyncio
+import threading
+import time
+from collections import deque
 import random
 import json
-from math import floor
+from math import floor, sqrt
 from datetime import datetime
 import base64
-from dataclasses import dataclass
-from anthropic import Anthropic
+from dataclasses import dataclass, asdict, field
+from types import SimpleNamespace
+from anthropic import AsyncAnthropic
 from anthropic.types.beta import BetaMessage,BetaTextBlockParam,BetaImageBlockParam,BetaToolUseBlockParam
-from browser import BrowserStep,BrowserActionType,BrowserAction,_kind
+from browser import BrowserStep,BrowserActionType,BrowserAction,_kind,_CLICKS
+from scheduler import PlannerScheduler, get_default_scheduler
+from clients import get_client_registry
 # from human_pause import is_challenge_present, wait_for_human, PAUSE_ON_CHALLENGE
 
+logger = logging.getLogger(__name__)
+
 # Base64 encoded cursor image
 CURSOR_64 = "iVBORw0KGgoAAAANSUhEUgAAAAoAAAAQCAYAAAAvf+5AAAAAw3pUWHRSYXcgcHJvZmlsZSB0eXBlIGV4aWYAAHjabVBRDsMgCP33FDuC8ijF49i1S3aDHX9YcLFLX+ITeOSJpOPzfqVHBxVOvKwqVSQbuHKlZoFmRzu5ZD55rvX8Uk9Dz2Ql2A1PVaJ/1MvPwK9m0TIZ6TOE7SpUDn/9M4qH0CciC/YwqmEEcqGEQYsvSNV1/sJ25CvUTxqBjzGJU86rbW9f7B0QHSjIxoD6AOiHE1oXjAlqjQVyxmTMkJjEFnK3p4H0BSRiWUv/cuYLAAABhWlDQ1BJQ0MgcHJvZmlsZQAAeJx9kT1Iw0AYht+2SqVUHCwo0iFD1cWCqIijVqEIFUKt0KqDyaV/0KQhSXFxFFwLDv4sVh1cnHV1cBUEwR8QZwcnRRcp8buk0CLGg7t7eO97X+6+A/yNClPNrnFA1SwjnUwI2dyqEHxFCFEM0DoqMVOfE8UUPMfXPXx8v4vzLO+6P0evkjcZ4BOIZ5luWMQbxNObls55nzjCSpJCfE48ZtAFiR+5Lrv8xrnosJ9nRoxMep44QiwUO1juYFYyVOIp4piiapTvz7qscN7irFZqrHVP/sJwXltZ5jrNKJJYxBJECJBRQxkVWIjTrpFiIk3nCQ//kOMXySWTqwxGjgVUoUJy/OB/8Lu3ZmFywk0KJ4DuF9v+GAaCu0Czbtvfx7bdPAECz8CV1vZXG8DMJ+n1thY7Avq2gYvrtibvAZc7wOCTLhmSIwVo+gsF4P2MvikH9N8CoTW3b61znD4AGepV6gY4OARGipS97vHuns6+/VvT6t8Ph1lyr0hzlCAAAA14aVRYdFhNTDpjb20uYWRvYmUueG1wAAAAAAA8P3hwYWNrZXQgYmVnaW49Iu+7vyIgaWQ9Ilc1TTBNcENlaGlIenJlU3pOVGN6a2M5ZCI/Pgo8eDp4bXBtZXRhIHhtbG5zOng9ImFkb2JlOm5zOm1ldGEvIiB4OnhtcHRrPSJYTVAgQ29yZSA0LjQuMC1FeGl2MiI+CiA8cmRmOlJERiB4bWxuczpyZGY9Imh0dHA6Ly93d3cudzMub3JnLzE5OTkvMDIvMjItcmRmLXN5bnRheC1ucyMiPgogIDxyZGY6RGVzY3JpcHRpb24gcmRmOmFib3V0PSIiCiAgICB4bWxuczp4bXBNTT0iaHR0cDovL25zLmFkb2JlLmNvbS94YXAvMS4wL21tLyIKICAgIHhtbG5zOnN0RXZ0PSJodHRwOi8vbnMuYWRvYmUuY29tL3hhcC8xLjAvc1R5cGUvUmVzb3VyY2VFdmVudCMiCiAgICB4bWxuczpkYz0iaHR0cDovL3B1cmwub3JnL2RjL2VsZW1lbnRzLzEuMS8iCiAgICB4bWxuczpHSU1QPSJodHRwOi8vd3d3LmdpbXAub3JnL3htcC8iCiAgICB4bWxuczp0aWZmPSJodHRwOi8vbnMuYWRvYmUuY29tL3RpZmYvMS4wLyIKICAgIHhtbG5zOnhtcD0iaHR0cDovL25zLmFkb2JlLmNvbS94YXAvMS4wLyIKICAgeG1wTU06RG9jdW1lbnRJRD0iZ2ltcDpkb2NpZDpnaW1wOjFiYzFkZjE3LWM5YmMtNGYzZi1hMmEzLTlmODkyNWNiZjY4OSIKICAgeG1wTU06SW5zdGFuY2VJRD0ieG1wLmlpZDo4YTUyMWJhMC00YmNlLTQzZWEtYjgyYS04ZGM2MTBjYmZlOTgiCiAgIHhtcE1NOk9yaWdpbmFsRG9jdW1lbnRJRD0ieG1wLmRpZDplODQ3ZjUxNC00MWVlLTQ2ZjYtOTllNC1kNjI3MjMxMjhlZTIiCiAgIGRjOkZvcm1hdD0iaW1hZ2UvcG5nIgogICBHSU1QOkFQST0iMi4wIgogICBHSU1QOlBsYXRmb3JtPSJMaW51eCIKICAgR0lNUDpUaW1lU3RhbXA9IjE3MzAxNTc3NjY5MTI3ODciCiAgIEdJTVA6VmVyc2lvbj0iMi4xMC4zOCIKICAgdGlmZjpPcmllbnRhdGlvbj0iMSIKICAgeG1wOkNyZWF0b3JUb29sPSJHSU1QIDIuMTAiCiAgIHhtcDpNZXRhZGF0YURhdGU9IjIwMjQ6MTA6MjhUMTY6MjI6NDYtMDc6MDAiCiAgIHhtcDpNb2RpZnlEYXRlPSIyMDI0OjEwOjI4VDE2OjIyOjQ2LTA3OjAwIj4KICAgPHhtcE1NOkhpc3Rvcnk+CiAgICA8cmRmOlNlcT4KICAgICA8cmRmOmxpCiAgICAgIHN0RXZ0OmFjdGlvbj0ic2F2ZWQiCiAgICAgIHN0RXZ0OmNoYW5nZWQ9Ii8iCiAgICAgIHN0RXZ0Omluc3RhbmNlSUQ9InhtcC5paWQ6ZTVjOTM2ZDYtYjMzYi00NzM4LTlhNWUtYjM3YTA5MzdjZDAxIgogICAgICBzdEV2dDpzb2Z0d2FyZUFnZW50PSJHaW1wIDIuMTAgKExpbnV4KSIKICAgICAgc3RFdnQ6d2hlbj0iMjAyNC0xMC0yOFQxNjoyMjo0Ni0wNzowMCIvPgogICAgPC9yZGY6U2VxPgogICA8L3htcE1NOkhpc3Rvcnk+CiAgPC9yZGY6RGVzY3JpcHRpb24+CiA8L3JkZjpSREY+CjwveDp4bXBtZXRhPgogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgIAogICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgCiAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAgICAKICAgICAgICAgICAgICAgICAgICAgICAgICAgCjw/eHBhY2tldCBlbmQ9InciPz5/5aQ8AAAABmJLR0QAcgByAAAtJLTuAAAACXBIWXMAAABZAAAAWQGqnamGAAAAB3RJTUUH6AocFxYuv5vOJAAAAHhJREFUKM+NzzEOQXEMB+DPYDY5iEVMIpzDfRxC3mZyBK7gChZnELGohaR58f7a7dd8bVq4YaVQgTvWFVjCUcXxA28qcBBHFUcVRwWPPuFfXVsbt0PPnLBL+dKHL+wxxhSPhBcZznuDXYKH1uGzBJ+YtPAZRyy/jTd7qEoydWUQ7QAAAABJRU5ErkJggg=="
 CURSOR_BYTES = base64.b64decode(CURSOR_64)
 
+def screenshot_hash(screenshot_buffer: bytes) -> int:
+    """64-bit difference hash (dHash) of a screenshot; near-identical frames differ in few bits."""
+    with Image.open(io.BytesIO(screenshot_buffer)) as img:
+        img.draft("L", (64, 40))
+        small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+        px = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+# id(screenshot bytes) -> (bytes, dhash) for recent captures; the planner, router and decision cache
+# all look at the same frame, which is then decoded once
+_hash_memo: dict[int, tuple[bytes, int]] = {}
+_hash_memo_lock = threading.Lock()
+_HASH_MEMO_SIZE = 16
+
+def frame_hash(screenshot_buffer: bytes) -> int:
+    """screenshot_hash remembered per capture; decodes on the calling thread when not warmed."""
+    with _hash_memo_lock:
+        entry = _hash_memo.get(id(screenshot_buffer))
+    if entry is not None and entry[0] is screenshot_buffer:
+        return entry[1]
+    value = screenshot_hash(screenshot_buffer)
+    with _hash_memo_lock:
+        _hash_memo[id(screenshot_buffer)] = (screenshot_buffer, value)
+        while len(_hash_memo) > _HASH_MEMO_SIZE:
+            _hash_memo.pop(next(iter(_hash_memo)))
+    return value
+
+async def warm_frame_hashes(*screenshots: Optional[bytes]) -> None:
+    """Decode and hash captures off the event loop, so later frame_hash calls are lookups."""
+    missing = [s for s in screenshots if s]
+    if missing:
+        await asyncio.to_thread(lambda: [frame_hash(s) for s in missing])
+
+def hash_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+@dataclass(frozen=True)
+class HistoryPolicy:
+    # estimated request tokens above which older steps get folded; None = replay everything
+    token_budget: Optional[int] = None
+    # steps always replayed verbatim
+    keep_last: int = 6
+    # cap on the lines kept in the folded summary
+    max_summary_lines: int = 30
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    # fire a duplicate request once the call is slower than this percentile of recent calls
+    percentile: float = 0.95
+    # no hedging until this many latencies have been observed
+    min_samples: int = 20
+    # rolling window of recorded latencies
+    window: int = 200
+    # never hedge earlier than this, whatever the histogram says
+    min_delay_s: float = 1.0
+
+@dataclass(frozen=True)
+class ResolutionPolicy:
+    # image tokens (width*height/750) allowed per screenshot; sets the default size below max_size
+    image_token_budget: int = 1000
+    max_size: tuple[int, int] = (1280, 800)
+    min_size: tuple[int, int] = (640, 400)
+    # extra downscale right after navigating to a text-heavy page (utils.dom_sig text length)
+    text_page_scale: float = 0.6
+    text_page_chars: int = 4000
+    # send max_size when the last click left the page unchanged
+    full_after_miss: bool = True
+
+class LatencyHistogram:
+    """Rolling window of request latencies (seconds)."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(p * (len(ordered) - 1)))))
+        return ordered[idx]
+
+@dataclass(frozen=True)
 class AnthropicPlannerOptions:
-    pass
+    # keep system prompt/tools byte-stable per run and mark cache breakpoints
+    prompt_caching: bool = False
+    # dispatch the action as soon as its tool_use block closes
+    streaming: bool = False
+    # allow several tool_use blocks per reply; plan_action then returns a list of actions
+    batch_actions: bool = False
+    # "move_then_click": mouse_move, then a bare left_click; "coordinate": clicks carry their target
+    click_protocol: str = "move_then_click"
+    # duplicate slow non-streaming requests; None disables hedging
+    hedge_policy: Optional[HedgePolicy] = None
+    # point the client at a proxy or a local stand-in server
+    base_url: Optional[str] = None
+    # borrow a pooled client from clients.get_client_registry() instead of owning one
+    shared_client: bool = True
+    # shared rate-limit scheduler; falls back to scheduler.get_default_scheduler()
+    scheduler: Optional[PlannerScheduler] = None
+    # higher goes first when the scheduler has a queue
+    priority: int = 0
+    history_policy: HistoryPolicy = HistoryPolicy()
+    # per-step screenshot size from an image-token budget; None = always fit 1280x800
+    resolution_policy: Optional[ResolutionPolicy] = None
+    # send a short text instead of a new image when the frame's dHash is within this many bits
+    skip_unchanged_screenshots: bool = False
+    unchanged_hash_threshold: int = 3
+    # send only the bounding box of changed pixels against the last full frame
+    crop_changed_regions: bool = False
+    crop_max_area_ratio: float = 0.35
+    crop_padding: int = 16
+    # per-channel difference below this is treated as noise (anti-aliasing, compression)
+    crop_pixel_tolerance: int = 24
+    # "screenshot" | "text" (DOM outline only) | "both" | "auto" (picked per step);
+    # text modes need BrowserAgentOptions(collect_dom_outline=True)
+    observation_mode: str = "screenshot"
+    # numbered marks on the screenshot + click_element/type_into tools;
+    # needs BrowserAgentOptions(mark_elements=True)
+    set_of_marks: bool = False
+    # zoom(region) tool answered from the last raw screenshot at native resolution
+    zoom_tool: bool = False
+    # find_in_page(text) tool: searches the DOM (same-origin frames too) and scrolls to the best match
+    find_in_page_tool: bool = False
+    # navigate(url) tool; domain allow/deny lists live in BrowserAgentOptions
+    navigate_tool: bool = False
+    auto_min_controls: int = 3
+    auto_image_every: int = 4
 
 @dataclass
 class ScalingRatio():
@@ -33,21 +175,147 @@ class MessageOptions:
     mouse_position:bool
     screenshot:bool
     tabs:bool
+    screenshot_unchanged:bool = False
+    # pre-rendered PNG to attach instead of converting browserstate.screenshot
+    screenshot_png:Optional[bytes] = None
+    # (left, top, right, bottom) of screenshot_png inside the full frame, in screenshot coordinates
+    crop_box:Optional[tuple[int, int, int, int]] = None
+    # include browserstate.dom_outline as text
+    dom_outline:bool = False
+    # attach browserstate.zoom (answer to the zoom tool)
+    zoom:bool = False
+
+@dataclass
+class Conversation:
+    """Serialized message prefix for one run; the planner appends one step at a time."""
+    goal: str
+    additional_context: str
+    messages: list[dict]
+    last_tool_id: str
+    steps: int = 0
+    # one line per step, used when older steps are folded into a summary
+    step_summaries: list[str] = field(default_factory=list)
+    step_urls: list[str] = field(default_factory=list)
+    # history tool_result that temporarily carries the last image while the screen is unchanged
+    pinned_index: Optional[int] = None
+    pinned_plain: Optional[dict] = None
+
+    def append_step(self, tool_result_msg: dict, tool_use_msg: dict, tool_id: str, summary: str = "", url: str = ""):
+        self.messages.append(tool_result_msg)
+        self.messages.append(tool_use_msg)
+        self.last_tool_id = tool_id
+        self.steps += 1
+        self.step_summaries.append(summary)
+        self.step_urls.append(url)
+
+    def pin_image(self, index: int, image_block: dict):
+        if self.pinned_index == index:
+            return
+        self.unpin_image()
+        plain = self.messages[index]
+        result = plain["content"][0]
+        self.pinned_index = index
+        self.pinned_plain = plain
+        self.messages[index] = {
+            **plain,
+            "content": [{**result, "content": list(result["content"]) + [image_block]}],
+        }
+
+    def unpin_image(self):
+        if self.pinned_index is not None:
+            self.messages[self.pinned_index] = self.pinned_plain
+        self.pinned_index = None
+        self.pinned_plain = None
+
+    def pinned_image(self) -> Optional[dict]:
+        if self.pinned_index is None:
+            return None
+        return self.messages[self.pinned_index]["content"][0]["content"][-1]
+
+    def step_slice(self, step: int) -> int:
+        """Index in messages of the tool_result that opens the given step."""
+        return 2 + 2 * step
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+
+    @classmethod
+    def load(cls, path: str) -> "Conversation":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
 
 class AnthropicPlanner(ActionPlanner):
     def __init__(self,options:Optional[AnthropicPlannerOptions]=None) -> None:
         self.model="claude-3-5-sonnet-20241022"
         self.max_tokens=1024
         self.beta_flag=["computer-use-2024-10-22"]
-        self.client = Anthropic(api_key=os.getenv('apikey'))
+        self.computer_tool_type="computer_20241022"
+        self.options = options or AnthropicPlannerOptions()
+        if self.options.click_protocol == "coordinate":
+            # computer_20241022 takes no coordinate on click actions; computer_20250124 does,
+            # and needs its own beta and a model that supports it (Claude 3.7 Sonnet or newer)
+            self.model="claude-3-7-sonnet-20250219"
+            self.beta_flag=["computer-use-2025-01-24"]
+            self.computer_tool_type="computer_20250124"
+        self._own_client: Optional[AsyncAnthropic] = None
         self.input_token_usage:int=0
         self.output_token_usage:int=0
+        self.cache_read_token_usage:int=0
+        self.cache_write_token_usage:int=0
+        # duplicate requests fired by hedging; a cancelled loser's input is estimated from the
+        # winner (same prompt) and counted here and in input_token_usage
+        self.hedged_requests:int=0
+        self.hedge_wins:int=0
+        self.hedged_input_token_usage:int=0
         self.debug_img_path="C:\\001-MyProj\\compx576\\debug\\screenshot.png"
+        # reserved in the output-token bucket per call, corrected with the real usage afterwards
+        self.expected_output_tokens:int=256
+        self._no_retry_client = None
+        self.latency = LatencyHistogram(self.options.hedge_policy.window if self.options.hedge_policy else 200)
+        # per-run state that must not change between steps when prompt caching is on
+        self._run_started: Optional[datetime] = None
+        self._run_history: Optional[list] = None
+        self.conversation: Optional[Conversation] = None
+        self._background_tasks: set[asyncio.Task] = set()
+        # last image actually delivered to the model: (active_tab, dhash), its state and image block
+        self._last_sent_hash: Optional[tuple[str, int]] = None
+        self._last_image_state: Optional[BrowserState] = None
+        self._last_image_block: Optional[dict] = None
+        self._pending_image: Optional[tuple] = None
+        # rendered frame and URL of the last full image, used for changed-region cropping
+        self._last_sent_frame: Optional[Image.Image] = None
+        self._last_sent_url: Optional[str] = None
+        self._system_cache: dict[tuple, str] = {}
+        self._tools_cache: dict[tuple, list[dict]] = {}
+        # id(screenshot bytes) -> (bytes, ScalingRatio) the capture was sent at; keyed by the capture,
+        # not the state, so states derived with dataclasses.replace (batched actions) keep it
+        self._step_scaling: dict[int, tuple[bytes, ScalingRatio]] = {}
+
+    def start_run(self):
+        """Reset per-run prompt state; called automatically on the first step of a run."""
+        self._run_started = datetime.now()
+        self.conversation = None
+        self._last_sent_hash = None
+        self._last_image_state = None
+        self._last_image_block = None
+        self._pending_image = None
+        self._last_sent_frame = None
+        self._last_sent_url = None
+        self._system_cache.clear()
+        self._tools_cache.clear()
+        self._step_scaling.clear()
 
 
 
     def screenshot_conversion(self,screenshot_buffer: bytes, current_state:BrowserState):
-                              
+        composite = self.render_screenshot(screenshot_buffer, current_state)
+        output_buffer = io.BytesIO()
+        composite.save(output_buffer, format="PNG")
+        return output_buffer.getvalue()
+
+    def render_screenshot(self,screenshot_buffer: bytes, current_state:BrowserState) -> Image.Image:
+        """Screenshot with scrollbar and cursor overlays, thumbnailed to what the model sees."""
         with Image.open(io.BytesIO(screenshot_buffer)) as img:
             resized = img.resize((current_state.width, current_state.height), Image.Resampling.LANCZOS).convert("RGBA")
             
@@ -70,6 +338,10 @@ class AnthropicPlanner(ActionPlanner):
             composite = resized.copy()
             composite.paste(scrollbar_img, (width - scrollbar_width, scrollbar_top),scrollbar_img)
 
+            ## add set-of-marks labels
+            if self.options.set_of_marks and current_state.elements:
+                self.draw_marks(composite, current_state.elements)
+
             ## add cursor
             cursor_img = Image.open(io.BytesIO(CURSOR_BYTES))
             composite.paste(
@@ -82,24 +354,36 @@ class AnthropicPlanner(ActionPlanner):
             )
            
         
-            target_width = 1280
-            target_height = 800
+            # resize to exactly the size the coordinate scaling for this step assumes
+            new_size = self.scaling_for(current_state).new_size
+            if composite.size != (new_size.x, new_size.y):
+                composite = composite.resize((new_size.x, new_size.y), Image.Resampling.LANCZOS)
+            return composite
 
-            # Calculate dimensions that fit within target while maintaining aspect ratio
-            composite.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
+    def draw_marks(self, img: Image.Image, elements: list[dict]):
+        draw = ImageDraw.Draw(img)
+        for el in elements:
+            x, y, w, h = el["box"]
+            draw.rectangle((x, y, x + w, y + h), outline=(230, 30, 140, 255), width=2)
+            label = str(el["id"])
+            lw, lh = 7 * len(label) + 4, 13
+            lx, ly = max(0, x), (y - lh if y >= lh else max(0, y))
+            draw.rectangle((lx, ly, lx + lw, ly + lh), fill=(230, 30, 140, 230))
+            draw.text((lx + 2, ly + 1), label, fill=(255, 255, 255, 255))
 
-            output_buffer = io.BytesIO()
-            composite.save(output_buffer, format="PNG")
-            return output_buffer.getvalue()
-
-    def get_screenshot_ratio(self,orig_size:Coordinate):
+    def get_screenshot_ratio(self,orig_size:Coordinate,target:tuple[int,int]=(1280,800),upscale:bool=True):
+        """Fit orig_size into target keeping the aspect ratio; without a resolution policy small
+        viewports are still stretched up to 1280x800, as they always were."""
+        target_width, target_height = target
         orig_ratio = orig_size.x/orig_size.y
-        if orig_ratio > 1280/800:
-            new_width = 1280
-            new_height = floor(1280/orig_ratio)
+        if not upscale and orig_size.x <= target_width and orig_size.y <= target_height:
+            new_width, new_height = orig_size.x, orig_size.y
+        elif orig_ratio > target_width/target_height:
+            new_width = target_width
+            new_height = floor(target_width/orig_ratio)
         else:
-            new_height = 800
-            new_width = floor(800*orig_ratio)                    
+            new_height = target_height
+            new_width = floor(target_height*orig_ratio)
         width_ratio = orig_size.x/new_width
         height_ratio = orig_size.y/new_height
         return ScalingRatio(
@@ -109,6 +393,58 @@ class AnthropicPlanner(ActionPlanner):
             new_size = Coordinate(new_width,new_height)
         )
         
+    def scaling_for(self, state: BrowserState) -> ScalingRatio:
+        """Scaling the state's screenshot was (or will be) sent at; the fixed 1280x800 fit if unknown."""
+        entry = self._step_scaling.get(id(state.screenshot))
+        if entry is not None and entry[0] is state.screenshot:
+            return entry[1]
+        return self.get_screenshot_ratio(Coordinate(x=state.width, y=state.height))
+
+    def set_scaling(self, state: BrowserState, scaling: ScalingRatio):
+        if state.screenshot:
+            self._step_scaling[id(state.screenshot)] = (state.screenshot, scaling)
+
+    def last_click_missed(self, current_state: BrowserState, session_history) -> bool:
+        if not session_history:
+            return False
+        last = session_history[-1]
+        kind = _kind(last.action.action)
+        if kind not in _CLICKS and kind != _kind(BrowserActionType.CLICK_ELEMENT):
+            return False
+        if last.state.dom_signature != current_state.dom_signature:
+            return False
+        distance = hash_distance(frame_hash(last.state.screenshot), frame_hash(current_state.screenshot))
+        return distance <= self.options.unchanged_hash_threshold
+
+    def text_heavy_arrival(self, current_state: BrowserState, session_history) -> bool:
+        """Just navigated (first step or new URL) to a page with a lot of text."""
+        if session_history and self.active_url(session_history[-1].state) == self.active_url(current_state):
+            return False
+        try:
+            chars = int((current_state.dom_signature or "").rsplit("|", 1)[-1])
+        except ValueError:
+            return False
+        return chars >= self.options.resolution_policy.text_page_chars
+
+    def choose_resolution(self, current_state: BrowserState, session_history) -> ScalingRatio:
+        """Screenshot size for this step from the image-token budget and what just happened."""
+        policy = self.options.resolution_policy
+        orig = Coordinate(x=current_state.width, y=current_state.height)
+        if policy is None:
+            return self.get_screenshot_ratio(orig)
+        if policy.full_after_miss and self.last_click_missed(current_state, session_history):
+            print("[resolution] last click had no effect, sending full size")
+            return self.get_screenshot_ratio(orig, policy.max_size, upscale=False)
+        fit = self.get_screenshot_ratio(orig, policy.max_size, upscale=False).new_size
+        scale = min(1.0, sqrt(policy.image_token_budget * 750 / (fit.x * fit.y)))
+        if self.text_heavy_arrival(current_state, session_history):
+            scale *= policy.text_page_scale
+        target = (
+            max(policy.min_size[0], floor(policy.max_size[0] * scale)),
+            max(policy.min_size[1], floor(policy.max_size[1] * scale)),
+        )
+        return self.get_screenshot_ratio(orig, target, upscale=False)
+
     def browser_to_llm_coordinate(self,input_coord:Coordinate,scaling_ratio:ScalingRatio):
         return Coordinate(
             x=min(max(floor(input_coord.x/scaling_ratio.ratio_x),1),scaling_ratio.new_size.x),
@@ -136,10 +472,13 @@ class AnthropicPlanner(ActionPlanner):
         text_message = ""
         msg_content:list[Union[BetaTextBlockParam,BetaImageBlockParam]]=[]
         if msgOptions.mouse_position:
-            screenshot_dim = Coordinate(x=browserstate.width,y=browserstate.height)
-            scaling_ratio = self.get_screenshot_ratio(screenshot_dim)
+            scaling_ratio = self.scaling_for(browserstate)
             mouse_pos = self.browser_to_llm_coordinate(browserstate.mouse,scaling_ratio)
             text_message += f"mouse position:({mouse_pos.x},{mouse_pos.y})\n"
+            if self.options.resolution_policy:
+                # the size changes between steps; coordinates always refer to the current image
+                size = scaling_ratio.new_size
+                text_message += f"screenshot size:{size.x}x{size.y} (give coordinates in this image's pixels)\n"
         if msgOptions.tabs:
             tabs_as_dicts=[]
             for tab in browserstate.tabs:
@@ -151,6 +490,34 @@ class AnthropicPlanner(ActionPlanner):
                 }
                 tabs_as_dicts.append(tab_dict)
             text_message += f"\n\nOpen Browser tabs:{json.dumps(tabs_as_dicts)}\n\n"
+        if msgOptions.screenshot and self.options.set_of_marks and browserstate.elements:
+            marks = "\n".join(
+                f"[{el['id']}] {el['role']} {json.dumps(el['name'], ensure_ascii=False)}"
+                for el in browserstate.elements
+            )
+            text_message += f"\nMarked elements:\n{marks}\n"
+        if msgOptions.dom_outline and browserstate.dom_outline:
+            text_message += "\n" + self.format_dom_outline(browserstate) + "\n"
+        if msgOptions.crop_box:
+            left, top, right, bottom = msgOptions.crop_box
+            text_message += (
+                f"\nOnly the changed region of the screen is attached: ({left},{top}) to ({right},{bottom}) "
+                "in screenshot coordinates. Everything outside it is unchanged from the last full screenshot.\n"
+            )
+        if browserstate.tool_output:
+            # tool results are text, so they stay in the replayed history too
+            text_message += "\n" + self.format_tool_output(browserstate) + "\n"
+        if msgOptions.zoom and browserstate.zoom_region:
+            scaling = self.scaling_for(browserstate)
+            left, top, right, bottom = browserstate.zoom_region
+            tl = self.browser_to_llm_coordinate(Coordinate(max(left, 1), max(top, 1)), scaling)
+            br = self.browser_to_llm_coordinate(Coordinate(max(right, 1), max(bottom, 1)), scaling)
+            text_message += (
+                f"\nThe first image is a native-resolution zoom of ({tl.x},{tl.y}) to ({br.x},{br.y}) "
+                "of the screenshot; the page itself was not touched. Do not use coordinates from the zoomed image.\n"
+            )
+        if msgOptions.screenshot_unchanged:
+            text_message += "\nScreen unchanged since last step; the last screenshot above is still current.\n"
         if not text_message:
             text_message = "Action has been performed"
         msg_content.append(
@@ -160,12 +527,23 @@ class AnthropicPlanner(ActionPlanner):
             }
         )
         
+        if msgOptions.zoom and browserstate.zoom:
+            msg_content.append(
+                {
+                "type":"image",
+                "source":{
+                    "type":"base64",
+                    "media_type":"image/png",
+                    "data":base64.b64encode(browserstate.zoom).decode("ascii")
+                }
+                }
+            )
         if msgOptions.screenshot:
             print("screenshot True,will save screenshot")
             # screenshot_buffer = base64.b64decode(browserstate.screenshot)
             screenshot_buffer = browserstate.screenshot
-            resized = self.screenshot_conversion(screenshot_buffer,browserstate)
-            if self.debug_img_path:
+            resized = msgOptions.screenshot_png or self.screenshot_conversion(screenshot_buffer,browserstate)
+            if self.debug_img_path and not msgOptions.crop_box:
                 with open(self.debug_img_path,'wb') as f:
                     f.write(resized)
             msg_content.append(
@@ -189,10 +567,134 @@ class AnthropicPlanner(ActionPlanner):
             ]                   
         }
         
+    def format_tool_output(self, browserstate: BrowserState) -> str:
+        output = browserstate.tool_output or {}
+        if output.get("tool") == "navigate":
+            return f"navigate to {output.get('url')} failed: {output.get('error')}"
+        if output.get("tool") == "zoom":
+            return f"zoom failed: {output.get('error')}"
+        if output.get("tool") != "find_in_page":
+            return json.dumps(output, ensure_ascii=False)
+        query = json.dumps(output.get("query", ""), ensure_ascii=False)
+        if output.get("error"):
+            return f"find_in_page {query} failed: {output['error']}"
+        count = output.get("count", 0)
+        if not count:
+            return f"find_in_page {query}: no matches on the page."
+        scaling = self.scaling_for(browserstate)
+        lines = [f"find_in_page {query}: {count} match(es); scrolled to match {output.get('scrolled_to')}."]
+        above = below = 0
+        for match in output.get("matches", []):
+            x, y, w, h = match["box"]
+            if y + h <= 0:
+                above += 1
+                continue
+            if y >= browserstate.height:
+                below += 1
+                continue
+            centre = self.browser_to_llm_coordinate(Coordinate(max(x + w // 2, 1), max(y + h // 2, 1)), scaling)
+            lines.append(f"- match {match['index']} at ({centre.x},{centre.y}): {json.dumps(match['snippet'], ensure_ascii=False)}")
+        if above or below:
+            lines.append(f"({above} listed match(es) above and {below} below the visible area)")
+        return "\n".join(lines)
+
+    def format_dom_outline(self, browserstate: BrowserState) -> str:
+        """Viewport outline as compact text; boxes are converted to screenshot coordinates."""
+        outline = browserstate.dom_outline or {}
+        scaling = self.scaling_for(browserstate)
+        lines = [f"Page outline of the visible viewport ({outline.get('title', '')} - {outline.get('url', '')}).",
+                 "Boxes are x,y,width,height in screenshot coordinates; click at the centre of a box."]
+        for item in outline.get("items", []):
+            x, y, w, h = item["box"]
+            tl = self.browser_to_llm_coordinate(Coordinate(max(x, 1), max(y, 1)), scaling)
+            br = self.browser_to_llm_coordinate(Coordinate(max(x + w, 1), max(y + h, 1)), scaling)
+            line = f"- {item['role']} {json.dumps(item['name'], ensure_ascii=False)} [{tl.x},{tl.y},{br.x - tl.x},{br.y - tl.y}]"
+            if "value" in item:
+                line += f" value={json.dumps(item['value'], ensure_ascii=False)}"
+            if "checked" in item:
+                line += " checked" if item["checked"] else " unchecked"
+            if item.get("disabled"):
+                line += " disabled"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def choose_observation(self, current_state: BrowserState, session_history) -> str:
+        """Per-step observation: "screenshot", "text" (outline only) or "both"."""
+        mode = self.options.observation_mode
+        outline = current_state.dom_outline
+        if mode == "screenshot" or not outline:
+            return "screenshot"
+        if mode != "auto":
+            return mode
+        controls = [i for i in outline.get("items", []) if i.get("kind") == "control"]
+        if len(controls) < self.options.auto_min_controls:
+            # canvas/visual pages: the outline says too little
+            return "screenshot"
+        if not session_history:
+            return "both"
+        if self.active_url(session_history[-1].state) != self.active_url(current_state):
+            return "both"
+        if len(session_history) % self.options.auto_image_every == 0:
+            return "both"
+        return "text"
+
     def system_prompt(self, additional_instructions: list[str]):
+        if self.options.prompt_caching:
+            key = tuple(additional_instructions)
+            if key not in self._system_cache:
+                self._system_cache[key] = self._render_system_prompt(
+                    additional_instructions, self._run_started or datetime.now()
+                )
+            return self._system_cache[key]
+        return self._render_system_prompt(additional_instructions, datetime.now())
+
+    def _render_system_prompt(self, additional_instructions: list[str], now: datetime):
         instructions = "\n".join(
             f"* {instruction}" for instruction in additional_instructions
         )
+        if self.options.click_protocol == "coordinate":
+            click_rule = (
+                "To click, call left_click, right_click, double_click or middle_click with the coordinate of the target element. "
+                "Do not move the mouse first; the click happens at the given coordinate in a single step."
+            )
+        else:
+            click_rule = "After moving the mouse to the desired location, always perform a left-click to ensure the action is completed."
+        if self.options.batch_actions:
+            action_rule = (
+                "You may return several tool_use actions in one assistant message when they form a short sequence "
+                "that does not depend on seeing the screen in between (e.g. type a query, then press Enter). "
+                "They run in order and you get one screenshot after the last one; remaining actions are skipped if the page navigates. "
+                "Put stop_browsing or switch_tab only as the last action."
+            )
+        else:
+            action_rule = "Return exactly one tool_use action per assistant message. Do not include multiple actions in a single response"
+        extra_rules = []
+        if self.options.observation_mode != "screenshot":
+            extra_rules.append(
+                "Some steps describe the page with a text outline of the visible viewport instead of, or next to, a screenshot. "
+                "Outline boxes use screenshot coordinates, so you can target an element at the centre of its box."
+            )
+        if self.options.navigate_tool:
+            extra_rules.append(
+                "Although there is no address bar, you can call navigate with a URL. When the goal names a site or "
+                "you know the exact address of the page you need, navigate there directly instead of using a search engine."
+            )
+        if self.options.find_in_page_tool:
+            extra_rules.append(
+                "To look for specific text on a long page, call find_in_page instead of paging through it; "
+                "it scrolls the best match into view. Only scroll through the page when you do not know what text to look for."
+            )
+        if self.options.zoom_tool:
+            extra_rules.append(
+                "If text or details in the screenshot are too small to read, call zoom with the region instead of guessing "
+                "or scrolling; it returns that region at full resolution without touching the page."
+            )
+        if self.options.set_of_marks:
+            extra_rules.append(
+                "Interactive elements are outlined and numbered in the screenshot. Prefer click_element and type_into "
+                "with that number over moving the mouse; numbers change after every action, so always use the latest ones."
+            )
+        extra = "".join(f"* {rule}\n" for rule in extra_rules)
         prompt = f"""
 <SYSTEM_CAPABILITY>
 * You are a computer use tool that is controlling a browser in fullscreen mode to complete a goal for the user. The goal is listed below in <USER_TASK>.
@@ -206,21 +708,45 @@ class AnthropicPlanner(ActionPlanner):
   - "active_tab": A boolean indicating whether this tab is currently active. You will receive a screenshot of the active tab.
   - "new_tab": A boolean indicating whether the tab was opened as a result of the last action.
 * Follow all directions from the <IMPORTANT> section below. 
-* The current date is {datetime.now().isoformat()}.
+* The current date is {now.isoformat()}.
 </SYSTEM_CAPABILITY>
 
 The user will ask you to perform a task and you should use their browser to do so. After each step, analyze the screenshot and carefully evaluate if you have achieved the right outcome. Explicitly show your thinking for EACH function call: "I have evaluated step X..." If not correct, try again. Only when you confirm a step was executed correctly should you move on to the next one. You should always call a tool! Always return a tool call. Remember call the stop_browsing tool when you have achieved the goal of the task. Use keyboard shortcuts to navigate whenever possible.
 
 <IMPORTANT>
-* After moving the mouse to the desired location, always perform a left-click to ensure the action is completed.
+* {click_rule}
 * You will use information provided in user's <USER DATA> to fill out forms on the way to your goal.
-* Return exactly one tool_use action per assistant message. Do not include multiple actions in a single response
+* {action_rule}
 * Ensure that any UI element is completely visible on the screen before attempting to interact with it.
-* {instructions}
+{extra}* {instructions}
 </IMPORTANT>"""
 
         return prompt.strip()
 
+    def browser_hist_step_to_tool(self,step:BrowserStep):
+        """(tool name, input) that replays a past step; non-computer tools keep their own schema."""
+        kind = _kind(step.action.action)
+        if kind == _kind(BrowserActionType.CLICK_ELEMENT):
+            return "click_element", {"element_id": step.action.element_id}
+        if kind == _kind(BrowserActionType.TYPE_INTO):
+            return "type_into", {"element_id": step.action.element_id, "text": step.action.text}
+        if kind == _kind(BrowserActionType.SWITCH_TAB):
+            return "switch_tab", {"tab_id": int(step.action.text)}
+        if kind == _kind(BrowserActionType.FIND_IN_PAGE):
+            return "find_in_page", {"text": step.action.text}
+        if kind == _kind(BrowserActionType.NAVIGATE):
+            return "navigate", {"url": step.action.text}
+        if kind == _kind(BrowserActionType.ZOOM):
+            if not step.action.region:
+                # rejected region; the error went back to the model with the next state
+                return "zoom", {"region": []}
+            scaling = self.scaling_for(step.state)
+            left, top, right, bottom = step.action.region
+            tl = self.browser_to_llm_coordinate(Coordinate(max(left, 1), max(top, 1)), scaling)
+            br = self.browser_to_llm_coordinate(Coordinate(max(right, 1), max(bottom, 1)), scaling)
+            return "zoom", {"region": [tl.x, tl.y, br.x, br.y]}
+        return "computer", self.browser_hist_step_to_action(step)
+
     def browser_hist_step_to_action(self,step:BrowserStep):
         val: dict[str,any] = {}
         if _kind(step.action.action) == _kind(BrowserActionType.SCROLL_DOWN):
@@ -237,15 +763,13 @@ The user will ask you to perform a task and you should use their browser to do s
         if step.action.text:
             val["text"] = step.action.text
         if step.action.coordinate:
-            img_dim = Coordinate(step.state.width,step.state.height)
-            scaling = self.get_screenshot_ratio(img_dim)
+            scaling = self.scaling_for(step.state)
             llm_coordinates = self.browser_to_llm_coordinate(step.action.coordinate,scaling)
             val["coordinate"] = [llm_coordinates.x,llm_coordinates.y]
         return val
      
 
-    def format_final_msg(self,goal,additional_context, current_state, session_history):
-        messages : list[BetaImageBlockParam]=[]
+    def start_conversation(self, goal, additional_context) -> "Conversation":
         tool_id = self.create_tool_id()
         system_prompt= """
             please complete the following task:
@@ -280,50 +804,285 @@ The user will ask you to perform a task and you should use their browser to do s
                 }
             ]
         }
-        
-        messages.extend([msg0,msg1])
-
-        for hist_step in session_history:
-            options = MessageOptions(mouse_position=False, screenshot=False, tabs=False)
-            tool_result_msg = self.format_state_into_msg(tool_id,hist_step.state,options)
-            messages.append(tool_result_msg)
-
-            tool_id = hist_step.action.id or self.create_tool_id()
-            tool_use_list : list[Union[BetaTextBlockParam,BetaToolUseBlockParam]]=[]
-            # tool_use_blk = self.format_action_into_msg(hist_step.action)
-            tool_use_blk = self.browser_hist_step_to_action(hist_step)
-            msg_dict={
-                "type":"tool_use",
-                "id":tool_id,
-                "name":"computer",
-                "input":tool_use_blk
-            }
-            tool_use_list.append(msg_dict)
-            assistant_msg={
-                "role":"assistant",
-                "content":tool_use_list
-            }
-            messages.append(assistant_msg)
+        return Conversation(
+            goal=goal,
+            additional_context=additional_context,
+            messages=[msg0, msg1],
+            last_tool_id=tool_id,
+        )
+
+    def append_step_to_conversation(self, conversation: "Conversation", hist_step: BrowserStep):
+        options = MessageOptions(mouse_position=False, screenshot=False, tabs=False)
+        tool_result_msg = self.format_state_into_msg(conversation.last_tool_id,hist_step.state,options)
+
+        tool_id = hist_step.action.id or self.create_tool_id()
+        tool_use_list : list[Union[BetaTextBlockParam,BetaToolUseBlockParam]]=[]
+        tool_name, tool_use_blk = self.browser_hist_step_to_tool(hist_step)
+        msg_dict={
+            "type":"tool_use",
+            "id":tool_id,
+            "name":tool_name,
+            "input":tool_use_blk
+        }
+        tool_use_list.append(msg_dict)
+        assistant_msg={
+            "role":"assistant",
+            "content":tool_use_list
+        }
+        conversation.append_step(
+            tool_result_msg, assistant_msg, tool_id,
+            summary=self.summarize_step(hist_step),
+            url=self.active_url(hist_step.state),
+        )
+
+    def active_url(self, state: BrowserState) -> str:
+        for tab in state.tabs:
+            if tab.active:
+                return tab.url
+        return ""
+
+    def summarize_step(self, hist_step: BrowserStep) -> str:
+        action = hist_step.action
+        line = _kind(action.action)
+        if action.element_id is not None:
+            line += f" element [{action.element_id}]"
+        if action.coordinate:
+            line += f" at ({action.coordinate.x},{action.coordinate.y})"
+        if action.text:
+            text = action.text if len(action.text) <= 40 else action.text[:37] + "..."
+            line += f" {json.dumps(text)}"
+        url = self.active_url(hist_step.state)
+        if url:
+            line += f" on {url}"
+        return line
+
+    def estimate_tokens(self, messages: list[dict], image_tokens: int) -> int:
+        """Rough size of a request: ~4 chars per text token plus a flat cost per image."""
+        chars = 0
+        images = 0
+        stack = list(messages)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                if item.get("type") == "image":
+                    images += 1
+                    continue
+                stack.extend(item.values())
+            elif isinstance(item, list):
+                stack.extend(item)
+            elif isinstance(item, str):
+                chars += len(item)
+        return chars // 4 + images * image_tokens
+
+    def image_token_estimate(self, current_state: BrowserState) -> int:
+        scaling = self.scaling_for(current_state)
+        return scaling.new_size.x * scaling.new_size.y // 750
+
+    def apply_history_policy(self, messages: list[dict], current_state: BrowserState, overhead_tokens: int):
+        """Fold steps older than keep_last into a text summary when over the token budget."""
+        policy = self.options.history_policy
+        conv = self.conversation
+        if policy.token_budget is None or conv is None or conv.steps <= policy.keep_last:
+            return messages
+        image_tokens = self.image_token_estimate(current_state)
+        if overhead_tokens + self.estimate_tokens(messages, image_tokens) <= policy.token_budget:
+            return messages
+
+        # move the fold boundary in keep_last-sized chunks so the cached prefix survives a few steps
+        chunk = max(1, policy.keep_last)
+        folded = ((conv.steps - policy.keep_last) // chunk) * chunk
+        if folded <= 0:
+            return messages
+        urls = list(dict.fromkeys(u for u in conv.step_urls[:folded] if u))
+        lines = [f"{i + 1}. {line}" for i, line in enumerate(conv.step_summaries[:folded])]
+        if len(lines) > policy.max_summary_lines:
+            skipped = len(lines) - policy.max_summary_lines
+            lines = [f"... {skipped} earlier steps omitted"] + lines[-policy.max_summary_lines:]
+        summary = (
+            f"Summary of the first {folded} steps already taken (screenshots omitted):\n"
+            f"URLs visited: {', '.join(urls) if urls else 'none'}\n"
+            + "\n".join(lines)
+        )
+
+        msg0, msg1 = messages[0], messages[1]
+        head_content = list(msg0["content"]) + [{"type": "text", "text": summary}]
+        pinned = conv.pinned_image()
+        if pinned is not None and conv.pinned_index < conv.step_slice(folded):
+            head_content += [{"type": "text", "text": "Latest screenshot (screen unchanged since):"}, pinned]
+        head = [
+            {**msg0, "content": head_content},
+            msg1,
+        ]
+        kept = messages[conv.step_slice(folded):]
+        # the first kept tool_result answered a folded tool_use; re-point it at the opening screenshot call
+        first = kept[0]
+        opening_id = msg1["content"][-1]["id"]
+        first = {**first, "content": [{**first["content"][0], "tool_use_id": opening_id}] + list(first["content"][1:])}
+        return head + [first] + kept[1:]
+
+    def sync_conversation(self, goal, additional_context, session_history) -> "Conversation":
+        """Bring the run's buffer up to date; only steps not seen before are serialized."""
+        conv = self.conversation
+        if (
+            conv is None
+            or conv.goal != goal
+            or conv.additional_context != additional_context
+            or conv.steps > len(session_history)
+        ):
+            conv = self.start_conversation(goal, additional_context)
+            self.conversation = conv
+        for hist_step in session_history[conv.steps:]:
+            self.append_step_to_conversation(conv, hist_step)
+        return conv
+
+    def base_frame_reachable(self, current_state: BrowserState, session_history) -> bool:
+        """True when the last full image is on the same tab and still visible to the model."""
+        if self._last_sent_hash is None or self._last_image_block is None:
+            return False
+        if self._last_sent_hash[0] != current_state.active_tab:
+            return False
+        # either pinned already or sent on the last step
+        conv = self.conversation
+        pinned = conv is not None and conv.pinned_index is not None
+        return pinned or (bool(session_history) and session_history[-1].state is self._last_image_state)
+
+    def screen_unchanged(self, current_state: BrowserState, session_history, frame_hash: int) -> bool:
+        if not self.base_frame_reachable(current_state, session_history):
+            return False
+        # a resized frame is new information even if the page did not change (e.g. full size after a miss)
+        if self.scaling_for(current_state).new_size != self.scaling_for(self._last_image_state).new_size:
+            return False
+        # the hash is taken before the cursor overlay is drawn and a 10px cursor would not move it anyway;
+        # a pinned image with the pointer somewhere else would break move-then-verify
+        if self.pointer_moved(current_state, self._last_image_state):
+            return False
+        return hash_distance(self._last_sent_hash[1], frame_hash) <= self.options.unchanged_hash_threshold
 
+    def pointer_moved(self, current_state: BrowserState, last_state: BrowserState) -> bool:
+        """True when the cursor drawn on the two frames lands on different screenshot pixels."""
+        now = self.browser_to_llm_coordinate(current_state.mouse, self.scaling_for(current_state))
+        then = self.browser_to_llm_coordinate(last_state.mouse, self.scaling_for(last_state))
+        return now != then
+
+    def marks_stale(self, current_state: BrowserState) -> bool:
+        """True when the marks drawn on the last delivered image no longer match the current ones."""
+        last = self._last_image_state
+        if not self.options.set_of_marks or last is None:
+            return False
+        key = lambda elements: [(el["id"], tuple(el["box"])) for el in elements or []]
+        return key(current_state.elements) != key(last.elements)
+
+    def changed_region(self, frame: Image.Image) -> Optional[tuple[int, int, int, int]]:
+        """Padded bounding box of pixels that differ from the last full frame, or None if nothing changed."""
+        base = self._last_sent_frame
+        if base is None or base.size != frame.size:
+            return (0, 0, frame.width, frame.height)
+        diff = ImageChops.difference(base.convert("RGB"), frame.convert("RGB")).convert("L")
+        tol = self.options.crop_pixel_tolerance
+        bbox = diff.point(lambda v: 255 if v > tol else 0).getbbox()
+        if bbox is None:
+            return None
+        pad = self.options.crop_padding
+        left, top, right, bottom = bbox
+        return (
+            max(0, left - pad),
+            max(0, top - pad),
+            min(frame.width, right + pad),
+            min(frame.height, bottom + pad),
+        )
+
+    def observe_screenshot(self, current_state: BrowserState, session_history):
+        """Decide how the current frame is sent: ("full"|"unchanged"|"crop", png, crop_box, hash, frame)."""
+        opts = self.options
+        current_hash = frame_hash(current_state.screenshot)
+        if opts.skip_unchanged_screenshots and self.screen_unchanged(current_state, session_history, current_hash):
+            return "unchanged", None, None, current_hash, None
+        if not opts.crop_changed_regions:
+            return "full", None, None, current_hash, None
+
+        frame = self.render_screenshot(current_state.screenshot, current_state)
+        url = self.active_url(current_state)
+        if url != self._last_sent_url or not self.base_frame_reachable(current_state, session_history):
+            return "full", self.encode_png(frame), None, current_hash, frame
+        box = self.changed_region(frame)
+        if box is None:
+            return "unchanged", None, None, current_hash, None
+        left, top, right, bottom = box
+        area = (right - left) * (bottom - top)
+        if area > opts.crop_max_area_ratio * frame.width * frame.height:
+            return "full", self.encode_png(frame), None, current_hash, frame
+        return "crop", self.encode_png(frame.crop(box)), box, current_hash, None
+
+    def encode_png(self, img: Image.Image) -> bytes:
+        output_buffer = io.BytesIO()
+        img.save(output_buffer, format="PNG")
+        return output_buffer.getvalue()
+
+    def format_final_msg(self,goal,additional_context, current_state, session_history):
+        mode, png, box, frame_hash = "full", None, None, None
+        frame = None
+        self.set_scaling(current_state, self.choose_resolution(current_state, session_history))
+        observation = self.choose_observation(current_state, session_history)
+        if observation == "text":
+            mode = "text"
+        elif self.options.skip_unchanged_screenshots or self.options.crop_changed_regions:
+            mode, png, box, frame_hash, frame = self.observe_screenshot(current_state, session_history)
+        if mode in ("unchanged", "crop") and self.marks_stale(current_state):
+            # the reused frame carries the old mark numbers; resend it with the current ones
+            mode, box = "full", None
+            if self.options.crop_changed_regions:
+                frame = self.render_screenshot(current_state.screenshot, current_state)
+                png = self.encode_png(frame)
+            else:
+                png = None
+        conv = self.sync_conversation(goal, additional_context, session_history)
+        if mode in ("unchanged", "crop"):
+            # keep the last full frame visible for the model to read the note/crop against
+            if conv.pinned_index is None:
+                conv.pin_image(conv.step_slice(conv.steps - 1), self._last_image_block)
+        else:
+            conv.unpin_image()
         current_state_message = self.format_state_into_msg(
-            tool_id,
+            conv.last_tool_id,
             current_state,
-            MessageOptions(mouse_position=True, screenshot=True, tabs=True),
+            MessageOptions(
+                mouse_position=True,
+                screenshot=mode not in ("unchanged", "text"),
+                tabs=True,
+                screenshot_unchanged=mode == "unchanged",
+                screenshot_png=png,
+                crop_box=box,
+                dom_outline=observation != "screenshot",
+                zoom=current_state.zoom is not None,
+            ),
         )
-        messages.append(current_state_message)
-        # print(messages)
-        return messages
+        if frame_hash is not None and mode == "full":
+            image_block = current_state_message["content"][0]["content"][-1]
+            self._pending_image = (
+                (current_state.active_tab, frame_hash), current_state, image_block,
+                frame, self.active_url(current_state),
+            )
+        else:
+            self._pending_image = None
+        return conv.messages + [current_state_message]
 
+    def commit_sent_image(self):
+        """Called once a request went through, so unchanged-frame detection only trusts delivered images."""
+        if self._pending_image is not None:
+            (
+                self._last_sent_hash, self._last_image_state, self._last_image_block,
+                self._last_sent_frame, self._last_sent_url,
+            ) = self._pending_image
+            self._pending_image = None
 
-    def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
-        system_prompt = self.system_prompt(additional_instructions)
-        messages = self.format_final_msg(goal,additional_context, current_state, session_history)
-        scaling = self.get_screenshot_ratio(
-            Coordinate(x=current_state.width, y=current_state.height)
-        )
+
+    def build_tools(self, current_state: BrowserState) -> list[dict]:
+        key = (current_state.width, current_state.height)
+        if self.options.prompt_caching and key in self._tools_cache:
+            return self._tools_cache[key]
         tools=[
                 {
-                    "type": "computer_20241022",
+                    "type": self.computer_tool_type,
                     "name": "computer",
                     "display_width_px": current_state.width,
                     "display_height_px": current_state.height,
@@ -362,23 +1121,362 @@ The user will ask you to perform a task and you should use their browser to do s
                     },
                 },
             ]
-        response = self.client.beta.messages.create(
+        if self.options.set_of_marks:
+            tools = tools[:-1] + [
+                {
+                    "name": "click_element",
+                    "description": "Click the element with the given number from the marked screenshot.",
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "element_id": {"type": "integer", "description": "Number shown on the element's mark"},
+                        },
+                        "required": ["element_id"],
+                    },
+                },
+                {
+                    "name": "type_into",
+                    "description": "Replace the content of the marked input element with the given text.",
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "element_id": {"type": "integer", "description": "Number shown on the element's mark"},
+                            "text": {"type": "string", "description": "Text to enter"},
+                        },
+                        "required": ["element_id", "text"],
+                    },
+                },
+            ] + tools[-1:]
+        if self.options.zoom_tool:
+            tools = tools[:-1] + [
+                {
+                    "name": "zoom",
+                    "description": (
+                        "Look at a region of the current screenshot at full resolution, e.g. to read small text. "
+                        "Does not interact with the page."
+                    ),
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "region": {
+                                "type": "array",
+                                "items": {"type": "integer"},
+                                "minItems": 4,
+                                "maxItems": 4,
+                                "description": "[left, top, right, bottom] in screenshot coordinates",
+                            },
+                        },
+                        "required": ["region"],
+                    },
+                },
+            ] + tools[-1:]
+        if self.options.find_in_page_tool:
+            tools = tools[:-1] + [
+                {
+                    "name": "find_in_page",
+                    "description": (
+                        "Search the whole page (including embedded frames) for text, case-insensitively, and scroll "
+                        "the best match into view. Returns the number of matches and where the visible ones are."
+                    ),
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "text": {"type": "string", "description": "Text to look for"},
+                        },
+                        "required": ["text"],
+                    },
+                },
+            ] + tools[-1:]
+        if self.options.navigate_tool:
+            tools = tools[:-1] + [
+                {
+                    "name": "navigate",
+                    "description": (
+                        "Open a URL in the active tab, like typing it into the address bar. Use it when the goal names "
+                        "a site or you know the address; some domains may be refused."
+                    ),
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "url": {"type": "string", "description": "Absolute http(s) URL"},
+                        },
+                        "required": ["url"],
+                    },
+                },
+            ] + tools[-1:]
+        if self.options.prompt_caching:
+            self._tools_cache[key] = tools
+        return tools
+
+    def apply_cache_breakpoints(self, system_prompt: str, tools: list[dict], messages: list[dict]):
+        """Mark system, tool schema and replayed history as cacheable prefixes."""
+        cache_control = {"type": "ephemeral"}
+        system = [{"type": "text", "text": system_prompt, "cache_control": cache_control}]
+        tools = tools[:-1] + [{**tools[-1], "cache_control": cache_control}]
+        # last message is the fresh state; everything before it is the reusable prefix
+        if len(messages) >= 2:
+            prefix_end = messages[-2]
+            content = list(prefix_end["content"])
+            content[-1] = {**content[-1], "cache_control": cache_control}
+            messages = messages[:-2] + [{**prefix_end, "content": content}, messages[-1]]
+        return system, tools, messages
+
+    def record_usage(self, usage):
+        print(
+            f"Token usage - Input: {usage.input_tokens}, Output: {usage.output_tokens}"
+        )
+        self.input_token_usage += usage.input_tokens
+        self.output_token_usage += usage.output_tokens
+        self.cache_read_token_usage += getattr(usage, "cache_read_input_tokens", None) or 0
+        self.cache_write_token_usage += getattr(usage, "cache_creation_input_tokens", None) or 0
+        print(
+            f"Cumulative token usage - Input: {self.input_token_usage}, Output: {self.output_token_usage}, Total: {self.input_token_usage + self.output_token_usage}"
+        )
+        if self.options.prompt_caching:
+            print(
+                f"Cumulative cache usage - Read: {self.cache_read_token_usage}, Write: {self.cache_write_token_usage}"
+            )
+
+    def _consume_stream_event(self, event, blocks: dict[int, dict], usage: SimpleNamespace) -> Optional[int]:
+        """Fold one raw stream event into blocks/usage; returns the index of a tool_use block that just closed."""
+        etype = getattr(event, "type", None)
+        if etype == "message_start":
+            u = event.message.usage
+            usage.input_tokens = u.input_tokens
+            usage.cache_read_input_tokens = getattr(u, "cache_read_input_tokens", None) or 0
+            usage.cache_creation_input_tokens = getattr(u, "cache_creation_input_tokens", None) or 0
+        elif etype == "content_block_start":
+            cb = event.content_block
+            blocks[event.index] = {
+                "type": cb.type,
+                "id": getattr(cb, "id", None),
+                "name": getattr(cb, "name", None),
+                "text": getattr(cb, "text", "") or "",
+                "json": "",
+            }
+        elif etype == "content_block_delta":
+            blk = blocks.get(event.index)
+            delta = event.delta
+            if blk is None:
+                return None
+            if delta.type == "text_delta":
+                blk["text"] += delta.text
+            elif delta.type == "input_json_delta":
+                blk["json"] += delta.partial_json
+        elif etype == "content_block_stop":
+            blk = blocks.get(event.index)
+            if blk and blk["type"] == "tool_use":
+                return event.index
+        elif etype == "message_delta":
+            usage.output_tokens = event.usage.output_tokens
+        return None
+
+    def _blocks_to_response(self, blocks: dict[int, dict], usage=None):
+        content = []
+        for _, blk in sorted(blocks.items()):
+            if blk["type"] == "text":
+                content.append(SimpleNamespace(type="text", text=blk["text"]))
+            elif blk["type"] == "tool_use":
+                content.append(SimpleNamespace(
+                    type="tool_use", id=blk["id"], name=blk["name"],
+                    input=json.loads(blk["json"]) if blk["json"] else {},
+                ))
+        return SimpleNamespace(content=content, usage=usage)
+
+    async def stream_until_action(self, request: dict, early: bool = True):
+        """Stream the response and return as soon as the first tool_use block closes.
+
+        Whatever the model emits after that (trailing text, usage) is drained in the
+        background and only logged. The early response's usage is then a future that
+        resolves with the final usage, so the scheduler can settle its reservation.
+        """
+        manager = self.request_client().beta.messages.stream(**request)
+        stream = await manager.__aenter__()
+        events = stream.__aiter__()
+        blocks: dict[int, dict] = {}
+        usage = SimpleNamespace(input_tokens=0, output_tokens=0, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+        try:
+            while True:
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+                if self._consume_stream_event(event, blocks, usage) is not None and early:
+                    final_usage = asyncio.get_running_loop().create_future()
+                    response = self._blocks_to_response(blocks, final_usage)
+                    task = asyncio.create_task(self._drain_stream(manager, events, blocks, usage, final_usage))
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
+                    # a drain cancelled before it ran never reaches its finally; do not leave the scheduler waiting
+                    task.add_done_callback(lambda _: final_usage.done() or final_usage.set_result(None))
+                    return response
+        except BaseException:
+            await manager.__aexit__(None, None, None)
+            raise
+        await manager.__aexit__(None, None, None)
+        self.record_usage(usage)
+        return self._blocks_to_response(blocks, usage)
+
+    async def _drain_stream(self, manager, events, blocks: dict[int, dict], usage: SimpleNamespace,
+                            final_usage: asyncio.Future):
+        complete = False
+        try:
+            async for event in events:
+                self._consume_stream_event(event, blocks, usage)
+            complete = True
+        except Exception as e:
+            print("stream drain failed:", repr(e))
+        finally:
+            if not final_usage.done():
+                # an incomplete count would under-charge the buckets; keep the reservation instead
+                final_usage.set_result(usage if complete else None)
+            try:
+                await manager.__aexit__(None, None, None)
+            except Exception as e:
+                # cancelled mid-iteration: the response generator cannot be closed from here
+                print("stream close failed:", repr(e))
+        reasoning = " ".join(b["text"] for _, b in sorted(blocks.items()) if b["type"] == "text")
+        print("streamed reasoning:", reasoning)
+        self.record_usage(usage)
+
+    @property
+    def scheduler(self) -> Optional[PlannerScheduler]:
+        return self.options.scheduler or get_default_scheduler()
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        if self.options.shared_client:
+            return get_client_registry().get(os.getenv('apikey'), self.options.base_url)
+        if self._own_client is None:
+            self._own_client = AsyncAnthropic(api_key=os.getenv('apikey'), base_url=self.options.base_url)
+        return self._own_client
+
+    def request_client(self):
+        # with a scheduler, PlannerScheduler.submit does the retrying (429s process-wide, 5xx/overloaded/
+        # connection errors per call); the SDK must not retry on its own as well
+        if self.scheduler is None:
+            return self.client
+        if self.options.shared_client:
+            return get_client_registry().get(os.getenv('apikey'), self.options.base_url, max_retries=0)
+        if self._no_retry_client is None:
+            self._no_retry_client = self.client.with_options(max_retries=0)
+        return self._no_retry_client
+
+    async def send_request(self, request: dict, estimate: Optional[tuple[int, int]] = None):
+        """estimate: (input, output) tokens reserved with the scheduler, reused for a hedged duplicate."""
+        if self.options.streaming:
+            return await self.stream_until_action(request, early=not self.options.batch_actions)
+        response = await self.create_message(request, estimate)
+        self.record_usage(response.usage)
+        return response
+
+    def hedge_delay(self) -> Optional[float]:
+        policy = self.options.hedge_policy
+        if policy is None or len(self.latency.samples) < policy.min_samples:
+            return None
+        return max(policy.min_delay_s, self.latency.percentile(policy.percentile))
+
+    async def send_hedge(self, request: dict, estimate: Optional[tuple[int, int]], progress: SimpleNamespace):
+        """The duplicate request; it waits for its own turn in the scheduler like any other call.
+
+        progress.sent is set once the request actually went out (a hedge cancelled while
+        still queued costs nothing).
+        """
+        scheduler = self.scheduler
+
+        async def call():
+            progress.sent = True
+            return await self.request_client().beta.messages.create(**request)
+
+        if scheduler is None or estimate is None:
+            return await call()
+        return await scheduler.submit(call, estimate[0], estimate[1], priority=self.options.priority)
+
+    async def create_message(self, request: dict, estimate: Optional[tuple[int, int]] = None):
+        """messages.create with optional hedging: a slow call gets one duplicate, first answer wins."""
+        started = time.perf_counter()
+        delay = self.hedge_delay()
+        primary = asyncio.create_task(self.request_client().beta.messages.create(**request))
+        if delay is None:
+            response = await primary
+            self.latency.record(time.perf_counter() - started)
+            return response
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            response = primary.result()
+            self.latency.record(time.perf_counter() - started)
+            return response
+
+        logger.info("request slower than %.2fs, firing hedge", delay)
+        self.hedged_requests += 1
+        progress = SimpleNamespace(sent=False)
+        hedge = asyncio.create_task(self.send_hedge(request, estimate, progress))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    response = task.result()
+                    if task is hedge:
+                        self.hedge_wins += 1
+                    loser = hedge if task is primary else primary
+                    if (loser is primary or progress.sent) and not (loser.done() and loser.exception()):
+                        # the losing copy carried the same prompt and is billed for it
+                        self.hedged_input_token_usage += response.usage.input_tokens
+                        self.input_token_usage += response.usage.input_tokens
+                    self.latency.record(time.perf_counter() - started)
+                    return response
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        # a different history list means a different run, even if it does not start empty (macro replay)
+        if not session_history or self._run_started is None or session_history is not self._run_history:
+            self.start_run()
+            self._run_history = session_history
+        system_prompt = self.system_prompt(additional_instructions)
+        # PIL resize + PNG encode is CPU bound; keep it off the Playwright loop
+        messages = await asyncio.to_thread(
+            self.format_final_msg, goal, additional_context, current_state, session_history
+        )
+        scaling = self.scaling_for(current_state)
+        tools = self.build_tools(current_state)
+        messages = self.apply_history_policy(
+            messages, current_state, (len(system_prompt) + len(json.dumps(tools))) // 4
+        )
+        system: Union[str, list[BetaTextBlockParam]] = system_prompt
+        if self.options.prompt_caching:
+            system, tools, messages = self.apply_cache_breakpoints(system_prompt, tools, messages)
+        request = dict(
             model=self.model,
-            system = system_prompt,
+            system = system,
             max_tokens=self.max_tokens,
             messages=messages,
             tools=tools,
             betas=self.beta_flag,
             service_tier="auto"         
         )
-        print(
-            f"Token usage - Input: {response.usage.input_tokens}, Output: {response.usage.output_tokens}"
-        )
-        self.input_token_usage += response.usage.input_tokens
-        self.output_token_usage += response.usage.output_tokens
-        print(
-            f"Cumulative token usage - Input: {self.input_token_usage}, Output: {self.output_token_usage}, Total: {self.input_token_usage + self.output_token_usage}"
-        )
+        scheduler = self.scheduler
+        if scheduler is None:
+            response = await self.send_request(request)
+        else:
+            overhead = (len(system_prompt) + len(json.dumps(tools))) // 4
+            est_input = overhead + self.estimate_tokens(messages, self.image_token_estimate(current_state))
+            estimate = (est_input, min(self.max_tokens, self.expected_output_tokens))
+            response = await scheduler.submit(
+                lambda: self.send_request(request, estimate),
+                est_input,
+                min(self.max_tokens, self.expected_output_tokens),
+                priority=self.options.priority,
+            )
+        self.commit_sent_image()
 
         action = self.parse_action(response, scaling, current_state)
         
@@ -413,8 +1511,11 @@ The user will ask you to perform a task and you should use their browser to do s
                 id=self.create_tool_id(),
             )
 
-        # for step in tool_uses:
-        last_step = tool_uses[-1]
+        if self.options.batch_actions:
+            return [self.parse_tool_use(blk, reasoning, scaling, current_state) for blk in tool_uses]
+        return self.parse_tool_use(tool_uses[-1], reasoning, scaling, current_state)
+
+    def parse_tool_use(self,last_step,reasoning:str,scaling:ScalingRatio,current_state:BrowserState):
         print(last_step)
         print(last_step.name)
         if last_step.type != "tool_use":
@@ -443,6 +1544,91 @@ The user will ask you to perform a task and you should use their browser to do s
                 id=last_step.id,
             )
 
+        if last_step.name in ("click_element", "type_into"):
+            input_data = cast(dict, last_step.input)
+            is_type = last_step.name == "type_into"
+            if "element_id" not in input_data or (is_type and input_data.get("text") is None):
+                return BrowserAction(
+                    action=BrowserActionType.FAILURE,
+                    reasoning=reasoning,
+                    text=f"Missing arguments for {last_step.name}",
+                    coordinate=None,
+                    id=last_step.id,
+                )
+            return BrowserAction(
+                action=BrowserActionType.TYPE_INTO if is_type else BrowserActionType.CLICK_ELEMENT,
+                reasoning=reasoning,
+                text=str(input_data["text"]) if is_type else None,
+                coordinate=None,
+                id=last_step.id,
+                element_id=int(input_data["element_id"]),
+            )
+
+        if last_step.name == "navigate":
+            url = cast(dict, last_step.input).get("url")
+            if not url:
+                return BrowserAction(
+                    action=BrowserActionType.FAILURE,
+                    reasoning=reasoning,
+                    text="navigate needs a url",
+                    coordinate=None,
+                    id=last_step.id,
+                )
+            return BrowserAction(
+                action=BrowserActionType.NAVIGATE,
+                reasoning=reasoning,
+                text=str(url),
+                coordinate=None,
+                id=last_step.id,
+            )
+
+        if last_step.name == "find_in_page":
+            text = cast(dict, last_step.input).get("text")
+            if not text:
+                return BrowserAction(
+                    action=BrowserActionType.FAILURE,
+                    reasoning=reasoning,
+                    text="find_in_page needs the text to look for",
+                    coordinate=None,
+                    id=last_step.id,
+                )
+            return BrowserAction(
+                action=BrowserActionType.FIND_IN_PAGE,
+                reasoning=reasoning,
+                text=str(text),
+                coordinate=None,
+                id=last_step.id,
+            )
+
+        if last_step.name == "zoom":
+            region = cast(dict, last_step.input).get("region")
+            # a bad region is answered with a tool error (action.text) so the model can retry
+            error, browser_region = None, None
+            try:
+                left, top, right, bottom = (int(v) for v in region)
+            except (TypeError, ValueError):
+                error = f"zoom needs a [left, top, right, bottom] region of numbers, got {json.dumps(region)}"
+            else:
+                left, right = sorted((left, right))
+                top, bottom = sorted((top, bottom))
+                # llm_to_browser_coordinate clamps to the viewport
+                tl = self.llm_to_browser_coordinate(Coordinate(left, top), scaling)
+                br = self.llm_to_browser_coordinate(Coordinate(right, bottom), scaling)
+                if br.x - tl.x < 2 or br.y - tl.y < 2:
+                    size = scaling.new_size
+                    error = (f"zoom region {json.dumps(region)} has no area inside the {size.x}x{size.y} screenshot; "
+                             "give right > left and bottom > top within the image")
+                else:
+                    browser_region = (tl.x, tl.y, br.x, br.y)
+            return BrowserAction(
+                action=BrowserActionType.ZOOM,
+                reasoning=reasoning,
+                text=error,
+                coordinate=None,
+                id=last_step.id,
+                region=browser_region,
+            )
+
         if last_step.name == "switch_tab":
             input_data = cast(dict, last_step.input)
             if "tab_id" not in input_data:
@@ -611,9 +1797,25 @@ The user will ask you to perform a task and you should use their browser to do s
                 "cursor_position": BrowserActionType.CURSOR_POSITION,
             }[action]
 
+            click_coordinates = None
+            if coordinate and action.endswith("_click"):
+                # single-step click: the target travels with the click instead of a prior mouse_move
+                click_coordinates = self.llm_to_browser_coordinate(
+                    Coordinate(x=coordinate[0], y=coordinate[1]), scaling
+                )
+
             return BrowserAction(
                 action=action_type,
                 reasoning=reasoning,
+                coordinate=click_coordinates,
+                text=None,
+                id=last_step.id,
+            )
+        elif action == "scroll" and input_data.get("scroll_direction") in ("down", "up"):
+            # computer_20250124 scrolls with its own action; the page scrolls a screen either way
+            return BrowserAction(
+                action=BrowserActionType.SCROLL_DOWN if input_data["scroll_direction"] == "down" else BrowserActionType.SCROLL_UP,
+                reasoning=reasoning,
                 coordinate=None,
                 text=None,
                 id=last_step.id,
@@ -1,16 +1,18 @@
 import asyncio
+import fnmatch
 import json
+import random
 import time
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 from typing import Any, Optional, Union, Dict, Callable
 from urllib.parse import urlparse
 
-from utils import keys_mapping,read_with_retry,screenshot_with_retry,_safe_eval
+from utils import keys_mapping,read_with_retry,screenshot_with_retry,_safe_eval,dom_outline,mark_elements,resolve_mark,dom_sig,crop_screenshot,find_in_page,first_page_match
 from utils import (
     safe_click_at, safe_key, safe_scroll,
-    switch_to_page, safe_go_back, safe_go_forward
+    switch_to_page, safe_go_back, safe_go_forward, safe_goto
 )
 from playwright.async_api import Page, BrowserContext, Keyboard, Mouse, Error as PWError
 from human_pause import PAUSE_ON_CHALLENGE, pause_if_captcha_then_screenshot,detect_captcha_quick
@@ -164,6 +166,17 @@ class BrowserState():
     tabs: list[BrowserTab]
     active_tab: str
     mouse: Coordinate
+    # viewport outline from utils.dom_outline (only when BrowserAgentOptions.collect_dom_outline)
+    dom_outline: Optional[dict] = None
+    # numbered interactive elements from utils.mark_elements (only when BrowserAgentOptions.mark_elements)
+    elements: Optional[list[dict]] = None
+    # utils.dom_sig: url | title | text length, cheap "did the page change" key
+    dom_signature: Optional[str] = None
+    # native-resolution crop answering a zoom action; the rest of the state is the zoomed-in frame
+    zoom: Optional[bytes] = None
+    zoom_region: Optional[tuple[int, int, int, int]] = None
+    # result of the previous action for tools that answer with data (e.g. find_in_page)
+    tool_output: Optional[dict] = None
 
 @dataclass
 class BrowserActionType(str,Enum):
@@ -182,6 +195,19 @@ class BrowserActionType(str,Enum):
     SWITCH_TAB = "switch_tab"
     SCROLL_DOWN = "scroll_down"
     SCROLL_UP = "scroll_up"
+    CLICK_ELEMENT = "click_element"
+    TYPE_INTO = "type_into"
+    ZOOM = "zoom"
+    FIND_IN_PAGE = "find_in_page"
+    NAVIGATE = "navigate"
+
+# click action kind -> (mouse button, click count)
+_CLICKS = {
+    "left_click": ("left", 1),
+    "right_click": ("right", 1),
+    "middle_click": ("middle", 1),
+    "double_click": ("left", 2),
+}
 
 @dataclass(frozen=True)
 class BrowserAction():
@@ -190,12 +216,64 @@ class BrowserAction():
     text: Optional[str]
     reasoning: str
     id: str
+    # set-of-marks id for click_element / type_into
+    element_id: Optional[int] = None
+    # (left, top, right, bottom) in browser pixels for zoom
+    region: Optional[tuple[int, int, int, int]] = None
+
+def action_to_dict(action: BrowserAction) -> dict:
+    """JSON-friendly form of a BrowserAction (for cassettes, caches, macros)."""
+    return {
+        "action": _kind(action.action),
+        "coordinate": [action.coordinate.x, action.coordinate.y] if action.coordinate else None,
+        "text": action.text,
+        "reasoning": action.reasoning,
+        "id": action.id,
+        "element_id": action.element_id,
+        "region": list(action.region) if action.region else None,
+    }
+
+_TOOL_ID_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+def new_tool_id() -> str:
+    """tool_use id for actions a planner made up locally, so replayed history looks like model output."""
+    return "toolu_" + "".join(random.choices(_TOOL_ID_CHARS, k=22))
+
+def action_from_dict(data: dict) -> BrowserAction:
+    coord = data.get("coordinate")
+    region = data.get("region")
+    return BrowserAction(
+        action=BrowserActionType(data["action"]),
+        coordinate=Coordinate(coord[0], coord[1]) if coord else None,
+        text=data.get("text"),
+        reasoning=data.get("reasoning", ""),
+        id=data.get("id", ""),
+        element_id=data.get("element_id"),
+        region=tuple(region) if region else None,
+    )
 
 @dataclass(frozen=True)
 class BrowserStep():
     state: BrowserState
     action: BrowserAction
 
+@dataclass(frozen=True)
+class SuccessPredicate():
+    """Goal check run locally after each step; every field that is set must hold."""
+    # glob over the full URL of the active tab, e.g. "*.wikipedia.org/wiki/React*"
+    url: Optional[str] = None
+    # CSS selector that must match an element
+    selector: Optional[str] = None
+    # text the page body must contain (case-insensitive)
+    text: Optional[str] = None
+    name: Optional[str] = None
+
+    def describe(self) -> str:
+        if self.name:
+            return self.name
+        parts = [f"{k}={v!r}" for k, v in (("url", self.url), ("selector", self.selector), ("text", self.text)) if v]
+        return ", ".join(parts) or "empty predicate"
+
 @dataclass(frozen=True)
 class BrowserAgentOptions():
     additional_context:Optional[Union[str,dict[str,Any]]] = None
@@ -203,12 +281,23 @@ class BrowserAgentOptions():
     wait_after_step_ms:Optional[int] = None
     pause_after_each_action:Optional[bool] = None
     max_steps:Optional[int] = None
+    collect_dom_outline:Optional[bool] = None
+    mark_elements:Optional[bool] = None
+    # navigate(url) tool: domains match themselves and their subdomains; deny wins over allow,
+    # and an empty/None allow list allows every domain that is not denied
+    navigate_allow_domains:Optional[list[str]] = None
+    navigate_deny_domains:Optional[list[str]] = None
+    # page.goto wait_until: "domcontentloaded" | "load" | "networkidle" | "commit"
+    navigate_wait_until:Optional[str] = None
+    # any matching predicate ends the run as SUCCESS without asking the planner to confirm
+    success_predicates:Optional[list[SuccessPredicate]] = None
 
 
 class ActionPlanner(ABC):
-    
+    """Planners are awaited on the agent's event loop; never block inside plan_action."""
+
     @abstractmethod
-    def plan_action(
+    async def plan_action(
         self,
         goal: str,
         additional_context: str,
@@ -218,6 +307,14 @@ class ActionPlanner(ABC):
     ):
         pass
 
+    def record_outcome(self, step: BrowserStep, ok: bool) -> None:
+        """Called by BrowserAgent after each executed action; ok is False when it raised."""
+        pass
+
+    def attach(self, agent: "BrowserAgent") -> None:
+        """Called once by BrowserAgent.__init__; planners that need the live page keep the agent."""
+        pass
+
 
 class BrowserAgent:
     def __init__(
@@ -233,6 +330,7 @@ class BrowserAgent:
         self.page = page
         self.context = context
         self.planner = action_planner
+        self.planner.attach(self)
         self.goal = goal
         self.additional_context = "None"
         self.additional_instructions = []
@@ -249,6 +347,19 @@ class BrowserAgent:
         self._cap_flag = False
         self._last_side_effect = ""
         self._page_changing_actions = {"left_click", "right_click", "double_click", "type", "key"}
+        self.collect_dom_outline = False
+        self.mark_elements = False
+        self.navigate_allow_domains: list[str] = []
+        self.navigate_deny_domains: list[str] = []
+        self.navigate_wait_until = "domcontentloaded"
+        # zoom answers reuse the last frame instead of capturing a new one and do not count as steps
+        self._zoom_state: Optional[BrowserState] = None
+        self.zoom_steps = 0
+        # handed to the planner with the next state
+        self._tool_output: Optional[dict] = None
+        self.success_predicates: list[SuccessPredicate] = []
+        # set when a success predicate (not the planner) ended the run
+        self.success_reason: Optional[str] = None
         # self._wire_challenge_network_hooks()
 
         if options:
@@ -266,7 +377,75 @@ class BrowserAgent:
                 self.pause_after_each_action = options.pause_after_each_action
             if options.max_steps:
                 self.max_steps = options.max_steps
+            if options.collect_dom_outline:
+                self.collect_dom_outline = options.collect_dom_outline
+            if options.mark_elements:
+                self.mark_elements = options.mark_elements
+            if options.navigate_allow_domains:
+                self.navigate_allow_domains = [d.lower().lstrip(".") for d in options.navigate_allow_domains]
+            if options.navigate_deny_domains:
+                self.navigate_deny_domains = [d.lower().lstrip(".") for d in options.navigate_deny_domains]
+            if options.navigate_wait_until:
+                self.navigate_wait_until = options.navigate_wait_until
+            if options.success_predicates:
+                self.success_predicates = list(options.success_predicates)
                 
+    def navigation_blocked(self, url: str) -> Optional[str]:
+        """Reason the navigate tool may not open url, or None when it is allowed."""
+        try:
+            parsed = urlparse(url)
+            host = parsed.hostname
+            parsed.port  # raises on an out-of-range or non-numeric port
+        except ValueError as e:
+            return f"malformed URL ({e})"
+        if parsed.scheme not in ("http", "https") or not host:
+            return "only http(s) URLs can be opened"
+        host = host.lower()
+        matches = lambda domain: host == domain or host.endswith("." + domain)
+        if any(matches(d) for d in self.navigate_deny_domains):
+            return f"{host} is on the deny list"
+        if self.navigate_allow_domains and not any(matches(d) for d in self.navigate_allow_domains):
+            return f"{host} is not on the allow list"
+        return None
+
+    async def check_success(self) -> Optional[SuccessPredicate]:
+        """First success predicate the current page satisfies; URL globs are checked before any page call."""
+        url = self.page.url
+        pending = [p for p in self.success_predicates if not p.url or fnmatch.fnmatchcase(url, p.url)]
+        if not pending:
+            return None
+        url_only = next((p for p in pending if not p.selector and not p.text), None)
+        if url_only is not None:
+            return url_only
+        try:
+            await self.page.wait_for_load_state("domcontentloaded", timeout=3000)
+        except Exception:
+            pass
+        idx = await first_page_match(self.page, [(p.selector, p.text) for p in pending])
+        return pending[idx] if idx >= 0 else None
+
+    async def _leave_if_redirected_off_list(self, url: str, response) -> None:
+        """Redirects are followed by the browser, so each hop and the final URL are checked afterwards."""
+        hops = []
+        request = response.request if response is not None else None
+        while request is not None:
+            hops.append(request.url)
+            request = request.redirected_from
+        landed = self.page.url
+        hops.append(landed)
+        for hop in hops:
+            blocked = self.navigation_blocked(hop)
+            if blocked:
+                print(f"navigate to {url} redirected to {hop}: {blocked}, going back")
+                self._tool_output = {"tool": "navigate", "url": url, "error": f"redirected to {hop}, but {blocked}"}
+                try:
+                    await self.page.go_back(wait_until="domcontentloaded")
+                except PWError:
+                    pass
+                if self.page.url == landed:  # nothing to go back to
+                    await self.page.goto("about:blank")
+                return
+
     @property
     def status(self) -> "BrowserGoalState":
         """只读状态（RUNNING / SUCCESS / FAILED）"""
@@ -280,6 +459,9 @@ class BrowserAgent:
         screenshot_bytes = await screenshot_with_retry(self.page,full_page=False)
         mouse = await self.get_mouse_position()
         scrollbar = await self.get_scroll_position()
+        outline = await dom_outline(self.page) if self.collect_dom_outline else None
+        elements = await mark_elements(self.page) if self.mark_elements else None
+        signature = await dom_sig(self.page)
 
         browser_tabs = []
         pages = self.context.pages
@@ -312,8 +494,16 @@ class BrowserAgent:
             tabs=browser_tabs,
             active_tab=f"tab-{pages.index(self.page)}",
             mouse=mouse,
+            dom_outline=outline,
+            elements=elements,
+            dom_signature=signature,
+            tool_output=self._pop_tool_output(),
         )
 
+    def _pop_tool_output(self) -> Optional[dict]:
+        output, self._tool_output = self._tool_output, None
+        return output
+
     async def get_scroll_position(self) -> ScrollBar:
         # offset, height = await self.page.evaluate(
         #     "() => [window.pageYOffset / document.documentElement.scrollHeight, window.innerHeight / document.documentElement.scrollHeight]"
@@ -326,8 +516,8 @@ class BrowserAgent:
     async def get_mouse_position(self) -> Coordinate:
         return self._mouse_pos
 
-    def get_action(self, state: BrowserState) -> BrowserAction:
-        return self.planner.plan_action(
+    async def get_action(self, state: BrowserState) -> Union[BrowserAction, list[BrowserAction]]:
+        return await self.planner.plan_action(
             goal=self.goal,
             current_state=state,
             session_history=self.history,
@@ -338,6 +528,9 @@ class BrowserAgent:
         kb: Keyboard = self.page.keyboard
         m: Mouse = self.page.mouse
         action_kind = _kind(action.action)
+        if action_kind != _kind(BrowserActionType.ZOOM):
+            # anything else may change the page; the next step needs a fresh capture
+            self._zoom_state = None
 
         if action_kind == _kind(BrowserActionType.KEY):
             if not action.text:
@@ -363,11 +556,15 @@ class BrowserAgent:
             print("mouse moved to..", action.coordinate)
             self._mouse_pos = Coordinate(action.coordinate.x, action.coordinate.y)
 
-        elif action_kind == _kind(BrowserActionType.LEFT_CLICK):
+        elif action_kind in _CLICKS:
+            button, click_count = _CLICKS[action_kind]
+            # coordinate clicks are single-step; bare clicks land where the last mouse_move left the cursor
+            target = action.coordinate or last_state.mouse
             print("last step mouse position:",self._mouse_pos)
-            print("to left_click at", last_state.mouse)
+            print(f"to {action_kind} at", target)
             # await m.click(last_state.mouse.x, last_state.mouse.y)
-            await safe_click_at(self.page, last_state.mouse.x, last_state.mouse.y)
+            await safe_click_at(self.page, target.x, target.y, button=button, click_count=click_count)
+            self._mouse_pos = Coordinate(target.x, target.y)
 
         elif action_kind == _kind(BrowserActionType.SCROLL_DOWN):
             # await self.page.mouse.wheel(0, int(3 * last_state.height / 4))
@@ -379,6 +576,72 @@ class BrowserAgent:
             dy = -int(0.75 * last_state.height)
             await safe_scroll(self.page, dy)
 
+        elif action_kind in (_kind(BrowserActionType.CLICK_ELEMENT), _kind(BrowserActionType.TYPE_INTO)):
+            if action.element_id is None:
+                raise ValueError("Element id required")
+            # resolve the mark to a fresh handle: no coordinate mapping, no mouse_move step
+            handle = await resolve_mark(self.page, action.element_id)
+            if handle is None:
+                print(f"element [{action.element_id}] is gone; the model will see the new state")
+                return
+            box = await handle.bounding_box()
+            try:
+                if action_kind == _kind(BrowserActionType.CLICK_ELEMENT):
+                    await handle.click(timeout=5000)
+                else:
+                    if action.text is None:
+                        raise ValueError("Text required for type_into action")
+                    try:
+                        await handle.fill(action.text, timeout=5000)
+                    except PWError:
+                        # not an input/textarea/contenteditable: focus it and type like a user
+                        await handle.click(timeout=5000)
+                        await kb.type(action.text)
+            except PWError as e:
+                if "navigat" not in str(e).lower() and "context was destroyed" not in str(e).lower():
+                    raise
+            await self.page.wait_for_load_state("domcontentloaded")
+            if box:
+                self._mouse_pos = Coordinate(int(box["x"] + box["width"] / 2), int(box["y"] + box["height"] / 2))
+
+        elif action_kind == _kind(BrowserActionType.ZOOM):
+            crop = None
+            if not action.region:
+                self._tool_output = {"tool": "zoom", "error": action.text or "no region given"}
+            else:
+                try:
+                    crop = crop_screenshot(last_state.screenshot, action.region, last_state.width, last_state.height)
+                except (ValueError, OSError) as e:
+                    self._tool_output = {"tool": "zoom", "error": str(e)}
+            if crop is not None:
+                self._zoom_state = replace(last_state, zoom=crop, zoom_region=action.region, tool_output=None)
+                self.zoom_steps += 1
+
+        elif action_kind == _kind(BrowserActionType.FIND_IN_PAGE):
+            if not action.text:
+                raise ValueError("Text required for find_in_page action")
+            result = await find_in_page(self.page, action.text)
+            print(f"find_in_page {action.text!r}: {result.get('count', 0)} match(es)")
+            self._tool_output = {"tool": "find_in_page", "query": action.text, **result}
+
+        elif action_kind == _kind(BrowserActionType.NAVIGATE):
+            if not action.text:
+                raise ValueError("URL required for navigate action")
+            url = action.text.strip()
+            if "://" not in url:
+                url = "https://" + url
+            blocked = self.navigation_blocked(url)
+            if blocked:
+                print(f"navigate to {url} refused: {blocked}")
+                self._tool_output = {"tool": "navigate", "url": url, "error": blocked}
+            else:
+                try:
+                    response = await safe_goto(self.page, url, wait_until=self.navigate_wait_until)
+                except PWError as e:
+                    self._tool_output = {"tool": "navigate", "url": url, "error": str(e).splitlines()[0]}
+                else:
+                    await self._leave_if_redirected_off_list(url, response)
+
         elif action_kind == _kind(BrowserActionType.SWITCH_TAB):
             if not action.text:
                 raise ValueError("Tab id required")
@@ -389,15 +652,39 @@ class BrowserAgent:
                 self.page = newp
 
     async def step(self) -> None:
-        state = await self.get_state()
-        action = self.get_action(state)
+        state, self._zoom_state = self._zoom_state, None
+        if state is None:
+            state = await self.get_state()
+        planned = await self.get_action(state)
+        # batch-mode planners return several actions for one screenshot
+        actions = planned if isinstance(planned, list) else [planned]
+        start_page, start_url = self.page, self.page.url
+        for idx, action in enumerate(actions):
+            if idx > 0 and (self.page is not start_page or self.page.url != start_url):
+                print(f"in step: page changed, skipping {len(actions) - idx} remaining batched action(s)")
+                break
+            if idx > 0 and state.mouse != self._mouse_pos:
+                # a batched mouse_move moved the cursor; later clicks must use the new position
+                state = replace(state, mouse=self._mouse_pos)
+            if not await self.apply_action(action, state):
+                break
+        # zoom answers leave the page as it was, so there is nothing new to check
+        if self.success_predicates and self._zoom_state is None and _kind(self._status) == "running":
+            matched = await self.check_success()
+            if matched is not None:
+                self.success_reason = matched.describe()
+                print(f"in step: success predicate matched ({self.success_reason}), ending run")
+                self._status = BrowserGoalState.SUCCESS
+
+    async def apply_action(self, action: BrowserAction, state: BrowserState) -> bool:
+        """Run one planned action; returns False when the step must end here."""
         print("in step,Next action:", action)
         action_kind = _kind(action.action)
         print("in step:action_kind:", action_kind)
 
         if action_kind == "success":
             self._status = BrowserGoalState.SUCCESS
-            return
+            return False
         if action_kind == "failure":
             if self.pause_on_challenge and (_looks_like_captcha(action.reasoning)  or await detect_captcha_quick(self.page) ):
                 try:
@@ -405,22 +692,28 @@ class BrowserAgent:
                 except Exception:
                     pass
                 await self.wait_for_human("CAPTCHA reported by model or detected on page")
-                return
+                return False
             self._status = BrowserGoalState.FAILED
-            return
+            return False
 
         self._status = BrowserGoalState.RUNNING
-        await self.take_action(action, state)
+        step_obj = BrowserStep(state=state, action=action)
+        try:
+            await self.take_action(action, state)
+        except Exception:
+            self.planner.record_outcome(step_obj, False)
+            raise
         # await pause_if_captcha_then_screenshot(self.page, self.wait_for_human)
         # pause_if_captcha_then_screenshot(self.page, self.wait_for_human)
-        step_obj = BrowserStep(state=state, action=action)
         self.history.append(step_obj)
+        self.planner.record_outcome(step_obj, True)
 
         if self.on_step:
             try:
                 await self.on_step(step_obj)
             except Exception:
                 pass
+        return True
     
 
     async def start(self) -> None:
@@ -428,7 +721,8 @@ class BrowserAgent:
         # prime mouse listener
         await self.page.mouse.move(1, 1)
 
-        while _kind(self._status) in ('initial', 'running') and len(self.history) <= self.max_steps:
+        while (_kind(self._status) in ('initial', 'running')
+               and len(self.history) - self.zoom_steps <= self.max_steps and self.zoom_steps <= self.max_steps):
             await self.step()
             print("in start, after step(),self._status:",self._status)
             print("in start,self._mouse_pos:",self._mouse_pos)
@@ -0,0 +1,145 @@
+"""Record/replay of planner decisions so runs can be reproduced without the live API.
+
+    planner = RecordingPlanner(AnthropicPlanner(), "runs/react.jsonl")   # live, writes cassette
+    planner = ReplayPlanner("runs/react.jsonl")                          # offline, recorded latency
+    planner = ReplayPlanner("runs/react.jsonl", latency_s=0.0)           # offline, no delay
+
+A cassette is plaintext JSON with every action verbatim, including typed text, so a run
+that types credentials leaves them on disk; replay needs them, so nothing is redacted.
+Keep such cassettes out of version control.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from browser import ActionPlanner, BrowserAction, BrowserState, BrowserStep, _kind
+from browser import action_to_dict, action_from_dict
+
+
+def request_fingerprint(goal: str, additional_context: str, current_state: BrowserState,
+                        session_history: list[BrowserStep]) -> str:
+    """Stable key for one planner call.
+
+    Screenshot bytes are left out on purpose: they differ between runs (clocks, ads,
+    animations) even when the agent is at the same point of the same flow.
+    """
+    active_url = next((t.url for t in current_state.tabs if t.active), "")
+    trace = [
+        [_kind(s.action.action), s.action.text,
+         [s.action.coordinate.x, s.action.coordinate.y] if s.action.coordinate else None]
+        for s in session_history
+    ]
+    payload = json.dumps(
+        {
+            "goal": goal,
+            "context": additional_context,
+            "step": len(session_history),
+            "url": active_url,
+            "trace": trace,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingPlanner(ActionPlanner):
+    """Wraps any planner and appends every decision to a JSONL cassette."""
+
+    def __init__(self, inner: ActionPlanner, path: str) -> None:
+        self.inner = inner
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        started = time.perf_counter()
+        action = await self.inner.plan_action(
+            goal=goal,
+            additional_context=additional_context,
+            additional_instructions=additional_instructions,
+            current_state=current_state,
+            session_history=session_history,
+        )
+        entry = {
+            "fingerprint": request_fingerprint(goal, additional_context, current_state, session_history),
+            "step": len(session_history),
+            "latency_s": round(time.perf_counter() - started, 4),
+        }
+        if isinstance(action, list):
+            entry["actions"] = [action_to_dict(a) for a in action]
+        else:
+            entry["action"] = action_to_dict(action)
+        # file I/O off the loop so other agents keep running
+        await asyncio.to_thread(self._append, json.dumps(entry) + "\n")
+        return action
+
+    def _append(self, line: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def record_outcome(self, step: BrowserStep, ok: bool) -> None:
+        self.inner.record_outcome(step, ok)
+
+    def attach(self, agent) -> None:
+        self.inner.attach(agent)
+
+
+class ReplayPlanner(ActionPlanner):
+    """Serves actions from a cassette.
+
+    latency_s: fixed simulated latency per call (0 = none); None (default) replays the
+               recorded latency.
+    strict:    raise on an unknown fingerprint instead of falling back to the next
+               recorded entry in order.
+    """
+
+    def __init__(self, path: str, latency_s: Optional[float] = None, strict: bool = False) -> None:
+        self.path = path
+        self.latency_s = latency_s
+        self.strict = strict
+        self.entries: list[dict] = []
+        self.by_fingerprint: dict[str, list[dict]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._cursor = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self.entries.append(entry)
+                self.by_fingerprint.setdefault(entry["fingerprint"], []).append(entry)
+
+    def _next_entry(self, fingerprint: str) -> dict:
+        matches = self.by_fingerprint.get(fingerprint)
+        if matches:
+            self.hits += 1
+            # the same fingerprint can repeat (e.g. retried steps); serve recordings in order
+            entry = matches.pop(0) if len(matches) > 1 else matches[0]
+            self._cursor = self.entries.index(entry) + 1
+            return entry
+        self.misses += 1
+        if self.strict or self._cursor >= len(self.entries):
+            raise KeyError(f"No cassette entry for request {fingerprint[:12]} in {self.path}")
+        entry = self.entries[self._cursor]
+        self._cursor += 1
+        return entry
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        fingerprint = request_fingerprint(goal, additional_context, current_state, session_history)
+        entry = self._next_entry(fingerprint)
+        delay = entry.get("latency_s", 0.0) if self.latency_s is None else self.latency_s
+        if delay:
+            await asyncio.sleep(delay)
+        if "actions" in entry:
+            actions = [action_from_dict(a) for a in entry["actions"]]
+            print(f"[replay] step {len(session_history)} -> {[_kind(a.action) for a in actions]}")
+            return actions
+        action: BrowserAction = action_from_dict(entry["action"])
+        print(f"[replay] step {len(session_history)} -> {_kind(action.action)}")
+        return action
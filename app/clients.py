@@ -0,0 +1,146 @@
+"""Process-wide registry of pooled Anthropic clients.
+
+Planners borrow a client keyed by (api_key, base_url) instead of building their
+own, so steady-state requests reuse warm keep-alive connections instead of paying
+for a new pool and TLS handshake per agent.
+
+    registry = configure_client_pool(concurrent_agents=8)
+    ...
+    print(registry.stats.snapshot())   # connections opened, requests per connection, ...
+"""
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    connections_opened: int = 0
+    tls_handshakes: int = 0
+    # id(network stream) -> responses received on that connection
+    per_connection: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def reused_requests(self) -> int:
+        return max(0, self.requests - self.connections_opened)
+
+    @property
+    def requests_per_connection(self) -> float:
+        return self.requests / self.connections_opened if self.connections_opened else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_requests": self.reused_requests,
+            "requests_per_connection": round(self.requests_per_connection, 2),
+            "max_requests_on_one_connection": max(self.per_connection.values(), default=0),
+        }
+
+
+class ClientRegistry:
+    """Hands out one AsyncAnthropic per (api_key, base_url), all sharing pooled HTTP clients.
+
+    Connections belong to the event loop that opened them, so a separate pool is kept
+    per running loop (the GUI's worker loop and an asyncio.run() script never mix).
+    Pools of loops that have since closed are dropped on the next get(); call aclose()
+    on a loop that is about to stop to close its connections cleanly.
+    """
+
+    def __init__(self, concurrent_agents: int = 4, keepalive_expiry_s: float = 60.0) -> None:
+        self.concurrent_agents = concurrent_agents
+        self.keepalive_expiry_s = keepalive_expiry_s
+        self.stats = PoolStats()
+        self._lock = threading.Lock()
+        # running loop (None outside one) -> (api_key, base_url[, max_retries]) -> client
+        self._clients: dict[Optional[asyncio.AbstractEventLoop], dict[tuple, AsyncAnthropic]] = {}
+
+    def limits(self) -> "httpx.Limits":
+        # one warm connection per agent; headroom for hedged duplicates, which are not kept alive
+        return httpx.Limits(
+            max_connections=2 * self.concurrent_agents,
+            max_keepalive_connections=self.concurrent_agents,
+            keepalive_expiry=self.keepalive_expiry_s,
+        )
+
+    def _http_client(self):
+        return DefaultAsyncHttpxClient(
+            limits=self.limits(),
+            event_hooks={"request": [self._on_request], "response": [self._on_response]},
+        )
+
+    async def _on_request(self, request) -> None:
+        self.stats.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self.stats.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            self.stats.tls_handshakes += 1
+
+    async def _on_response(self, response) -> None:
+        stream = response.extensions.get("network_stream")
+        if stream is not None:
+            per = self.stats.per_connection
+            per[id(stream)] = per.get(id(stream), 0) + 1
+
+    def get(self, api_key: Optional[str], base_url: Optional[str] = None,
+            max_retries: Optional[int] = None) -> AsyncAnthropic:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        key = (api_key, base_url)
+        with self._lock:
+            for old in [l for l in self._clients if l is not None and l.is_closed()]:
+                # its connections died with it; only the references were left
+                del self._clients[old]
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = AsyncAnthropic(api_key=api_key, base_url=base_url, http_client=self._http_client())
+                clients[key] = client
+            if max_retries is None:
+                return client
+            variant_key = key + (max_retries,)
+            variant = clients.get(variant_key)
+            if variant is None:
+                # with_options keeps the parent's http client, i.e. the same pool
+                variant = client.with_options(max_retries=max_retries)
+                clients[variant_key] = variant
+            return variant
+
+    async def aclose(self) -> None:
+        """Close and forget the clients of the running loop."""
+        with self._lock:
+            clients = self._clients.pop(asyncio.get_running_loop(), {})
+        # variants share their parent's http client; closing it twice is harmless
+        for client in clients.values():
+            await client.close()
+
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def configure_client_pool(concurrent_agents: int = 4, keepalive_expiry_s: float = 60.0) -> ClientRegistry:
+    """Install the process-wide registry; call before the planners make their first request."""
+    global _registry
+    with _registry_lock:
+        _registry = ClientRegistry(concurrent_agents, keepalive_expiry_s)
+        return _registry
+
+
+def get_client_registry() -> ClientRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
@@ -0,0 +1,197 @@
+"""Rule-based pre-planner that clears cookie/consent banners without asking the model.
+
+    planner = ConsentPlanner(AnthropicPlanner())
+    agent = BrowserAgent(page, context, planner, goal)
+    ...
+    print(planner.report())   # rule hits and planner calls saved
+
+Each step, one evaluate per frame checks the rule set against the live DOM. A match
+is answered locally with a mouse_move + left_click batch (run by BrowserAgent.step
+like any other batch, and valid under both click protocols when the history is
+replayed to the model); otherwise the step goes to the wrapped planner.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from browser import ActionPlanner, BrowserAction, BrowserActionType, BrowserStep, Coordinate, new_tool_id
+
+
+@dataclass(frozen=True)
+class ConsentRule:
+    name: str
+    # CSS selectors of the button to click, tried in order
+    selectors: tuple[str, ...] = ()
+    # button labels (case-insensitive regexes) looked up inside `scope`
+    texts: tuple[str, ...] = ()
+    scope: Optional[str] = None
+    # only probe frames whose URL matches this regex (consent iframes); None = every frame
+    frame_url: Optional[str] = None
+    # also search open shadow roots (slower; only for frameworks that render in one)
+    shadow: bool = False
+
+
+_BANNER_SCOPE = (
+    '[id*="cookie" i],[class*="cookie" i],[id*="consent" i],[class*="consent" i],'
+    '[id*="gdpr" i],[class*="gdpr" i],[aria-label*="cookie" i],[aria-label*="consent" i]'
+)
+
+DEFAULT_CONSENT_RULES: tuple[ConsentRule, ...] = (
+    ConsentRule("onetrust", selectors=("#onetrust-accept-btn-handler",)),
+    ConsentRule("cookiebot", selectors=(
+        "#CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll",
+        "#CybotCookiebotDialogBodyButtonAccept",
+    )),
+    ConsentRule("didomi", selectors=("#didomi-notice-agree-button",)),
+    ConsentRule("trustarc", selectors=("#truste-consent-button",)),
+    ConsentRule("quantcast", selectors=('.qc-cmp2-summary-buttons button[mode="primary"]',)),
+    ConsentRule("usercentrics", selectors=('[data-testid="uc-accept-all-button"]',), shadow=True),
+    ConsentRule("sourcepoint", selectors=('button[title="Accept all"]', 'button[title="Accept"]'),
+                frame_url=r"sp_message|privacy-mgmt"),
+    ConsentRule("bing", selectors=("#bnp_btn_accept",)),
+    ConsentRule("google", selectors=("button#L2AGLb",)),
+    ConsentRule(
+        "generic-banner",
+        texts=(
+            r"^(accept|allow)( all)?( cookies)?$", r"^(i )?agree$", r"^got it!?$", r"^ok(ay)?$",
+            r"^alle akzeptieren$", r"^tout accepter$", r"^aceptar( todo)?$",
+        ),
+        scope=_BANNER_SCOPE,
+    ),
+)
+
+PROBE_JS = """
+(rules) => {
+  const visible = (el) => {
+    const r = el.getBoundingClientRect();
+    if (r.width < 2 || r.height < 2) return false;
+    const cs = el.ownerDocument.defaultView.getComputedStyle(el);
+    return cs.visibility !== 'hidden' && cs.display !== 'none' && parseFloat(cs.opacity || '1') > 0.05;
+  };
+  const deepQuery = (root, sel) => {
+    const hit = root.querySelector(sel);
+    if (hit) return hit;
+    for (const el of root.querySelectorAll('*')) {
+      if (el.shadowRoot) {
+        const inner = deepQuery(el.shadowRoot, sel);
+        if (inner) return inner;
+      }
+    }
+    return null;
+  };
+  const BUTTONS = 'button,[role=button],a,input[type=button],input[type=submit]';
+  for (const rule of rules) {
+    for (const sel of rule.selectors) {
+      let el = null;
+      try { el = rule.shadow ? deepQuery(document, sel) : document.querySelector(sel); } catch (e) { el = null; }
+      if (el && visible(el)) return {rule: rule.index, selector: sel};
+    }
+    if (!rule.texts.length) continue;
+    const patterns = rule.texts.map(t => new RegExp(t, 'i'));
+    let scopes = [];
+    try { scopes = rule.scope ? Array.from(document.querySelectorAll(rule.scope)) : [document]; } catch (e) { scopes = []; }
+    for (const scope of scopes) {
+      for (const el of scope.querySelectorAll(BUTTONS)) {
+        const label = (el.innerText || el.value || el.getAttribute('aria-label') || '').replace(/\\s+/g, ' ').trim();
+        if (!label || label.length > 40 || !patterns.some(p => p.test(label)) || !visible(el)) continue;
+        document.querySelectorAll('[data-ba-consent]').forEach(e => e.removeAttribute('data-ba-consent'));
+        el.setAttribute('data-ba-consent', '1');
+        return {rule: rule.index, selector: '[data-ba-consent]'};
+      }
+    }
+  }
+  return null;
+}
+"""
+
+
+class ConsentPlanner(ActionPlanner):
+    """Clicks consent buttons matched by `rules` and defers everything else to `inner`.
+
+    max_attempts: clicks per rule and URL before the rule is ignored there (a banner
+                  that does not go away is left to the model)
+    """
+
+    def __init__(self, inner: ActionPlanner, rules: tuple[ConsentRule, ...] = DEFAULT_CONSENT_RULES,
+                 max_attempts: int = 2) -> None:
+        self.inner = inner
+        self.rules = tuple(rules)
+        self.max_attempts = max_attempts
+        self.agent = None
+        self.rule_hits: dict[str, int] = {}
+        self.deferred = 0
+        self._attempts: dict[tuple[str, str], int] = {}
+
+    def attach(self, agent) -> None:
+        self.agent = agent
+        self.inner.attach(agent)
+
+    def record_outcome(self, step: BrowserStep, ok: bool) -> None:
+        self.inner.record_outcome(step, ok)
+
+    def _candidates(self, url: str) -> list[dict]:
+        return [
+            {"index": idx, "selectors": list(rule.selectors), "texts": list(rule.texts),
+             "scope": rule.scope, "shadow": rule.shadow}
+            for idx, rule in enumerate(self.rules)
+            if self._attempts.get((rule.name, url), 0) < self.max_attempts
+        ]
+
+    async def find_banner(self, page) -> Optional[tuple[ConsentRule, Coordinate]]:
+        """First rule that matches a visible button in any frame, with the button's centre."""
+        candidates = self._candidates(page.url)
+        if not candidates:
+            return None
+        for frame in page.frames:
+            rules = [c for c in candidates
+                     if self.rules[c["index"]].frame_url is None or re.search(self.rules[c["index"]].frame_url, frame.url)]
+            if not rules:
+                continue
+            try:
+                found = await frame.evaluate(PROBE_JS, rules)
+                if not found:
+                    continue
+                handle = await frame.query_selector(found["selector"])
+                box = await handle.bounding_box() if handle else None
+            except Exception:
+                # detached or navigating frame; the next step probes again
+                continue
+            if not box:
+                continue
+            centre = Coordinate(int(box["x"] + box["width"] / 2), int(box["y"] + box["height"] / 2))
+            return self.rules[found["rule"]], centre
+        return None
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        if not session_history:
+            self._attempts.clear()
+        page = self.agent.page if self.agent is not None else None
+        match = await self.find_banner(page) if page is not None else None
+        if match is not None:
+            rule, centre = match
+            key = (rule.name, page.url)
+            self._attempts[key] = self._attempts.get(key, 0) + 1
+            self.rule_hits[rule.name] = self.rule_hits.get(rule.name, 0) + 1
+            print(f"[consent] rule '{rule.name}' matched, clicking {centre}")
+            reasoning = f"Dismissing the consent banner (rule '{rule.name}')."
+            return [
+                BrowserAction(BrowserActionType.MOUSE_MOVE, centre, None, reasoning, new_tool_id()),
+                BrowserAction(BrowserActionType.LEFT_CLICK, None, None, reasoning, new_tool_id()),
+            ]
+        self.deferred += 1
+        return await self.inner.plan_action(
+            goal=goal,
+            additional_context=additional_context,
+            additional_instructions=additional_instructions,
+            current_state=current_state,
+            session_history=session_history,
+        )
+
+    def report(self) -> dict:
+        hits = sum(self.rule_hits.values())
+        return {
+            "rule_hits": dict(self.rule_hits),
+            # every local answer is one screenshot + model round trip not spent
+            "saved_steps": hits,
+            "deferred": self.deferred,
+        }
@@ -0,0 +1,330 @@
+"""Cache of planner decisions for flows that repeat the same pages over and over.
+
+    planner = CachingPlanner(AnthropicPlanner(), ttl_s=24 * 3600, path="runs/decisions.json")
+
+A decision is keyed by goal, active URL, viewport, the page's DOM signature
+(`utils.dom_sig`) and the last few actions of the run (so successive steps on one
+page, e.g. filling a form, get their own entries), and only served when the screenshot's dHash is close to the one
+it was recorded on and the live planner has picked the same action
+`min_confirmations` times. A cached action that fails (raises, or leaves the page
+exactly as it was) is dropped and the cache is bypassed for the rest of the run.
+
+Saves to `path` are debounced and written off the event loop; call `save()` at
+shutdown if the last run did not end with a stop_browsing answer.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional, Union
+
+from browser import ActionPlanner, BrowserAction, BrowserState, BrowserStep, _kind
+from browser import action_to_dict, action_from_dict
+from anthropicAgent import frame_hash, hash_distance, warm_frame_hashes
+
+Planned = Union[BrowserAction, list[BrowserAction]]
+
+# actions that are expected to change what the page shows
+_PAGE_CHANGING = {
+    "left_click", "right_click", "middle_click", "double_click", "type", "key",
+    "scroll_down", "scroll_up", "click_element", "type_into", "switch_tab", "navigate",
+}
+
+
+@dataclass
+class CacheEntry:
+    actions: list[dict]
+    frame_hash: int
+    created: float
+    confirmations: int = 1
+    hits: int = 0
+
+
+@dataclass
+class CacheStats:
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+
+@dataclass
+class _Served:
+    key: str
+    state: BrowserState
+    actions: list[BrowserAction] = field(default_factory=list)
+
+
+def progress_digest(history: Optional[list[BrowserStep]], depth: int = 3, grid_px: int = 16) -> list:
+    """The last `depth` actions of the run; coordinates are snapped to a grid so replays line up."""
+    recent = [s.action for s in history or [] if _kind(s.action.action) != "zoom"][-depth:]
+    return [
+        [_kind(a.action), a.text, a.element_id,
+         [a.coordinate.x // grid_px, a.coordinate.y // grid_px] if a.coordinate else None]
+        for a in recent
+    ]
+
+
+def cache_key(goal: str, state: BrowserState, history: Optional[list[BrowserStep]] = None) -> str:
+    active_url = next((t.url for t in state.tabs if t.active), "")
+    payload = json.dumps(
+        {
+            "goal": goal,
+            "url": active_url,
+            "viewport": [state.width, state.height],
+            "dom": state.dom_signature,
+            "progress": progress_digest(history),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def page_unchanged(before: BrowserState, after: BrowserState, hash_threshold: int = 0) -> bool:
+    """Default verification: same tab, URL, DOM signature and (near) identical frame."""
+    if before.active_tab != after.active_tab or before.dom_signature != after.dom_signature:
+        return False
+    url = lambda s: next((t.url for t in s.tabs if t.active), "")
+    if url(before) != url(after):
+        return False
+    return hash_distance(frame_hash(before.screenshot), frame_hash(after.screenshot)) <= hash_threshold
+
+
+class CachingPlanner(ActionPlanner):
+    """Serves repeated decisions from an LRU/TTL cache and asks `inner` otherwise.
+
+    ttl_s:             entries older than this are treated as misses and dropped
+    max_entries:       LRU bound
+    hash_threshold:    max dHash distance between the recorded and the current frame
+    min_confirmations: times the live planner must have chosen the same action before it is served
+    jitter_px:         coordinate tolerance when comparing live and cached actions
+    verify:            verify(state_before, state_after, actions) -> bool, called on the step
+                       after a cached decision ran; False invalidates it. Defaults to
+                       "a page-changing action changed the page".
+    path:              optional JSON file the cache is loaded from and saved to
+    save_delay_s:      changes are written at most this often (in a worker thread)
+    """
+
+    def __init__(
+        self,
+        inner: ActionPlanner,
+        ttl_s: float = 24 * 3600,
+        max_entries: int = 2048,
+        hash_threshold: int = 4,
+        min_confirmations: int = 2,
+        jitter_px: int = 5,
+        verify: Optional[Callable[[BrowserState, BrowserState, list[BrowserAction]], bool]] = None,
+        path: Optional[str] = None,
+        save_delay_s: float = 2.0,
+    ) -> None:
+        self.inner = inner
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.hash_threshold = hash_threshold
+        self.min_confirmations = min_confirmations
+        self.jitter_px = jitter_px
+        self.verify = verify or self._default_verify
+        self.path = path
+        self.save_delay_s = save_delay_s
+        self.stats = CacheStats()
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bypass = False
+        self._served: Optional[_Served] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    # ---- persistence ----
+
+    def load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for key, raw in data.items():
+            self.entries[key] = CacheEntry(**raw)
+        self._evict()
+
+    def _snapshot(self) -> dict:
+        return {k: dict(vars(e)) for k, e in self.entries.items()}
+
+    def _write(self, snapshot: dict) -> None:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with self._write_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.path)
+
+    def save(self) -> None:
+        """Write the cache now (blocking)."""
+        if not self.path:
+            return
+        self._dirty = False
+        self._write(self._snapshot())
+
+    async def flush(self) -> None:
+        """Write pending changes now, off the event loop."""
+        if self.path and self._dirty:
+            self._dirty = False
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def _mark_dirty(self) -> None:
+        if not self.path:
+            return
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_soon())
+        except RuntimeError:
+            # not on an event loop (e.g. a script editing the cache): nothing to block
+            self.save()
+
+    async def _save_soon(self) -> None:
+        await asyncio.sleep(self.save_delay_s)
+        await self.flush()
+
+    # ---- cache bookkeeping ----
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _same(self, a: BrowserAction, b: BrowserAction) -> bool:
+        if _kind(a.action) != _kind(b.action) or a.text != b.text or a.element_id != b.element_id:
+            return False
+        if (a.coordinate is None) != (b.coordinate is None):
+            return False
+        if a.coordinate is None:
+            return True
+        return (abs(a.coordinate.x - b.coordinate.x) <= self.jitter_px
+                and abs(a.coordinate.y - b.coordinate.y) <= self.jitter_px)
+
+    def _lookup(self, key: str, frame_hash: int) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created > self.ttl_s:
+            del self.entries[key]
+            self.stats.evictions += 1
+            return None
+        if entry.confirmations < self.min_confirmations:
+            return None
+        if hash_distance(entry.frame_hash, frame_hash) > self.hash_threshold:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remember(self, key: str, frame_hash: int, actions: list[BrowserAction]) -> None:
+        entry = self.entries.get(key)
+        fresh = time.time()
+        if (entry is not None and len(entry.actions) == len(actions)
+                and hash_distance(entry.frame_hash, frame_hash) <= self.hash_threshold
+                and all(self._same(action_from_dict(c), a) for c, a in zip(entry.actions, actions))):
+            # the live planner agreed again: that is what makes an entry servable
+            entry.confirmations += 1
+            entry.created = fresh
+            self.entries.move_to_end(key)
+        else:
+            self.entries[key] = CacheEntry(
+                actions=[action_to_dict(a) for a in actions], frame_hash=frame_hash, created=fresh,
+            )
+            self._evict()
+        self._mark_dirty()
+
+    def invalidate(self, key: str) -> None:
+        if self.entries.pop(key, None) is not None:
+            self.stats.invalidations += 1
+            self._mark_dirty()
+        # a failed replay means this run diverges from the recorded flow; stay live from here
+        self._bypass = True
+
+    def _default_verify(self, before: BrowserState, after: BrowserState, actions: list[BrowserAction]) -> bool:
+        if not any(_kind(a.action) in _PAGE_CHANGING for a in actions):
+            return True
+        return not page_unchanged(before, after)
+
+    # ---- ActionPlanner ----
+
+    def attach(self, agent) -> None:
+        self.inner.attach(agent)
+
+    def record_outcome(self, step: BrowserStep, ok: bool) -> None:
+        served = self._served
+        if not ok and served is not None and any(step.action is a for a in served.actions):
+            print(f"[cache] cached {_kind(step.action.action)} failed, invalidating")
+            self._served = None
+            self.invalidate(served.key)
+        self.inner.record_outcome(step, ok)
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        if not session_history:
+            self._bypass = False
+            self._served = None
+
+        served, self._served = self._served, None
+        # PNG decode for the frame hashes runs in a thread; verify and lookup then only read the memo
+        await warm_frame_hashes(current_state.screenshot, served.state.screenshot if served is not None else None)
+        if served is not None and not self.verify(served.state, current_state, served.actions):
+            print("[cache] cached decision had no visible effect, invalidating")
+            self.invalidate(served.key)
+
+        key = cache_key(goal, current_state, session_history)
+        current_hash = frame_hash(current_state.screenshot)
+        self.stats.lookups += 1
+        entry = None if self._bypass else self._lookup(key, current_hash)
+        if entry is not None:
+            self.stats.hits += 1
+            entry.hits += 1
+            # fresh ids: the same decision may be replayed several times in one conversation
+            actions = [replace(action_from_dict(a), id="") for a in entry.actions]
+            self._served = _Served(key=key, state=current_state, actions=actions)
+            print(f"[cache] hit -> {[_kind(a.action) for a in actions]} (hit rate {self.stats.hit_rate:.0%})")
+            return actions if len(actions) > 1 else actions[0]
+        if self._bypass:
+            self.stats.bypassed += 1
+        else:
+            self.stats.misses += 1
+
+        planned: Planned = await self.inner.plan_action(
+            goal=goal,
+            additional_context=additional_context,
+            additional_instructions=additional_instructions,
+            current_state=current_state,
+            session_history=session_history,
+        )
+        actions = planned if isinstance(planned, list) else [planned]
+        # terminal answers depend on more than the page (e.g. how the run got here), and a zoom
+        # would be served again on the zoomed state; never cache them
+        if not self._bypass and actions and all(_kind(a.action) not in ("success", "failure", "zoom") for a in actions):
+            self._remember(key, current_hash, actions)
+        if any(_kind(a.action) in ("success", "failure") for a in actions):
+            # the run ends here; do not leave changes to a timer the caller may never await
+            await self.flush()
+        return planned
+
+    def report(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "lookups": self.stats.lookups,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "bypassed": self.stats.bypassed,
+            "invalidations": self.stats.invalidations,
+            "evictions": self.stats.evictions,
+            "hit_rate": round(self.stats.hit_rate, 3),
+        }
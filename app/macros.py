@@ -0,0 +1,230 @@
+"""Successful runs saved as parameterised macros and replayed without the planner.
+
+    library = MacroLibrary("runs/macros.json")
+    agent = BrowserAgent(page, context, AnthropicPlanner(), goal="give me the wikipedia page of Vue")
+    await run_with_macros(agent, library, params={"topic": "Vue"})
+
+A macro is the action sequence of a run that ended in SUCCESS, with the goal and
+typed text turned into templates ("give me the wikipedia page of {topic}") and one
+checkpoint per step: the URL pattern and `utils.dom_sig` the step started from.
+Macros are plaintext JSON, so typed text that is not made of goal parameters or goal
+words (a password, an address) is not stored unless `keep_typed_text=True`; replay
+hands over to the planner at such a step.
+Replay goes through `BrowserAgent.apply_action`, so history stays complete; at the
+first checkpoint that does not match, the live planner takes over from there.
+"""
+import asyncio
+import fnmatch
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field, asdict, replace
+from typing import Optional
+
+from browser import BrowserAgent, BrowserState, BrowserStep, _kind
+from browser import action_to_dict, action_from_dict
+
+
+@dataclass
+class Checkpoint:
+    url_pattern: str
+    # only compared when the macro is replayed with the exact parameters it was recorded with
+    dom_sig: Optional[str] = None
+
+
+@dataclass
+class MacroStep:
+    action: dict
+    checkpoint: Checkpoint
+    # typed text was left out of the file; the planner has to type it
+    redacted: bool = False
+
+
+@dataclass
+class Macro:
+    goal_template: str
+    params: dict[str, str]
+    steps: list[MacroStep]
+    recorded_at: float = field(default_factory=time.time)
+    replays: int = 0
+    fallbacks: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Macro":
+        steps = [
+            MacroStep(action=s["action"], checkpoint=Checkpoint(**s["checkpoint"]), redacted=s.get("redacted", False))
+            for s in data["steps"]
+        ]
+        return cls(**{**data, "steps": steps})
+
+
+def _active_url(state: BrowserState) -> str:
+    return next((t.url for t in state.tabs if t.active), "")
+
+
+def _templatize(text: Optional[str], params: dict[str, str]) -> Optional[str]:
+    if not text:
+        return text
+    # longest values first so "New York City" wins over "York"
+    for name, value in sorted(params.items(), key=lambda kv: -len(kv[1])):
+        if value:
+            text = text.replace(value, "{" + name + "}")
+    return text
+
+
+def _fill(text: Optional[str], params: dict[str, str]) -> Optional[str]:
+    if not text:
+        return text
+    for name, value in params.items():
+        text = text.replace("{" + name + "}", value)
+    return text
+
+
+def _url_pattern(url: str, params: dict[str, str]) -> str:
+    # escape fnmatch specials in the literal URL first
+    pattern = url.replace("[", "[[]").replace("?", "[?]").replace("*", "[*]")
+    # a parameter can show up raw or url-encoded in the path/query; either way it is a wildcard
+    for value in sorted((v for v in params.values() if v), key=len, reverse=True):
+        for variant in {value, value.replace(" ", "+"), value.replace(" ", "%20"), value.replace(" ", "_")}:
+            pattern = pattern.replace(variant, "*")
+    return pattern
+
+
+def _typed_text_is_public(text: str, goal_template: str) -> bool:
+    """True when every word outside the placeholders also appears in the goal (which is stored anyway)."""
+    goal_words = set(re.findall(r"\w+", goal_template.lower()))
+    literal = re.sub(r"\{\w+\}", " ", text)
+    return all(word in goal_words for word in re.findall(r"\w+", literal.lower()))
+
+
+def record_macro(goal: str, history: list[BrowserStep], params: Optional[dict[str, str]] = None,
+                 keep_typed_text: bool = False) -> Macro:
+    """Turn a successful run's history into a macro; `params` values become placeholders.
+
+    keep_typed_text: store typed text verbatim even when it is not made of parameters/goal words
+    """
+    params = params or {}
+    goal_template = _templatize(goal, params)
+    steps = []
+    for step in history:
+        kind = _kind(step.action.action)
+        if kind == "zoom":
+            # only informed the planner; nothing to replay
+            continue
+        action = action_to_dict(step.action)
+        action["text"] = _templatize(action["text"], params)
+        action["id"] = ""
+        redacted = False
+        if (kind in ("type", "type_into") and action["text"] and not keep_typed_text
+                and not _typed_text_is_public(action["text"], goal_template)):
+            action["text"], redacted = None, True
+        steps.append(MacroStep(
+            action=action,
+            checkpoint=Checkpoint(url_pattern=_url_pattern(_active_url(step.state), params),
+                                  dom_sig=step.state.dom_signature),
+            redacted=redacted,
+        ))
+    return Macro(goal_template=goal_template, params=dict(params), steps=steps)
+
+
+def _template_regex(template: str) -> re.Pattern:
+    parts = re.split(r"\{(\w+)\}", template)
+    regex = ""
+    for idx, part in enumerate(parts):
+        regex += f"(?P<{part}>.+?)" if idx % 2 else re.escape(part)
+    return re.compile(f"^{regex}$", re.IGNORECASE)
+
+
+class MacroLibrary:
+    """JSON file of macros, one per goal template (the latest success wins)."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.macros: dict[str, Macro] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for data in json.load(f):
+                    macro = Macro.from_dict(data)
+                    self.macros[macro.goal_template] = macro
+
+    def save(self) -> None:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([m.to_dict() for m in self.macros.values()], f, indent=1)
+        os.replace(tmp, self.path)
+
+    def add(self, macro: Macro) -> None:
+        old = self.macros.get(macro.goal_template)
+        if old is not None:
+            macro.replays, macro.fallbacks = old.replays, old.fallbacks
+        self.macros[macro.goal_template] = macro
+        self.save()
+
+    def match(self, goal: str) -> Optional[tuple[Macro, dict[str, str]]]:
+        """Macro whose template matches `goal`, with the parameter values read from it."""
+        for template, macro in self.macros.items():
+            if template.lower() == goal.lower():
+                return macro, dict(macro.params)
+            found = _template_regex(template).match(goal)
+            if found:
+                return macro, found.groupdict()
+        return None
+
+
+def checkpoint_matches(checkpoint: Checkpoint, state: BrowserState, exact: bool) -> bool:
+    if not fnmatch.fnmatchcase(_active_url(state), checkpoint.url_pattern):
+        return False
+    if exact and checkpoint.dom_sig and state.dom_signature and checkpoint.dom_sig != state.dom_signature:
+        return False
+    return True
+
+
+async def replay_macro(agent: BrowserAgent, macro: Macro, params: dict[str, str], step_delay_ms: int = 100) -> int:
+    """Run the macro's actions on `agent`; returns how many steps ran before a checkpoint mismatch."""
+    exact = params == macro.params
+    for idx, macro_step in enumerate(macro.steps):
+        state = await agent.get_state()
+        if not checkpoint_matches(macro_step.checkpoint, state, exact):
+            print(f"[macro] checkpoint {idx} mismatch at {_active_url(state)}; handing over to the planner")
+            return idx
+        if macro_step.redacted:
+            print(f"[macro] step {idx + 1} types text that was not recorded; handing over to the planner")
+            return idx
+        action = action_from_dict(macro_step.action)
+        action = replace(action, text=_fill(action.text, params), reasoning=f"macro step {idx + 1}/{len(macro.steps)}")
+        print(f"[macro] step {idx + 1}/{len(macro.steps)}: {_kind(action.action)}")
+        if not await agent.apply_action(action, state):
+            return idx
+        await asyncio.sleep(step_delay_ms / 1000)
+    return len(macro.steps)
+
+
+async def run_with_macros(agent: BrowserAgent, library: MacroLibrary,
+                          params: Optional[dict[str, str]] = None, step_delay_ms: int = 100,
+                          keep_typed_text: bool = False) -> None:
+    """Replay a matching macro if there is one, let the planner finish, and record the run on success.
+
+    params: values to templatize when recording; when a macro matches, the values parsed
+            from the goal are used instead.
+    keep_typed_text: passed to record_macro
+    """
+    found = library.match(agent.goal)
+    if found:
+        macro, goal_params = found
+        done = await replay_macro(agent, macro, goal_params, step_delay_ms)
+        macro.replays += 1
+        if done < len(macro.steps):
+            macro.fallbacks += 1
+        params = goal_params
+        library.save()
+    # the planner confirms the end state (or picks up after a mismatch)
+    await agent.start()
+    if _kind(agent.status) == "success" and agent.history:
+        library.add(record_macro(agent.goal, agent.history, params, keep_typed_text))
@@ -2,8 +2,10 @@ from browser import BrowserAgent, BrowserActionType
 from playwright.async_api import async_playwright
 from PIL import Image
 from io import BytesIO
-from browser import BrowserAgent,ActionPlanner
+from browser import BrowserAgent,ActionPlanner,BrowserAgentOptions,SuccessPredicate
 from anthropicAgent import AnthropicPlanner
+from cassette import RecordingPlanner, ReplayPlanner
+from macros import MacroLibrary, run_with_macros
 import os
 import time
 import asyncio
@@ -32,6 +34,19 @@ def main1():
         print(status1)
 
 
+def make_planner() -> ActionPlanner:
+    # RECORD_CASSETTE=path records live decisions; REPLAY_CASSETTE=path runs offline from them,
+    # with the recorded latency unless REPLAY_LATENCY_S fixes it (0 = no delay)
+    replay = os.getenv("REPLAY_CASSETTE")
+    if replay:
+        latency = os.getenv("REPLAY_LATENCY_S")
+        return ReplayPlanner(replay, latency_s=float(latency) if latency is not None else None)
+    record = os.getenv("RECORD_CASSETTE")
+    if record:
+        return RecordingPlanner(AnthropicPlanner(), record)
+    return AnthropicPlanner()
+
+
 async def main():
     try:
         async with async_playwright() as p:
@@ -40,10 +55,17 @@ async def main():
             page = await context.new_page()
             goal1="give me the wikipedia page of React"
 
-            ba = BrowserAgent(page=page,context=context,action_planner=AnthropicPlanner(),goal=goal1)
+            # the run ends as soon as the article is open, without a confirming model step
+            options = BrowserAgentOptions(success_predicates=[SuccessPredicate(url="*.wikipedia.org/wiki/React*")])
+            ba = BrowserAgent(page=page,context=context,action_planner=make_planner(),goal=goal1,options=options)
             await ba.page.goto("https://bing.com")
             # bs=ba.get_state()
-            await ba.start()
+            macro_path = os.getenv("MACRO_LIBRARY")
+            if macro_path:
+                # replays the recorded flow for "...wikipedia page of {topic}" goals, records on success
+                await run_with_macros(ba, MacroLibrary(macro_path), params={"topic": "React"})
+            else:
+                await ba.start()
     finally:
         time.sleep(5)
         await browser.close()
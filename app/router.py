@@ -0,0 +1,175 @@
+"""Tiered model routing: routine steps go to a fast model, hard ones escalate.
+
+    router = RouterPlanner([
+        make_anthropic_tier("fast", "claude-3-5-haiku-20241022"),
+        make_anthropic_tier("large", "claude-3-5-sonnet-20241022"),
+    ])
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from browser import ActionPlanner, BrowserAction, BrowserState, BrowserStep, _kind
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, frame_hash, hash_distance, warm_frame_hashes
+
+# actions that are not expected to change the page (or only scroll it); repeating them is
+# routine, and the raw screenshot has no cursor, so a mouse_move always looks like a stall
+_NEUTRAL = {"mouse_move", "scroll_down", "scroll_up", "screenshot", "cursor_position", "zoom", "find_in_page"}
+_SCROLL_KEYS = {"page_down", "page_up", "pagedown", "pageup", "down", "up", "left", "right",
+                "home", "end", "space", "arrowdown", "arrowup"}
+
+
+def changes_page(action: BrowserAction) -> bool:
+    kind = _kind(action.action)
+    if kind in _NEUTRAL:
+        return False
+    if kind == "key" and (action.text or "").strip().lower() in _SCROLL_KEYS:
+        return False
+    return True
+
+
+@dataclass
+class ModelTier:
+    name: str
+    planner: ActionPlanner
+    decisions: int = 0
+    latency_s: list[float] = field(default_factory=list)
+
+    @property
+    def mean_latency_s(self) -> float:
+        return sum(self.latency_s) / len(self.latency_s) if self.latency_s else 0.0
+
+
+def make_anthropic_tier(name: str, model: str, options: Optional[AnthropicPlannerOptions] = None,
+                        max_tokens: Optional[int] = None) -> ModelTier:
+    planner = AnthropicPlanner(options)
+    planner.model = model
+    if max_tokens:
+        planner.max_tokens = max_tokens
+    return ModelTier(name=name, planner=planner)
+
+
+class RouterPlanner(ActionPlanner):
+    """Sends each step to the cheapest tier unless the run shows signs of trouble.
+
+    Escalation triggers:
+      * failure   - the current tier answered FAILURE; the step is re-asked one tier up
+      * repeat    - the last two actions are the same page-changing action (same kind, text,
+                    coordinates within jitter_px) and the page did not change after the first
+      * stall     - after a page-changing action, the page (URL + screenshot hash) is back to a state
+                    from the last stall_window steps that it had since moved away from
+    Scrolls, mouse moves and other read-only actions never trigger either.
+    An escalated tier is kept for hold_steps steps before dropping back to the first tier.
+    """
+
+    def __init__(self, tiers: list[ModelTier], jitter_px: int = 5, stall_window: int = 3,
+                 hold_steps: int = 2, hash_threshold: int = 3) -> None:
+        if len(tiers) < 2:
+            raise ValueError("RouterPlanner needs at least two tiers")
+        self.tiers = tiers
+        self.jitter_px = jitter_px
+        self.stall_window = stall_window
+        self.hold_steps = hold_steps
+        self.hash_threshold = hash_threshold
+        self.escalations: dict[str, int] = {"failure": 0, "repeat": 0, "stall": 0}
+        self._level = 0
+        self._hold = 0
+        self._fingerprints: list[tuple[str, int]] = []
+
+    def _same_action(self, a: BrowserAction, b: BrowserAction) -> bool:
+        if _kind(a.action) != _kind(b.action) or a.text != b.text:
+            return False
+        if (a.coordinate is None) != (b.coordinate is None):
+            return False
+        if a.coordinate is None:
+            return True
+        return (abs(a.coordinate.x - b.coordinate.x) <= self.jitter_px
+                and abs(a.coordinate.y - b.coordinate.y) <= self.jitter_px)
+
+    def _fingerprint(self, state: BrowserState) -> tuple[str, int]:
+        url = next((t.url for t in state.tabs if t.active), "")
+        return url, frame_hash(state.screenshot)
+
+    def _same_page(self, a: tuple[str, int], b: tuple[str, int]) -> bool:
+        return a[0] == b[0] and hash_distance(a[1], b[1]) <= self.hash_threshold
+
+    def _trouble(self, current_state: BrowserState, session_history: list[BrowserStep]) -> Optional[str]:
+        fp = self._fingerprint(current_state)
+        recent = self._fingerprints[-self.stall_window:]
+        self._fingerprints.append(fp)
+        if not session_history or not changes_page(session_history[-1].action):
+            return None
+        last = session_history[-1]
+        if (len(session_history) >= 2 and self._same_action(last.action, session_history[-2].action)
+                and self._same_page(self._fingerprint(last.state), fp)):
+            return "repeat"
+        if len(session_history) >= self.stall_window:
+            # back on a page seen before some change in between (A -> B -> A); a click that only
+            # left the page as it was is not a loop, and is caught by "repeat" if it persists
+            moved = False
+            for old in reversed(recent):
+                if not self._same_page(old, fp):
+                    moved = True
+                elif moved:
+                    return "stall"
+        return None
+
+    def _escalate(self, reason: str) -> None:
+        self.escalations[reason] += 1
+        self._level = min(self._level + 1, len(self.tiers) - 1)
+        self._hold = self.hold_steps
+        print(f"[router] escalating to tier '{self.tiers[self._level].name}' ({reason})")
+
+    async def _ask(self, tier: ModelTier, **request):
+        started = time.perf_counter()
+        action = await tier.planner.plan_action(**request)
+        tier.latency_s.append(time.perf_counter() - started)
+        tier.decisions += 1
+        return action
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        if not session_history:
+            self._level, self._hold = 0, 0
+            self._fingerprints.clear()
+        # PNG decode for the fingerprints runs in a thread; _trouble then only reads the memo
+        last_shot = session_history[-1].state.screenshot if session_history else None
+        await warm_frame_hashes(current_state.screenshot, last_shot)
+        reason = self._trouble(current_state, session_history)
+        if reason:
+            self._escalate(reason)
+        elif self._hold > 0:
+            self._hold -= 1
+        else:
+            self._level = 0
+
+        request = dict(
+            goal=goal,
+            additional_context=additional_context,
+            additional_instructions=additional_instructions,
+            current_state=current_state,
+            session_history=session_history,
+        )
+        action = await self._ask(self.tiers[self._level], **request)
+        # a cheaper tier giving up is not final; ask the next tier for the same step
+        while (not isinstance(action, list) and _kind(action.action) == "failure"
+               and self._level < len(self.tiers) - 1):
+            self._escalate("failure")
+            action = await self._ask(self.tiers[self._level], **request)
+        return action
+
+    def record_outcome(self, step: BrowserStep, ok: bool) -> None:
+        for tier in self.tiers:
+            tier.planner.record_outcome(step, ok)
+
+    def attach(self, agent) -> None:
+        for tier in self.tiers:
+            tier.planner.attach(agent)
+
+    def stats(self) -> dict:
+        return {
+            "tiers": {
+                t.name: {"decisions": t.decisions, "mean_latency_s": round(t.mean_latency_s, 3)}
+                for t in self.tiers
+            },
+            "escalations": dict(self.escalations),
+        }
@@ -0,0 +1,241 @@
+"""Process-wide, rate-limit-aware scheduling of planner calls.
+
+All planners that share a PlannerScheduler draw from the same request and token
+buckets, so a fleet of agents stays just under the account quota instead of
+tripping 429s and retrying on its own.
+
+    scheduler = configure_default_scheduler(requests_per_minute=50, input_tokens_per_minute=40000)
+    planner = AnthropicPlanner(AnthropicPlannerOptions(scheduler=scheduler, priority=1))
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+from anthropic import APIConnectionError, APIStatusError, RateLimitError
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errors the SDK itself would retry: timeouts, connection errors, 408/409 and 5xx (incl. 529)."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409) or error.status_code >= 500)
+
+
+class TokenBucket:
+    """Continuously refilling bucket; capacity is the per-minute quota."""
+
+    def __init__(self, per_minute: Optional[int]) -> None:
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity is None:
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)."""
+        if self.capacity is None:
+            return 0.0
+        self._refill(now)
+        # a request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def take(self, amount: float, now: float) -> None:
+        if self.capacity is None:
+            return
+        self._refill(now)
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        if self.capacity is None:
+            return
+        self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    rate_limited: int = 0
+    # retries after 5xx/overloaded/connection errors
+    retried: int = 0
+    queued_seconds: float = 0.0
+
+
+class PlannerScheduler:
+    """Admits planner calls in priority order when request/token budgets allow.
+
+    Safe to share between agents on different event loops: bucket state is guarded
+    by a thread lock and waiters poll instead of using loop-bound primitives.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        input_tokens_per_minute: Optional[int] = None,
+        output_tokens_per_minute: Optional[int] = None,
+        max_retries: int = 4,
+        poll_interval_s: float = 0.05,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.input_tokens = TokenBucket(input_tokens_per_minute)
+        self.output_tokens = TokenBucket(output_tokens_per_minute)
+        self.max_retries = max_retries
+        self.poll_interval_s = poll_interval_s
+        self.stats = SchedulerStats()
+        self._lock = threading.Lock()
+        self._queue: list[tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    def _try_admit(self, ticket: tuple[int, int], est_input: int, est_output: int) -> float:
+        """Admit the ticket if it is first in line and budgets allow; else return seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if self._queue[0] != ticket:
+                return self.poll_interval_s
+            if now < self._paused_until:
+                return self._paused_until - now
+            wait = max(
+                self.requests.wait_time(1, now),
+                self.input_tokens.wait_time(est_input, now),
+                self.output_tokens.wait_time(est_output, now),
+            )
+            if wait > 0:
+                return wait
+            self.requests.take(1, now)
+            self.input_tokens.take(est_input, now)
+            self.output_tokens.take(est_output, now)
+            heapq.heappop(self._queue)
+            return 0.0
+
+    async def _admit(self, priority: int, est_input: int, est_output: int) -> None:
+        ticket = (-priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_admit(ticket, est_input, est_output)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+            raise
+        self.stats.queued_seconds += time.monotonic() - started
+
+    def settle(self, est_input: int, est_output: int, usage: Any) -> None:
+        """Correct the buckets with the real usage once a response is in."""
+        if usage is None:
+            return
+        with self._lock:
+            self.input_tokens.give_back(est_input - getattr(usage, "input_tokens", est_input))
+            self.output_tokens.give_back(est_output - getattr(usage, "output_tokens", est_output))
+
+    def release(self, est_input: int, est_output: int) -> None:
+        """Return a reservation whose request was rejected (no tokens were processed)."""
+        with self._lock:
+            self.input_tokens.give_back(est_input)
+            self.output_tokens.give_back(est_output)
+
+    def _settle_when_done(self, est_input: int, est_output: int, usage: Any) -> None:
+        # streamed responses hand over a future that resolves once the stream is drained
+        if isinstance(usage, asyncio.Future):
+            usage.add_done_callback(
+                lambda f: self.settle(est_input, est_output,
+                                      None if f.cancelled() or f.exception() else f.result())
+            )
+        else:
+            self.settle(est_input, est_output, usage)
+
+    def retry_delay(self, error: BaseException, attempt: int) -> float:
+        retry_after = None
+        try:
+            retry_after = float(error.response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        if retry_after is not None:
+            return min(retry_after, 60.0)
+        return min(8.0, 0.5 * 2.0 ** attempt) * random.uniform(0.75, 1.0)
+
+    def back_off(self, error: RateLimitError, attempt: int) -> None:
+        retry_after = None
+        try:
+            retry_after = float(error.response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            pass
+        delay = retry_after if retry_after is not None else min(30.0, 2.0 ** attempt)
+        with self._lock:
+            self.stats.rate_limited += 1
+            # everyone waits, not just the caller that got the 429
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        print(f"[scheduler] 429 received, pausing all planner calls for {delay:.1f}s")
+
+    async def submit(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        est_input_tokens: int,
+        est_output_tokens: int,
+        priority: int = 0,
+        usage_of: Callable[[Any], Any] = lambda r: getattr(r, "usage", None),
+    ) -> Any:
+        """Run `call` once admitted; higher priority goes first.
+
+        Clients used here should not retry on their own (max_retries=0): 429s pause every
+        caller, and transient errors (5xx, overloaded, connection) are retried by the caller
+        that hit them. A failed attempt gives its token reservation back before the next one.
+        """
+        self.stats.submitted += 1
+        for attempt in range(self.max_retries + 1):
+            await self._admit(priority, est_input_tokens, est_output_tokens)
+            try:
+                result = await call()
+            except RateLimitError as e:
+                self.release(est_input_tokens, est_output_tokens)
+                if attempt >= self.max_retries:
+                    raise
+                self.back_off(e, attempt)
+                continue
+            except (APIStatusError, APIConnectionError) as e:
+                self.release(est_input_tokens, est_output_tokens)
+                if not is_transient(e) or attempt >= self.max_retries:
+                    raise
+                delay = self.retry_delay(e, attempt)
+                self.stats.retried += 1
+                print(f"[scheduler] {type(e).__name__}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self._settle_when_done(est_input_tokens, est_output_tokens, usage_of(result))
+            self.stats.completed += 1
+            return result
+
+
+_default_scheduler: Optional[PlannerScheduler] = None
+_default_lock = threading.Lock()
+
+
+def configure_default_scheduler(**limits) -> PlannerScheduler:
+    """Install the process-wide scheduler (see PlannerScheduler for the limits)."""
+    global _default_scheduler
+    with _default_lock:
+        _default_scheduler = PlannerScheduler(**limits)
+        return _default_scheduler
+
+
+def get_default_scheduler() -> Optional[PlannerScheduler]:
+    return _default_scheduler
@@ -0,0 +1,166 @@
+"""On-disk index of past runs, used to hand the planner hints from similar successful ones.
+
+    index = TrajectoryIndex("runs/trajectories.jsonl")
+    await run_with_hints(agent, index)   # adds a hint to additional_context, records the run
+
+Runs are appended as JSON lines (goal, start URL, compact action trace, outcome), so
+updates are incremental. Lookup is TF-IDF cosine similarity over an in-memory
+inverted index of goal words and bigrams, start-URL host and path tokens, and trace words.
+"""
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+from urllib.parse import urlparse
+
+from browser import BrowserAgent, BrowserStep, _kind
+
+_STOPWORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "me", "my", "i", "is", "it",
+    "give", "please", "find", "get", "show", "with", "at", "from", "by",
+}
+# trace words say less about the task than the goal itself
+_TRACE_WEIGHT = 0.5
+
+
+def _words(text: str) -> list[str]:
+    return [w for w in re.findall(r"[a-z0-9]+", (text or "").lower()) if w not in _STOPWORDS]
+
+
+def _url_terms(url: str) -> list[str]:
+    parsed = urlparse(url or "")
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    terms = [f"host:{host}"] if host else []
+    terms += [f"path:{w}" for w in re.findall(r"[a-z0-9]+", parsed.path.lower())][:6]
+    return terms
+
+
+def _query_terms(goal: str, start_url: str) -> Counter:
+    words = _words(goal)
+    terms = Counter(words)
+    terms.update(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    terms.update(_url_terms(start_url))
+    return terms
+
+
+def compact_trace(history: list[BrowserStep], max_items: int = 14) -> list[str]:
+    """One short token per step, plus the URL whenever the page changed."""
+    trace: list[str] = []
+    last_url = None
+    for step in history:
+        url = next((t.url for t in step.state.tabs if t.active), "")
+        if url and url != last_url:
+            parsed = urlparse(url)
+            trace.append(f"@{parsed.hostname or ''}{parsed.path[:40]}")
+            last_url = url
+        kind = _kind(step.action.action)
+        if kind in ("mouse_move", "zoom", "screenshot", "cursor_position"):
+            continue
+        item = kind
+        if step.action.text:
+            text = step.action.text if len(step.action.text) <= 30 else step.action.text[:27] + "..."
+            item += f" {json.dumps(text, ensure_ascii=False)}"
+        trace.append(item)
+    if len(trace) > max_items:
+        trace = trace[:max_items - 1] + [f"... {len(trace) - max_items + 1} more"]
+    return trace
+
+
+class TrajectoryIndex:
+    """Append-only JSONL of runs with an in-memory TF-IDF index over them."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records: list[dict] = []
+        self.postings: dict[str, dict[int, float]] = {}
+        self._vectors: list[Counter] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self._index(json.loads(line))
+
+    def _index(self, record: dict) -> None:
+        doc_id = len(self.records)
+        terms = _query_terms(record["goal"], record.get("start_url", ""))
+        for word in _words(" ".join(record.get("trace", []))):
+            terms[word] += _TRACE_WEIGHT
+        self.records.append(record)
+        self._vectors.append(terms)
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def add(self, goal: str, start_url: str, history: list[BrowserStep], success: bool) -> dict:
+        record = {
+            "goal": goal,
+            "start_url": start_url,
+            "trace": compact_trace(history),
+            "steps": len(history),
+            "success": success,
+            "ts": round(time.time(), 1),
+        }
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._index(record)
+        return record
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self.records)) / (1 + len(self.postings.get(term, ())))) + 1.0
+
+    def search(self, goal: str, start_url: str = "", k: int = 3, successful_only: bool = True,
+               min_score: float = 0.2) -> list[tuple[float, dict]]:
+        """Top-k past runs by cosine similarity; only documents sharing a term are scored."""
+        query = _query_terms(goal, start_url)
+        q_weights = {t: tf * self._idf(t) for t, tf in query.items()}
+        q_norm = math.sqrt(sum(w * w for w in q_weights.values())) or 1.0
+        dots: dict[int, float] = {}
+        for term, qw in q_weights.items():
+            idf = self._idf(term)
+            for doc_id, tf in self.postings.get(term, {}).items():
+                dots[doc_id] = dots.get(doc_id, 0.0) + qw * tf * idf
+        scored = []
+        for doc_id, dot in dots.items():
+            record = self.records[doc_id]
+            if successful_only and not record.get("success"):
+                continue
+            d_norm = math.sqrt(sum((tf * self._idf(t)) ** 2 for t, tf in self._vectors[doc_id].items())) or 1.0
+            score = dot / (q_norm * d_norm)
+            if score >= min_score:
+                scored.append((score, record))
+        # ties go to the shorter run
+        scored.sort(key=lambda item: (-item[0], item[1].get("steps", 0)))
+        return scored[:k]
+
+    def hint(self, goal: str, start_url: str = "", k: int = 2) -> Optional[str]:
+        """Short text for additional_context, or None when nothing similar succeeded before."""
+        found = self.search(goal, start_url, k=k)
+        if not found:
+            return None
+        lines = ["Similar tasks completed before (for orientation only; the page may differ):"]
+        for score, record in found:
+            lines.append(
+                f"- {json.dumps(record['goal'], ensure_ascii=False)} in {record['steps']} steps: "
+                + " > ".join(record.get("trace", []))
+            )
+        return "\n".join(lines)
+
+
+async def run_with_hints(agent: BrowserAgent, index: TrajectoryIndex, k: int = 2) -> None:
+    """Add hints from similar successful runs to the agent's context, run it, and index the outcome."""
+    start_url = agent.page.url
+    hint = index.hint(agent.goal, start_url, k=k)
+    if hint:
+        print(f"[trajectories] {hint.count(chr(10))} hint(s) added")
+        base = agent.additional_context
+        agent.additional_context = hint if not base or base == "None" else f"{base}\n\n{hint}"
+    await agent.start()
+    index.add(agent.goal, start_url, agent.history, success=_kind(agent.status) == "success")
@@ -1,5 +1,7 @@
 from typing import NamedTuple, Optional
 import asyncio
+import io
+from PIL import Image
 from playwright.async_api import Error as PwError, TimeoutError as PwTimeout
 from playwright._impl._errors import Error as PWError
 
@@ -333,7 +335,7 @@ async def probe_point(page, x, y):
     return await page.evaluate(js, [x, y])
 
 # ========== 统一的安全 Click / Key / Scroll / Tabs / History ==========
-async def safe_click_at(page, x: int, y: int, nav_timeout=10000) -> bool:
+async def safe_click_at(page, x: int, y: int, nav_timeout=10000, button: str = "left", click_count: int = 1) -> bool:
     """站点无关、坐标优先的安全点击：就绪→探测→选择合适等待→一次竞态重试"""
     before = await dom_sig(page)
     await wait_document_ready(page)
@@ -351,7 +353,7 @@ async def safe_click_at(page, x: int, y: int, nav_timeout=10000) -> bool:
     try:
         if info.get("popupLikely"):  # 可能 target=_blank
             async with page.expect_popup() as pctx:
-                await page.mouse.click(int(x), int(y))
+                await page.mouse.click(int(x), int(y), button=button, click_count=click_count)
             newp = await pctx.value    # ← 注意 await
             await newp.wait_for_load_state("domcontentloaded")
             # 调用方（BrowserAgent）如果有 self.page，记得切到 newp
@@ -359,10 +361,10 @@ async def safe_click_at(page, x: int, y: int, nav_timeout=10000) -> bool:
 
         if info.get("navLikely"):
             async with page.expect_navigation(wait_until="domcontentloaded", timeout=nav_timeout):
-                await page.mouse.click(int(x), int(y))
+                await page.mouse.click(int(x), int(y), button=button, click_count=click_count)
             return True
 
-        await page.mouse.click(int(x), int(y))     # 非导航点击
+        await page.mouse.click(int(x), int(y), button=button, click_count=click_count)     # 非导航点击
         await asyncio.sleep(0.05)                  # 微沉淀
     except PWError as e:
         msg = str(e).lower()
@@ -438,5 +440,254 @@ async def safe_go_forward(page, timeout_nav=10000):
         await page.go_forward()
     return True
 
+async def safe_goto(page, url: str, wait_until: str = "domcontentloaded", timeout_nav=15000):
+    """地址栏式跳转；超时视为已加载（页面常有长尾请求），其余错误抛出；返回主文档 Response（超时/无响应为 None）"""
+    response = None
+    try:
+        response = await page.goto(url, wait_until=wait_until, timeout=timeout_nav)
+    except PwTimeout:
+        pass
+    await wait_layout_stable(page, timeout=1500, frames_ok=2, interval_ms=80)
+    return response
+
+
+# ========== 文本观察：视口内的可交互元素 + 可见文本 ==========
+DOM_OUTLINE_JS = """
+(maxItems) => {
+  const vw = innerWidth, vh = innerHeight;
+  const INTERACTIVE = 'a[href],button,input,select,textarea,summary,[role=button],[role=link],[role=checkbox],' +
+    '[role=radio],[role=tab],[role=menuitem],[role=option],[role=switch],[role=combobox],[role=searchbox],' +
+    '[role=textbox],[contenteditable=""],[contenteditable=true],[onclick],[tabindex]:not([tabindex="-1"])';
+  const TEXTY = 'h1,h2,h3,h4,p,li,td,th,label,dt,dd,blockquote,pre,figcaption';
+  const clip = (s, n) => { s = (s || '').replace(/\\s+/g, ' ').trim(); return s.length > n ? s.slice(0, n - 1) + '…' : s; };
+  const visibleBox = (el) => {
+    const r = el.getBoundingClientRect();
+    if (r.width < 2 || r.height < 2 || r.bottom < 0 || r.right < 0 || r.top > vh || r.left > vw) return null;
+    const cs = getComputedStyle(el);
+    if (cs.visibility === 'hidden' || cs.display === 'none' || parseFloat(cs.opacity || '1') < 0.05) return null;
+    return [Math.round(r.left), Math.round(r.top), Math.round(r.width), Math.round(r.height)];
+  };
+  const roleOf = (el) => el.getAttribute('role') || ({A: 'link', BUTTON: 'button', SELECT: 'combobox',
+    TEXTAREA: 'textbox', SUMMARY: 'button'})[el.tagName] ||
+    (el.tagName === 'INPUT' ? ({checkbox: 'checkbox', radio: 'radio', submit: 'button', button: 'button',
+      search: 'searchbox'})[el.type] || 'textbox' : el.tagName.toLowerCase());
+  const nameOf = (el) => clip(el.getAttribute('aria-label') || el.getAttribute('alt') || el.getAttribute('title') ||
+    el.getAttribute('placeholder') || (el.labels && el.labels[0] && el.labels[0].innerText) || el.innerText ||
+    (el.type !== 'password' ? el.value : ''), 80);
+  const items = [];
+  for (const el of document.querySelectorAll(INTERACTIVE)) {
+    if (items.length >= maxItems) break;
+    const box = visibleBox(el);
+    if (!box) continue;
+    const item = {kind: 'control', role: roleOf(el), name: nameOf(el), box};
+    if ('value' in el && el.type !== 'password' && typeof el.value === 'string' && el.value) item.value = clip(el.value, 60);
+    if (el.type === 'checkbox' || el.type === 'radio') item.checked = !!el.checked;
+    if (el.disabled) item.disabled = true;
+    items.push(item);
+  }
+  for (const el of document.querySelectorAll(TEXTY)) {
+    if (items.length >= maxItems * 2) break;
+    if (el.closest(INTERACTIVE)) continue;
+    const text = clip(el.innerText, 200);
+    if (!text) continue;
+    const box = visibleBox(el);
+    if (!box) continue;
+    items.push({kind: 'text', role: el.tagName.toLowerCase(), name: text, box});
+  }
+  return {url: location.href, title: document.title, items};
+}
+"""
+
+async def dom_outline(page, max_items: int = 120):
+    """一次 evaluate 取视口内可交互元素（role/name/value/box）与可见文本块；失败返回 None"""
+    try:
+        return await page.evaluate(DOM_OUTLINE_JS, max_items)
+    except Exception:
+        return None
+
+
+# ========== Set-of-marks：给可交互元素编号（含同源 iframe 与 open shadow root） ==========
+MARK_ELEMENTS_JS = """
+(maxItems) => {
+  const SEL = 'a[href],button,input:not([type=hidden]),select,textarea,summary,[role=button],[role=link],' +
+    '[role=checkbox],[role=radio],[role=tab],[role=menuitem],[role=option],[role=switch],[role=combobox],' +
+    '[role=searchbox],[role=textbox],[contenteditable=""],[contenteditable=true],[onclick]';
+  const vw = innerWidth, vh = innerHeight;
+  const clip = (s, n) => { s = (s || '').replace(/\\s+/g, ' ').trim(); return s.length > n ? s.slice(0, n - 1) + '…' : s; };
+  const out = [];
+  let next = 1;
+  const visit = (root, ox, oy) => {
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT);
+    for (let el = walker.nextNode(); el; el = walker.nextNode()) {
+      el.removeAttribute('data-ba-mark');
+      if (el.shadowRoot) visit(el.shadowRoot, ox, oy);
+      if (el.tagName === 'IFRAME') {
+        let doc = null;
+        try { doc = el.contentDocument; } catch (e) { doc = null; }  // cross-origin
+        if (doc && doc.documentElement) {
+          const r = el.getBoundingClientRect();
+          visit(doc.documentElement, ox + r.left + el.clientLeft, oy + r.top + el.clientTop);
+        }
+        continue;
+      }
+      if (out.length >= maxItems || !el.matches(SEL)) continue;
+      const r = el.getBoundingClientRect();
+      const x = ox + r.left, y = oy + r.top;
+      if (r.width < 2 || r.height < 2 || x + r.width < 0 || y + r.height < 0 || x > vw || y > vh) continue;
+      const cs = el.ownerDocument.defaultView.getComputedStyle(el);
+      if (cs.visibility === 'hidden' || cs.display === 'none' || parseFloat(cs.opacity || '1') < 0.05) continue;
+      const id = next++;
+      el.setAttribute('data-ba-mark', String(id));
+      out.push({
+        id,
+        role: el.getAttribute('role') || el.tagName.toLowerCase() + (el.type ? ':' + el.type : ''),
+        name: clip(el.getAttribute('aria-label') || el.getAttribute('title') || el.getAttribute('placeholder') ||
+                   el.getAttribute('alt') || el.innerText || (el.type !== 'password' ? el.value : ''), 60),
+        box: [Math.round(x), Math.round(y), Math.round(r.width), Math.round(r.height)],
+      });
+    }
+  };
+  visit(document.documentElement, 0, 0);
+  return out;
+}
+"""
+
+async def mark_elements(page, max_items: int = 150):
+    """注入脚本给视口内可交互元素打 data-ba-mark 编号，返回 [{id, role, name, box}]；失败返回 None"""
+    try:
+        return await page.evaluate(MARK_ELEMENTS_JS, max_items)
+    except Exception:
+        return None
+
+async def resolve_mark(page, mark_id: int):
+    """按编号取“新鲜”的 ElementHandle；CSS 选择器会穿透 open shadow root，iframe 逐个 frame 查"""
+    sel = f'[data-ba-mark="{int(mark_id)}"]'
+    for frame in page.frames:
+        try:
+            handle = await frame.query_selector(sel)
+        except Exception:
+            continue
+        if handle:
+            return handle
+    return None
+
 
+def crop_screenshot(screenshot: bytes, region, css_width: int, css_height: int, max_size=(1280, 800)) -> bytes:
+    """Crop a raw page.screenshot() PNG at its native (device) resolution.
 
+    region is (left, top, right, bottom) in CSS pixels of a css_width x css_height viewport;
+    the crop is only downscaled if it is larger than max_size.
+    """
+    with Image.open(io.BytesIO(screenshot)) as img:
+        sx, sy = img.width / css_width, img.height / css_height
+        left, top, right, bottom = region
+        box = (
+            max(0, int(left * sx)), max(0, int(top * sy)),
+            min(img.width, int(right * sx)), min(img.height, int(bottom * sy)),
+        )
+        if box[2] <= box[0] or box[3] <= box[1]:
+            raise ValueError(f"Empty zoom region {region}")
+        crop = img.crop(box)
+        crop.thumbnail(max_size, Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        crop.save(out, format="PNG")
+        return out.getvalue()
+
+
+# ========== 页内查找：一次 evaluate 搜索文本（含同源 iframe），滚动到最佳匹配 ==========
+FIND_IN_PAGE_JS = """
+([query, maxItems]) => {
+  const q = query.toLowerCase();
+  if (!q) return {count: 0, scrolled_to: null, matches: []};
+  const SKIP = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE']);
+  const hits = [];
+  const visit = (doc, depth) => {
+    const root = doc.body || doc.documentElement;
+    if (!root) return;
+    const walker = doc.createTreeWalker(root, NodeFilter.SHOW_TEXT);
+    for (let node = walker.nextNode(); node; node = walker.nextNode()) {
+      const el = node.parentElement;
+      if (!el || SKIP.has(el.tagName)) continue;
+      const text = node.nodeValue, lower = text.toLowerCase();
+      for (let i = lower.indexOf(q); i !== -1; i = lower.indexOf(q, i + q.length)) {
+        const range = doc.createRange();
+        range.setStart(node, i);
+        range.setEnd(node, i + q.length);
+        const r = range.getBoundingClientRect();
+        if (r.width < 1 || r.height < 1) continue;  // display:none / collapsed
+        if (doc.defaultView.getComputedStyle(el).visibility === 'hidden') continue;
+        const snippet = text.slice(Math.max(0, i - 40), i + q.length + 40).replace(/\\s+/g, ' ').trim();
+        hits.push({range, el, win: doc.defaultView, exact: text.substr(i, query.length) === query, snippet});
+      }
+    }
+    if (depth > 3) return;
+    for (const f of doc.querySelectorAll('iframe,frame')) {
+      let inner = null;
+      try { inner = f.contentDocument; } catch (e) { inner = null; }  // cross-origin
+      if (inner) visit(inner, depth + 1);
+    }
+  };
+  visit(document, 0);
+  if (!hits.length) return {count: 0, scrolled_to: null, matches: []};
+  let best = hits.findIndex(h => h.exact);
+  if (best < 0) best = 0;
+  hits[best].el.scrollIntoView({block: 'center', inline: 'nearest', behavior: 'instant'});
+  // frame offsets change with scrolling, so boxes are measured afterwards
+  const offset = (win) => {
+    let x = 0, y = 0;
+    for (let w = win; w.frameElement; w = w.parent) {
+      const fr = w.frameElement.getBoundingClientRect();
+      x += fr.left + w.frameElement.clientLeft;
+      y += fr.top + w.frameElement.clientTop;
+    }
+    return [x, y];
+  };
+  const matches = hits.slice(0, maxItems).map((h, idx) => {
+    const r = h.range.getBoundingClientRect();
+    const [ox, oy] = offset(h.win);
+    return {
+      index: idx,
+      box: [Math.round(ox + r.left), Math.round(oy + r.top), Math.round(r.width), Math.round(r.height)],
+      snippet: h.snippet,
+    };
+  });
+  return {count: hits.length, scrolled_to: best, matches, viewport: [innerWidth, innerHeight]};
+}
+"""
+
+async def find_in_page(page, text: str, max_items: int = 20):
+    """页内查找并把最佳匹配（优先大小写完全一致）滚到视口中央；返回 {count, scrolled_to, matches:[{index, box, snippet}]}"""
+    try:
+        return await page.evaluate(FIND_IN_PAGE_JS, [text, max_items])
+    except PwError as e:
+        return {"count": 0, "scrolled_to": None, "matches": [], "error": str(e).splitlines()[0]}
+
+
+SUCCESS_PROBE_JS = """
+(checks) => {
+  let body = null;
+  for (let i = 0; i < checks.length; i++) {
+    const [sel, text] = checks[i];
+    if (sel) {
+      let el = null;
+      try { el = document.querySelector(sel); } catch (e) { el = null; }
+      if (!el) continue;
+    }
+    if (text) {
+      if (body === null) body = ((document.body && document.body.innerText) || '').toLowerCase();
+      if (!body.includes(text.toLowerCase())) continue;
+    }
+    return i;
+  }
+  return -1;
+}
+"""
+
+async def first_page_match(page, checks: list[tuple[Optional[str], Optional[str]]]) -> int:
+    """一次 evaluate 检查 [(selector, text)]：selector 存在且正文包含 text（忽略大小写）；返回第一个命中的下标，没有/导航中为 -1"""
+    if not checks:
+        return -1
+    try:
+        return await page.evaluate(SUCCESS_PROBE_JS, [list(c) for c in checks])
+    except PwError:
+        return -1
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# modules in app/ import each other as top-level modules; append so the real anthropic SDK
+# still wins over app/anthropic.py
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+
+@pytest.fixture
+def in_page():
+    """in_page(html, fn) runs `await fn(page)` on a Chromium page showing html; skips without a browser."""
+
+    def run(html, fn):
+        async def main():
+            from playwright.async_api import async_playwright
+            async with async_playwright() as p:
+                try:
+                    browser = await p.chromium.launch()
+                except Exception as e:
+                    pytest.skip(f"chromium not available: {str(e).splitlines()[0]}")
+                try:
+                    page = await browser.new_page()
+                    await page.set_content(html)
+                    return await fn(page)
+                finally:
+                    await browser.close()
+        return asyncio.run(main())
+
+    return run
+
+
+class StubApi:
+    """Local stand-in for the Messages API: HTTP/1.1 keep-alive, one canned reply per request.
+
+    delays: seconds to wait before answering, consumed one per request (then 0)
+    statuses: HTTP status per request, consumed the same way (then 200)
+    stream_tool: for "stream": true requests, the computer tool input streamed after a text block;
+                 the stream then pauses `stream_tail_s` before a trailing text block and the usage
+    """
+
+    def __init__(self) -> None:
+        self.delays: list[float] = []
+        self.statuses: list[int] = []
+        self.stream_tool: dict = {"action": "screenshot"}
+        self.stream_tail_s = 0.0
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def stream(self, n):
+                events = [
+                    ("message_start", {"message": {
+                        "id": f"msg_{n}", "type": "message", "role": "assistant", "model": "stub", "content": [],
+                        "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 100, "output_tokens": 1},
+                    }}),
+                    ("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}}),
+                    ("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": "Looking."}}),
+                    ("content_block_stop", {"index": 0}),
+                    ("content_block_start", {"index": 1, "content_block": {
+                        "type": "tool_use", "id": f"toolu_{n}", "name": "computer", "input": {}}}),
+                    ("content_block_delta", {"index": 1, "delta": {
+                        "type": "input_json_delta", "partial_json": json.dumps(stub.stream_tool)}}),
+                    ("content_block_stop", {"index": 1}),
+                    None,  # pause: everything after the tool_use is the tail
+                    ("content_block_start", {"index": 2, "content_block": {"type": "text", "text": ""}}),
+                    ("content_block_delta", {"index": 2, "delta": {"type": "text_delta", "text": " Done."}}),
+                    ("content_block_stop", {"index": 2}),
+                    ("message_delta", {"delta": {"stop_reason": "tool_use", "stop_sequence": None},
+                                       "usage": {"output_tokens": 42}}),
+                    ("message_stop", {}),
+                ]
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event in events:
+                        if event is None:
+                            self.wfile.flush()
+                            time.sleep(stub.stream_tail_s)
+                            continue
+                        name, data = event
+                        self.wfile.write(f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode())
+                    self.wfile.flush()
+                except OSError:
+                    pass  # the client stopped reading (e.g. a cancelled drain)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                with stub.lock:
+                    stub.requests += 1
+                    n = stub.requests
+                    delay = stub.delays.pop(0) if stub.delays else 0.0
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                time.sleep(delay)
+                if status == 200 and payload.get("stream"):
+                    return self.stream(n)
+                if status == 200:
+                    body = {
+                        "id": f"msg_{n}", "type": "message", "role": "assistant", "model": "stub",
+                        "content": [{"type": "text", "text": f"reply {n}"}],
+                        "stop_reason": "end_turn", "stop_sequence": None,
+                        "usage": {"input_tokens": 100, "output_tokens": 10},
+                    }
+                else:
+                    body = {"type": "error", "error": {"type": "api_error", "message": f"status {status}"}}
+                data = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("content-type", "application/json")
+                    self.send_header("content-length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except OSError:
+                    pass  # the client gave up on this request (e.g. a cancelled hedge)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    monkeypatch.setenv("apikey", "test-key")
+    api = StubApi()
+    yield api
+    api.close()
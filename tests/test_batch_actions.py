@@ -0,0 +1,86 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, ResolutionPolicy
+from browser import (ActionPlanner, BrowserAction, BrowserActionType, BrowserAgent, BrowserGoalState, BrowserState,
+                     BrowserTab, Coordinate, ScrollBar, _kind)
+
+
+def png():
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 800), (255, 255, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def action(kind, coordinate=None, text=None):
+    return BrowserAction(kind, coordinate, text, "", "toolu_x")
+
+
+class Batch(ActionPlanner):
+    def __init__(self, actions):
+        self.actions = actions
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        return self.actions
+
+
+def make_agent(actions, url_after=None):
+    """Agent whose apply_action records (action, state) and may change the URL after the first action."""
+    agent = BrowserAgent.__new__(BrowserAgent)
+    agent.page = SimpleNamespace(url="https://example.com/")
+    agent.planner = Batch(actions)
+    agent.history, agent.success_predicates = [], []
+    agent._zoom_state, agent._mouse_pos = None, Coordinate(1, 1)
+    agent._status = BrowserGoalState.RUNNING
+    agent.applied = []
+    state = BrowserState(png(), 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)],
+                         "tab-0", Coordinate(1, 1))
+
+    async def get_state():
+        return state
+
+    async def get_action(current):
+        return agent.planner.actions
+
+    async def apply_action(act, current):
+        agent.applied.append((act, current))
+        if _kind(act.action) == "mouse_move":
+            agent._mouse_pos = act.coordinate
+        if url_after is not None:
+            agent.page.url = url_after
+        return True
+
+    agent.get_state, agent.get_action, agent.apply_action = get_state, get_action, apply_action
+    return agent, state
+
+
+def test_batch_runs_in_order_on_an_unchanged_page():
+    agent, _ = make_agent([action(BrowserActionType.TYPE, text="vue"), action(BrowserActionType.KEY, text="Return")])
+    asyncio.run(agent.step())
+    assert [a.text for a, _ in agent.applied] == ["vue", "Return"]
+
+
+def test_batch_stops_when_the_url_changes():
+    agent, _ = make_agent([action(BrowserActionType.KEY, text="Return"), action(BrowserActionType.LEFT_CLICK),
+                           action(BrowserActionType.TYPE, text="late")], url_after="https://example.com/results")
+    asyncio.run(agent.step())
+    assert [a.text for a, _ in agent.applied] == ["Return"]
+
+
+def test_click_after_batched_move_sees_the_new_cursor_and_keeps_its_scaling():
+    agent, state = make_agent([action(BrowserActionType.MOUSE_MOVE, Coordinate(300, 200)),
+                               action(BrowserActionType.LEFT_CLICK)])
+    planner = AnthropicPlanner(AnthropicPlannerOptions(resolution_policy=ResolutionPolicy(image_token_budget=500)))
+    planner.start_run()
+    planner.set_scaling(state, planner.choose_resolution(state, []))
+    asyncio.run(agent.step())
+
+    (_, move_state), (_, click_state) = agent.applied
+    assert move_state is state
+    assert click_state.mouse == Coordinate(300, 200)
+    # the click's state is a copy, but the model saw the same capture at the same size
+    assert planner.scaling_for(click_state) == planner.scaling_for(state)
+    assert planner.scaling_for(click_state).new_size.x < 1280
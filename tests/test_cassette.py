@@ -0,0 +1,87 @@
+import asyncio
+import json
+from dataclasses import replace
+
+import pytest
+
+from browser import ActionPlanner, BrowserAction, BrowserActionType, BrowserStep, Coordinate
+from cassette import RecordingPlanner, ReplayPlanner, request_fingerprint
+from test_trajectories import make_step
+
+
+class Scripted(ActionPlanner):
+    def __init__(self, actions):
+        self.actions = list(actions)
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        return self.actions.pop(0)
+
+
+def click(x, y):
+    return BrowserAction(BrowserActionType.LEFT_CLICK, Coordinate(x, y), None, "click", "toolu_1")
+
+
+def run(planner, goal, steps):
+    history, actions = [], []
+    for url in steps:
+        state = make_step(url, "left_click").state
+        action = asyncio.run(planner.plan_action(goal, "None", [], state, list(history)))
+        actions.append(action)
+        first = action[0] if isinstance(action, list) else action
+        history.append(BrowserStep(state, first))
+    return actions
+
+
+def test_fingerprint_ignores_screenshot_but_not_url_or_trace():
+    a = make_step("https://a.test/", "left_click")
+    repainted = replace(a.state, screenshot=b"other pixels")
+    assert request_fingerprint("g", "c", a.state, []) == request_fingerprint("g", "c", repainted, [])
+    other_url = make_step("https://b.test/", "left_click").state
+    assert request_fingerprint("g", "c", a.state, []) != request_fingerprint("g", "c", other_url, [])
+    assert request_fingerprint("g", "c", a.state, []) != request_fingerprint("g", "c", a.state, [a])
+
+
+def test_recorded_run_replays_identically(tmp_path):
+    path = str(tmp_path / "runs" / "c.jsonl")
+    urls = ["https://a.test/", "https://a.test/x", "https://a.test/y"]
+    live = [click(1, 2), [click(3, 4), click(5, 6)], BrowserAction(BrowserActionType.SUCCESS, None, None, "", "")]
+    recorded = run(RecordingPlanner(Scripted(live), path), "g", urls)
+    with open(path, encoding="utf-8") as f:
+        assert [e["step"] for e in map(json.loads, f)] == [0, 1, 2]
+
+    replay = ReplayPlanner(path, latency_s=0)
+    assert run(replay, "g", urls) == recorded
+    assert (replay.hits, replay.misses) == (3, 0)
+
+
+def test_unknown_request_falls_back_in_order_unless_strict(tmp_path):
+    path = str(tmp_path / "c.jsonl")
+    run(RecordingPlanner(Scripted([click(1, 1), click(2, 2)]), path), "g", ["https://a.test/", "https://a.test/x"])
+
+    replay = ReplayPlanner(path, latency_s=0)
+    actions = run(replay, "other goal", ["https://z.test/", "https://z.test/"])
+    assert [a.coordinate for a in actions] == [Coordinate(1, 1), Coordinate(2, 2)]
+    assert replay.misses == 2
+    with pytest.raises(KeyError):
+        run(replay, "other goal", ["https://z.test/"])
+
+    with pytest.raises(KeyError):
+        run(ReplayPlanner(path, strict=True), "other goal", ["https://z.test/"])
+
+
+def test_recorded_latency_is_replayed_by_default(tmp_path, monkeypatch):
+    path = str(tmp_path / "c.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"fingerprint": "x", "step": 0, "latency_s": 1.5,
+                            "action": {"action": "success", "coordinate": None, "text": None}}) + "\n")
+    slept = []
+
+    async def fake_sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    state = make_step("https://a.test/", "left_click").state
+    asyncio.run(ReplayPlanner(path).plan_action("g", "None", [], state, []))
+    asyncio.run(ReplayPlanner(path, latency_s=0).plan_action("g", "None", [], state, []))
+    asyncio.run(ReplayPlanner(path, latency_s=0.25).plan_action("g", "None", [], state, []))
+    assert slept == [1.5, 0.25]
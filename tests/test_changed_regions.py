@@ -0,0 +1,89 @@
+import base64
+import io
+
+from PIL import Image, ImageDraw
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions
+from browser import BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab, Coordinate, ScrollBar
+
+
+def frame(box=None, fill=(0, 0, 0)):
+    img = Image.new("RGB", (1280, 800), (255, 255, 255))
+    if box:
+        ImageDraw.Draw(img).rectangle(box, fill=fill)
+    return img
+
+
+def encode(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def make_state(img):
+    return BrowserState(encode(img), 800, 1280, ScrollBar(0, 1),
+                        [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)], "tab-0", Coordinate(1, 1))
+
+
+def planner(**options):
+    p = AnthropicPlanner(AnthropicPlannerOptions(crop_changed_regions=True, **options))
+    p.debug_img_path = None
+    p.start_run()
+    return p
+
+
+def region(p, base, current):
+    p._last_sent_frame = base
+    return p.changed_region(current)
+
+
+def test_box_is_padded_around_the_changed_pixels():
+    # PIL rectangles include both corners, getbbox() ends one past the last pixel
+    assert region(planner(), frame(), frame((100, 200, 149, 219))) == (84, 184, 166, 236)
+    assert region(planner(crop_padding=0), frame(), frame((100, 200, 149, 219))) == (100, 200, 150, 220)
+
+
+def test_padding_is_clamped_to_the_frame():
+    assert region(planner(), frame(), frame((0, 790, 9, 799))) == (0, 774, 26, 800)
+
+
+def test_differences_below_the_tolerance_are_noise():
+    faint = frame((100, 200, 149, 219), fill=(240, 240, 240))
+    assert region(planner(), frame(), faint) is None
+    assert region(planner(crop_pixel_tolerance=10), frame(), faint) == (84, 184, 166, 236)
+
+
+def test_without_a_comparable_base_the_whole_frame_changed():
+    p = planner()
+    assert region(p, None, frame()) == (0, 0, 1280, 800)
+    assert region(p, frame().resize((640, 400)), frame()) == (0, 0, 1280, 800)
+
+
+def sent_after(p, frames):
+    """Content of the tool_result carrying the last frame, as if every earlier request went through."""
+    history = []
+    for idx, img in enumerate(frames):
+        state = make_state(img)
+        messages = p.format_final_msg("goal", "None", state, history)
+        p.commit_sent_image()
+        history.append(BrowserStep(state, BrowserAction(BrowserActionType.SCROLL_DOWN, None, None, "", f"toolu_{idx}")))
+    return messages[-1]["content"][0]["content"]
+
+
+def image_size(block):
+    return Image.open(io.BytesIO(base64.b64decode(block["source"]["data"]))).size
+
+
+def test_small_change_is_sent_as_a_crop():
+    content = sent_after(planner(), [frame(), frame((100, 200, 149, 219))])
+    assert "(84,184) to (166,236)" in content[0]["text"]
+    assert image_size(content[-1]) == (82, 52)
+
+
+def test_large_change_falls_back_to_the_full_frame():
+    # 0.35 of the frame is exceeded, so a crop would save little and lose context
+    content = sent_after(planner(), [frame(), frame((0, 0, 899, 799))])
+    assert "Only the changed region" not in content[0]["text"]
+    assert image_size(content[-1]) == (1280, 800)
+    content = sent_after(planner(crop_max_area_ratio=0.9), [frame(), frame((0, 0, 899, 799))])
+    assert "Only the changed region" in content[0]["text"]
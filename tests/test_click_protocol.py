@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions
+from browser import BrowserActionType, BrowserState, BrowserTab, Coordinate, ScrollBar
+
+STATE = BrowserState(b"", 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)],
+                     "tab-0", Coordinate(1, 1))
+
+
+def computer_tool(planner):
+    return next(t for t in planner.build_tools(STATE) if t["name"] == "computer")
+
+
+def test_move_then_click_keeps_the_2024_tool():
+    planner = AnthropicPlanner()
+    assert computer_tool(planner)["type"] == "computer_20241022"
+    assert planner.beta_flag == ["computer-use-2024-10-22"]
+
+
+def test_coordinate_clicks_use_a_tool_version_that_accepts_them():
+    planner = AnthropicPlanner(AnthropicPlannerOptions(click_protocol="coordinate"))
+    assert computer_tool(planner)["type"] == "computer_20250124"
+    assert planner.beta_flag == ["computer-use-2025-01-24"]
+
+    block = SimpleNamespace(type="tool_use", name="computer", id="toolu_1",
+                            input={"action": "left_click", "coordinate": [640, 400]})
+    action = planner.parse_tool_use(block, "", planner.scaling_for(STATE), STATE)
+    assert action.action == BrowserActionType.LEFT_CLICK and action.coordinate == Coordinate(640, 400)
+
+    block.input = {"action": "scroll", "coordinate": [640, 400], "scroll_direction": "down", "scroll_amount": 5}
+    assert planner.parse_tool_use(block, "", planner.scaling_for(STATE), STATE).action == BrowserActionType.SCROLL_DOWN
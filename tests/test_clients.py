@@ -0,0 +1,66 @@
+import asyncio
+import gc
+
+import httpx
+
+from clients import ClientRegistry
+
+
+def create(client):
+    return client.messages.create(model="stub", max_tokens=16, messages=[{"role": "user", "content": "hi"}])
+
+
+def test_limits_come_from_the_sdks_http_library():
+    assert isinstance(ClientRegistry(concurrent_agents=3).limits(), httpx.Limits)
+
+
+def test_sequential_requests_reuse_one_connection(stub_api):
+    registry = ClientRegistry(concurrent_agents=2)
+
+    async def run():
+        for _ in range(12):
+            await create(registry.get("k", stub_api.url))
+
+    asyncio.run(run())
+    assert stub_api.requests == 12
+    assert stub_api.connections == 1
+    snap = registry.stats.snapshot()
+    assert snap["requests"] == 12 and snap["connections_opened"] == 1
+    assert snap["max_requests_on_one_connection"] == 12
+
+
+def test_concurrent_agents_stay_within_the_keepalive_pool(stub_api):
+    registry = ClientRegistry(concurrent_agents=3)
+    stub_api.delays = [0.2] * 3
+
+    async def agent():
+        for _ in range(4):
+            await create(registry.get("k", stub_api.url))
+
+    async def run():
+        await asyncio.gather(*(agent() for _ in range(3)))
+
+    asyncio.run(run())
+    assert stub_api.requests == 12
+    assert stub_api.connections == 3
+
+
+def test_pools_of_closed_loops_are_dropped(stub_api):
+    registry = ClientRegistry()
+
+    async def run():
+        await create(registry.get("k", stub_api.url))
+        # the retry variant shares the pool of the plain client
+        assert registry.get("k", stub_api.url, max_retries=0)._client is registry.get("k", stub_api.url)._client
+
+    asyncio.run(run())
+    asyncio.run(run())
+    gc.collect()
+    assert len(registry._clients) == 1
+
+    async def close():
+        registry.get("k", stub_api.url)
+        await registry.aclose()
+
+    asyncio.run(close())
+    assert registry._clients == {}
@@ -0,0 +1,151 @@
+import asyncio
+from types import SimpleNamespace
+
+from anthropicAgent import AnthropicPlanner
+from browser import ActionPlanner, BrowserActionType, BrowserStep, Coordinate
+from consent import DEFAULT_CONSENT_RULES, ConsentPlanner, ConsentRule
+from test_zoom import make_state
+
+BOX = {"x": 100, "y": 200, "width": 80, "height": 30}
+
+
+class FakeFrame:
+    """evaluate answers the probe from `matches` (rule name -> selector) for the rules it is sent."""
+
+    def __init__(self, url, matches=None, fail=False):
+        self.url = url
+        self.matches = matches or {}
+        self.fail = fail
+        self.probed: list[list[str]] = []
+
+    async def evaluate(self, js, rules):
+        if self.fail:
+            raise RuntimeError("frame detached")
+        self.probed.append([DEFAULT_CONSENT_RULES[r["index"]].name for r in rules])
+        for rule in rules:
+            name = DEFAULT_CONSENT_RULES[rule["index"]].name
+            if name in self.matches:
+                return {"rule": rule["index"], "selector": self.matches[name]}
+        return None
+
+    async def query_selector(self, selector):
+        return SimpleNamespace(bounding_box=self._box)
+
+    async def _box(self):
+        return BOX
+
+
+class Inner(ActionPlanner):
+    def __init__(self):
+        self.calls = 0
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        self.calls += 1
+        return "inner"
+
+
+def make_planner(*frames, url="https://news.example.com/", max_attempts=2):
+    inner = Inner()
+    planner = ConsentPlanner(inner, max_attempts=max_attempts)
+    planner.attach(SimpleNamespace(page=SimpleNamespace(url=url, frames=list(frames))))
+    return planner, inner
+
+
+def plan(planner, history=("x",)):
+    return asyncio.run(planner.plan_action("goal", "", [], None, list(history)))
+
+
+def test_matched_rule_clicks_button_centre():
+    planner, inner = make_planner(FakeFrame("https://news.example.com/", {"onetrust": "#onetrust-accept-btn-handler"}))
+    move, click = plan(planner)
+    assert move.action == BrowserActionType.MOUSE_MOVE and move.coordinate == Coordinate(140, 215)
+    # computer_20241022 takes no coordinate on clicks; the click lands where the move left the cursor
+    assert click.action == BrowserActionType.LEFT_CLICK and click.coordinate is None
+    assert "onetrust" in click.reasoning
+    assert move.id.startswith("toolu_") and click.id.startswith("toolu_") and move.id != click.id
+    assert inner.calls == 0
+
+
+def test_replayed_consent_click_fits_the_default_tool():
+    planner, _ = make_planner(FakeFrame("https://news.example.com/", {"onetrust": "#onetrust-accept-btn-handler"}))
+    state = make_state()
+    anthropic = AnthropicPlanner()
+    replayed = [anthropic.browser_hist_step_to_action(BrowserStep(state, a)) for a in plan(planner)]
+    assert replayed[0]["action"] == "mouse_move" and "coordinate" in replayed[0]
+    assert replayed[1] == {"action": "left_click"}
+
+
+def test_no_banner_defers_to_inner_planner():
+    planner, inner = make_planner(FakeFrame("https://news.example.com/"))
+    assert plan(planner) == "inner"
+    assert inner.calls == 1
+    assert planner.report() == {"rule_hits": {}, "saved_steps": 0, "deferred": 1}
+
+
+def test_frame_url_rules_only_probe_matching_frames():
+    main = FakeFrame("https://news.example.com/")
+    consent_frame = FakeFrame("https://cdn.privacy-mgmt.com/index.html", {"sourcepoint": 'button[title="Accept all"]'})
+    planner, _ = make_planner(main, consent_frame)
+    action = plan(planner)[-1]
+    assert "sourcepoint" not in main.probed[0]
+    assert "sourcepoint" in consent_frame.probed[0]
+    assert "sourcepoint" in action.reasoning
+
+
+def test_detached_frame_is_skipped():
+    planner, _ = make_planner(FakeFrame("https://a.example.com/", fail=True),
+                              FakeFrame("https://news.example.com/", {"didomi": "#didomi-notice-agree-button"}))
+    assert "didomi" in plan(planner)[-1].reasoning
+
+
+def test_banner_that_stays_is_left_to_the_model_after_max_attempts():
+    frame = FakeFrame("https://news.example.com/", {"cookiebot": "#CybotCookiebotDialogBodyButtonAccept"})
+    planner, inner = make_planner(frame, max_attempts=2)
+    results = [plan(planner) for _ in range(3)]
+    assert [r == "inner" for r in results] == [False, False, True]
+    assert "cookiebot" not in frame.probed[-1]
+    assert planner.report() == {"rule_hits": {"cookiebot": 2}, "saved_steps": 2, "deferred": 1}
+
+    # a new run starts with fresh attempts
+    assert plan(planner, history=()) != "inner"
+
+
+def test_attempts_are_counted_per_url():
+    frame = FakeFrame("https://news.example.com/", {"bing": "#bnp_btn_accept"})
+    planner, _ = make_planner(frame, max_attempts=1)
+    plan(planner)
+    assert plan(planner) == "inner"
+    planner.agent.page.url = "https://news.example.com/other"
+    assert plan(planner) != "inner"
+
+
+def test_rule_order_and_custom_rules():
+    rules = (ConsentRule("mine", selectors=("#ok",)),)
+    planner = ConsentPlanner(Inner(), rules=rules)
+    assert [c["selectors"] for c in planner._candidates("https://x.test/")] == [["#ok"]]
+    assert [r.name for r in DEFAULT_CONSENT_RULES][-1] == "generic-banner"
+
+
+BANNER = """
+<div id="cookie-banner"><p>We use cookies</p><button id="reject">Reject</button><button>Accept all</button></div>
+<main><button>OK</button><a href="#">Agree</a></main>
+"""
+
+
+def test_probe_matches_generic_banner_inside_scope_only(in_page):
+    async def fn(page):
+        planner = ConsentPlanner(Inner())
+        return await planner.find_banner(page)
+
+    rule, centre = in_page(BANNER, fn)
+    assert rule.name == "generic-banner"
+    assert centre.x > 0 and centre.y > 0
+
+
+def test_probe_ignores_hidden_vendor_button(in_page):
+    html = '<button id="onetrust-accept-btn-handler" style="display:none">Accept</button><p>text</p>'
+
+    async def fn(page):
+        return await ConsentPlanner(Inner()).find_banner(page)
+
+    assert in_page(html, fn) is None
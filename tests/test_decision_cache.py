@@ -0,0 +1,113 @@
+import asyncio
+import io
+import json
+import threading
+from dataclasses import replace
+
+from PIL import Image
+
+import anthropicAgent
+from browser import (ActionPlanner, BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab,
+                     Coordinate, ScrollBar)
+from decision_cache import CachingPlanner, cache_key
+
+buf = io.BytesIO()
+Image.new("RGB", (1280, 800), (240, 240, 240)).save(buf, format="PNG")
+STATE = BrowserState(buf.getvalue(), 800, 1280, ScrollBar(0, 1),
+                     [BrowserTab("tab-0", "https://example.com/form", "Form", True, False, 0)], "tab-0",
+                     Coordinate(1, 1), dom_signature="https://example.com/form|Form|120")
+
+FORM_FLOW = [
+    BrowserAction(BrowserActionType.LEFT_CLICK, Coordinate(100, 100), None, "", "t1"),
+    BrowserAction(BrowserActionType.TYPE, None, "alice", "", "t2"),
+    BrowserAction(BrowserActionType.LEFT_CLICK, Coordinate(100, 200), None, "", "t3"),
+    BrowserAction(BrowserActionType.TYPE, None, "secret", "", "t4"),
+]
+
+
+class Scripted(ActionPlanner):
+    def __init__(self):
+        self.calls = 0
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        self.calls += 1
+        return FORM_FLOW[len(session_history)]
+
+
+def run_form(planner):
+    async def run():
+        history, planned = [], []
+        for _ in FORM_FLOW:
+            action = await planner.plan_action("fill the form", "", [], STATE, history)
+            planned.append(action)
+            history.append(BrowserStep(STATE, action))
+        return planned
+    return asyncio.run(run())
+
+
+def test_steps_on_the_same_page_get_their_own_keys():
+    history = []
+    keys = set()
+    for action in FORM_FLOW:
+        keys.add(cache_key("fill the form", STATE, history))
+        history.append(BrowserStep(STATE, action))
+    assert len(keys) == len(FORM_FLOW)
+    # a few pixels of jitter in an earlier click still lands on the same key
+    jittered = [BrowserStep(STATE, BrowserAction(BrowserActionType.LEFT_CLICK, Coordinate(102, 99), None, "", "x"))]
+    assert cache_key("g", STATE, history[:1]) == cache_key("g", STATE, jittered)
+
+
+def test_form_flow_replays_each_step_in_order():
+    inner = Scripted()
+    planner = CachingPlanner(inner, verify=lambda before, after, actions: True)
+    run_form(planner)
+    run_form(planner)
+    assert inner.calls == 8
+    replayed = run_form(planner)
+    assert inner.calls == 8
+    assert [(a.action, a.coordinate, a.text) for a in replayed] == [(a.action, a.coordinate, a.text) for a in FORM_FLOW]
+    assert planner.stats.invalidations == 0
+
+
+def test_saves_are_debounced_and_written_off_the_loop(tmp_path, monkeypatch):
+    path = tmp_path / "decisions.json"
+    planner = CachingPlanner(Scripted(), verify=lambda *a: True, path=str(path), save_delay_s=0.05)
+    writes = []
+    original = planner._write
+    monkeypatch.setattr(planner, "_write", lambda snapshot: (writes.append(len(snapshot)), original(snapshot)))
+
+    async def run():
+        history = []
+        for action in FORM_FLOW:
+            await planner.plan_action("fill the form", "", [], STATE, history)
+            history.append(BrowserStep(STATE, action))
+        assert writes == []  # nothing written on the loop while planning
+        await asyncio.sleep(0.2)
+
+    asyncio.run(run())
+    assert writes == [4]
+    assert len(json.loads(path.read_text())) == 4
+    assert len(CachingPlanner(Scripted(), path=str(path)).entries) == 4
+
+
+def test_frame_hashes_are_computed_off_the_loop(monkeypatch):
+    on_loop = []
+    real = anthropicAgent.screenshot_hash
+
+    def recording(shot):
+        on_loop.append(threading.current_thread() is threading.main_thread())
+        return real(shot)
+
+    monkeypatch.setattr(anthropicAgent, "screenshot_hash", recording)
+    fresh = io.BytesIO()
+    Image.new("RGB", (1280, 800), (10, 20, 30)).save(fresh, format="PNG")
+    planner = CachingPlanner(Scripted())
+    state = replace(STATE, screenshot=fresh.getvalue())
+
+    async def run():
+        history = []
+        for _ in range(2):
+            action = await planner.plan_action("fill the form", "", [], state, history)
+            history.append(BrowserStep(state, action))
+    asyncio.run(run())
+    assert on_loop == [False]
@@ -0,0 +1,31 @@
+from utils import dom_outline, mark_elements
+
+FORM = """
+<form>
+  <input type="text" value="alice">
+  <input type="password" id="pw">
+  <input type="password" id="pw2" aria-label="Password">
+  <button>Sign in</button>
+</form>
+"""
+
+
+def test_filled_password_never_in_outline(in_page):
+    async def fn(page):
+        await page.fill("#pw", "hunter2-secret")
+        await page.fill("#pw2", "hunter2-secret")
+        return await dom_outline(page)
+
+    outline = in_page(FORM, fn)
+    assert "hunter2-secret" not in repr(outline)
+    # non-secret values are still reported
+    assert any(item.get("value") == "alice" for item in outline["items"])
+
+
+def test_filled_password_never_in_marks(in_page):
+    async def fn(page):
+        await page.fill("#pw", "hunter2-secret")
+        return await mark_elements(page)
+
+    marks = in_page(FORM, fn)
+    assert marks and "hunter2-secret" not in repr(marks)
@@ -0,0 +1,121 @@
+import asyncio
+import io
+from dataclasses import replace
+from types import SimpleNamespace
+
+from PIL import Image
+from playwright.async_api import Error as PwError
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions
+from browser import (BrowserAction, BrowserActionType, BrowserAgent, BrowserState, BrowserTab, Coordinate,
+                     ScrollBar)
+from utils import find_in_page
+
+LONG_PAGE = """
+<p style="margin-top:3000px">the Total is below</p>
+<p hidden>Total hidden</p>
+<p style="visibility:hidden">Total invisible</p>
+<script>var Total = 1;</script>
+<p>Grand Total: 42</p>
+<iframe srcdoc="<p>Total inside a frame</p>"></iframe>
+"""
+
+
+def make_state(width=1280, height=800):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 200, 200)).save(buf, format="PNG")
+    return BrowserState(buf.getvalue(), height, width, ScrollBar(0, 1),
+                        [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)], "tab-0", Coordinate(1, 1))
+
+
+def test_search_skips_hidden_text_and_scrolls_to_the_match(in_page):
+    async def fn(page):
+        await page.wait_for_timeout(200)  # let the srcdoc frame load
+        result = await find_in_page(page, "Total")
+        return result, await page.evaluate("scrollY")
+
+    result, scroll_y = in_page(LONG_PAGE, fn)
+    snippets = [m["snippet"] for m in result["matches"]]
+    assert result["count"] == 3
+    assert not any("hidden" in s or "invisible" in s or "var" in s for s in snippets)
+    assert "Total inside a frame" in snippets
+    # the first exact match sits 3000px down, so the page had to scroll to it
+    best = result["matches"][result["scrolled_to"]]
+    assert scroll_y > 0
+    assert 0 <= best["box"][1] < result["viewport"][1]
+
+
+def test_case_insensitive_match_is_a_fallback(in_page):
+    result = in_page("<p>TOTAL</p><p style='margin-top:3000px'>total</p>", lambda page: find_in_page(page, "total"))
+    assert result["count"] == 2 and result["scrolled_to"] == 1
+
+
+def test_empty_query_finds_nothing(in_page):
+    assert in_page("<p>text</p>", lambda page: find_in_page(page, ""))["count"] == 0
+
+
+def test_page_errors_become_a_tool_error():
+    class Navigating:
+        async def evaluate(self, *_):
+            raise PwError("Execution context was destroyed\nmore detail")
+
+    result = asyncio.run(find_in_page(Navigating(), "x"))
+    assert result == {"count": 0, "scrolled_to": None, "matches": [],
+                      "error": "Execution context was destroyed"}
+
+
+def parse(text):
+    planner = AnthropicPlanner(AnthropicPlannerOptions(find_in_page_tool=True))
+    state = make_state()
+    block = SimpleNamespace(type="tool_use", name="find_in_page", id="toolu_1", input={"text": text})
+    return planner.parse_tool_use(block, "", planner.scaling_for(state), state)
+
+
+def test_tool_call_becomes_a_find_action():
+    action = parse("Total")
+    assert action.action == BrowserActionType.FIND_IN_PAGE and action.text == "Total"
+    assert parse("").action == BrowserActionType.FAILURE
+
+
+def test_agent_keeps_the_result_for_the_next_step():
+    agent = BrowserAgent.__new__(BrowserAgent)
+    canned = {"count": 1, "scrolled_to": 0, "matches": [{"index": 0, "box": [10, 20, 30, 10], "snippet": "Total"}]}
+
+    async def evaluate(script, args):
+        assert args[0] == "Total"
+        return canned
+
+    agent.page = SimpleNamespace(keyboard=None, mouse=None, evaluate=evaluate)
+    agent._zoom_state, agent._tool_output = None, None
+    action = BrowserAction(BrowserActionType.FIND_IN_PAGE, None, "Total", "", "toolu_1")
+    asyncio.run(agent.take_action(action, make_state()))
+    assert agent._pop_tool_output() == {"tool": "find_in_page", "query": "Total", **canned}
+
+
+def output(**result):
+    return {"tool": "find_in_page", "query": "Total", **result}
+
+
+def test_result_text_lists_visible_matches_in_screenshot_coordinates():
+    planner = AnthropicPlanner()
+    # a 2560x1600 viewport is sent at 1280x800, so browser boxes are halved
+    state = replace(make_state(2560, 1600), tool_output=output(count=3, scrolled_to=1, matches=[
+        {"index": 0, "box": [100, -50, 40, 20], "snippet": "above"},
+        {"index": 1, "box": [200, 400, 40, 20], "snippet": "Grand Total: 42"},
+        {"index": 2, "box": [300, 1700, 40, 20], "snippet": "below"},
+    ]))
+    text = planner.format_tool_output(state)
+    assert text.splitlines() == [
+        'find_in_page "Total": 3 match(es); scrolled to match 1.',
+        '- match 1 at (110,205): "Grand Total: 42"',
+        "(1 listed match(es) above and 1 below the visible area)",
+    ]
+
+
+def test_result_text_for_no_match_and_errors():
+    planner = AnthropicPlanner()
+    state = make_state()
+    assert planner.format_tool_output(replace(state, tool_output=output(count=0, matches=[]))) == \
+        'find_in_page "Total": no matches on the page.'
+    assert planner.format_tool_output(replace(state, tool_output=output(error="navigating"))) == \
+        'find_in_page "Total" failed: navigating'
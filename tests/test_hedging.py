@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, HedgePolicy
+from scheduler import PlannerScheduler
+
+REQUEST = dict(model="stub", max_tokens=16, messages=[{"role": "user", "content": "hi"}],
+               betas=["computer-use-2024-10-22"])
+
+
+def hedging_planner(url, scheduler=None):
+    policy = HedgePolicy(min_samples=3, min_delay_s=0.2)
+    planner = AnthropicPlanner(AnthropicPlannerOptions(hedge_policy=policy, base_url=url, scheduler=scheduler,
+                                                       shared_client=False))
+    for _ in range(3):
+        planner.latency.record(0.05)
+    return planner
+
+
+def timed(coro):
+    started = time.perf_counter()
+    result = asyncio.run(coro)
+    return result, time.perf_counter() - started
+
+
+def test_slow_primary_is_beaten_by_hedge(stub_api):
+    stub_api.delays = [3.0, 0.0]
+    planner = hedging_planner(stub_api.url)
+    response, elapsed = timed(planner.send_request(REQUEST))
+    assert response.content[0].text == "reply 2"
+    assert elapsed < 2.0
+    assert (planner.hedged_requests, planner.hedge_wins) == (1, 1)
+    # the cancelled primary was sent too, so both requests' input is billed
+    assert planner.hedged_input_token_usage == 100
+    assert planner.input_token_usage == 200
+
+
+def test_fast_primary_fires_no_hedge(stub_api):
+    planner = hedging_planner(stub_api.url)
+    asyncio.run(planner.create_message(REQUEST))
+    assert planner.hedged_requests == 0 and stub_api.requests == 1
+
+
+def test_hedge_waits_for_the_scheduler(stub_api):
+    # one request per minute: the primary takes the only slot, so the hedge stays queued
+    scheduler = PlannerScheduler(requests_per_minute=1)
+    stub_api.delays = [1.0]
+    planner = hedging_planner(stub_api.url, scheduler)
+
+    async def run():
+        return await scheduler.submit(lambda: planner.send_request(REQUEST, (50, 16)), 50, 16)
+
+    response, elapsed = timed(run())
+    assert response.content[0].text == "reply 1"
+    assert 1.0 <= elapsed < 3.0
+    assert stub_api.requests == 1
+    assert scheduler.stats.submitted == 2
+    # a hedge that never left the queue costs nothing
+    assert planner.hedged_input_token_usage == 0
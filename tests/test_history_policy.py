@@ -0,0 +1,99 @@
+import io
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, HistoryPolicy
+from browser import BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab, Coordinate, ScrollBar
+
+
+def make_state(url):
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 800), (200, 200, 200)).save(buf, format="PNG")
+    return BrowserState(buf.getvalue(), 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", url, "t", True, False, 0)],
+                        "tab-0", Coordinate(1, 1))
+
+
+def planner(**policy):
+    p = AnthropicPlanner(AnthropicPlannerOptions(history_policy=HistoryPolicy(**policy)))
+    p.debug_img_path = None
+    p.start_run()
+    return p
+
+
+def request_after(p, steps):
+    """The request format_final_msg builds after `steps` scrolls, one page per step."""
+    history = [
+        BrowserStep(make_state(f"https://example.com/{i}"),
+                    BrowserAction(BrowserActionType.SCROLL_DOWN, None, None, "", f"toolu_{i}"))
+        for i in range(steps)
+    ]
+    state = make_state(f"https://example.com/{steps}")
+    return p.format_final_msg("goal", "None", state, history), state
+
+
+def test_under_budget_history_is_replayed_verbatim():
+    p = planner(token_budget=10 ** 6, keep_last=2)
+    messages, state = request_after(p, 5)
+    assert p.apply_history_policy(messages, state, 0) is messages
+
+
+def test_older_steps_fold_into_a_summary():
+    p = planner(token_budget=1, keep_last=2)
+    messages, state = request_after(p, 5)
+    folded = p.apply_history_policy(messages, state, 0)
+
+    # (5 - keep_last) // 2 * 2 = 2 steps folded; steps 3..5 and the fresh state are kept
+    assert folded[3:] == messages[p.conversation.step_slice(2) + 1:]
+    assert len(folded) == 2 + len(messages) - p.conversation.step_slice(2)
+    summary = folded[0]["content"][-1]["text"]
+    assert summary.startswith("Summary of the first 2 steps")
+    assert "URLs visited: https://example.com/0, https://example.com/1" in summary
+    assert "2. scroll_down on https://example.com/1" in summary
+    assert "example.com/2" not in summary
+
+
+def test_first_kept_result_answers_the_opening_call():
+    p = planner(token_budget=1, keep_last=2)
+    messages, state = request_after(p, 5)
+    folded = p.apply_history_policy(messages, state, 0)
+    opening_id = messages[1]["content"][-1]["id"]
+    assert folded[2]["content"][0]["tool_use_id"] == opening_id
+    # the buffer itself is untouched, so the next step still appends to the full history
+    assert messages[p.conversation.step_slice(2)]["content"][0]["tool_use_id"] == "toolu_1"
+
+
+def test_fold_boundary_moves_in_keep_last_chunks():
+    def folded_steps(steps):
+        p = planner(token_budget=1, keep_last=2)
+        messages, state = request_after(p, steps)
+        summary = p.apply_history_policy(messages, state, 0)[0]["content"][-1]["text"]
+        return int(summary.split()[4])
+
+    assert [folded_steps(n) for n in (4, 5, 6, 7)] == [2, 2, 4, 4]
+
+
+def test_summary_keeps_only_the_latest_lines():
+    p = planner(token_budget=1, keep_last=1, max_summary_lines=3)
+    messages, state = request_after(p, 8)
+    summary = p.apply_history_policy(messages, state, 0)[0]["content"][-1]["text"]
+    lines = summary.splitlines()[2:]
+    assert lines[0] == "... 4 earlier steps omitted"
+    assert [line.split(".")[0] for line in lines[1:]] == ["5", "6", "7"]
+
+
+def test_cache_breakpoints_mark_system_tools_and_history_prefix():
+    p = planner()
+    messages, _ = request_after(p, 2)
+    tools = [{"name": "a"}, {"name": "b"}]
+    system, marked_tools, marked = p.apply_cache_breakpoints("system", tools, messages)
+
+    ephemeral = {"type": "ephemeral"}
+    assert system == [{"type": "text", "text": "system", "cache_control": ephemeral}]
+    assert "cache_control" not in marked_tools[0] and marked_tools[1]["cache_control"] == ephemeral
+    # the breakpoint ends the replayed prefix; the fresh state stays outside it
+    assert marked[-2]["content"][-1]["cache_control"] == ephemeral
+    assert all("cache_control" not in block for block in marked[-1]["content"])
+    assert all("cache_control" not in block for m in marked[:-2] for block in m["content"])
+    # the inputs are reused on the next step and must not carry the marker
+    assert "cache_control" not in tools[1]
+    assert "cache_control" not in messages[-2]["content"][-1]
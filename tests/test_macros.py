@@ -0,0 +1,116 @@
+import asyncio
+from dataclasses import replace
+
+from browser import BrowserGoalState
+from macros import Checkpoint, MacroLibrary, checkpoint_matches, record_macro, replay_macro, run_with_macros
+from test_trajectories import make_step
+
+GOAL = "give me the wikipedia page of New York City"
+PARAMS = {"topic": "New York City"}
+
+
+def recorded_history():
+    return [
+        make_step("https://www.wikipedia.org/", "left_click"),
+        make_step("https://www.wikipedia.org/", "type", "New York City"),
+        make_step("https://www.wikipedia.org/", "zoom"),
+        make_step("https://en.wikipedia.org/w/index.php?search=New+York+City", "left_click"),
+        # the planner's SUCCESS answer ends the run and is never appended to the history
+        make_step("https://en.wikipedia.org/wiki/New_York_City", "scroll_down"),
+    ]
+
+
+def test_record_templatizes_goal_text_and_urls():
+    macro = record_macro(GOAL, recorded_history(), PARAMS)
+    assert macro.goal_template == "give me the wikipedia page of {topic}"
+    assert [s.action["action"] for s in macro.steps] == ["left_click", "type", "left_click", "scroll_down"]
+    assert macro.steps[1].action["text"] == "{topic}"
+    assert macro.steps[2].checkpoint.url_pattern == "https://en.wikipedia.org/w/index.php[?]search=*"
+    assert macro.steps[3].checkpoint.url_pattern == "https://en.wikipedia.org/wiki/*"
+
+
+def test_library_matches_goal_and_reads_parameters(tmp_path):
+    library = MacroLibrary(str(tmp_path / "macros.json"))
+    library.add(record_macro(GOAL, recorded_history(), PARAMS))
+    macro, params = library.match("Give me the Wikipedia page of Vue")
+    assert params == {"topic": "Vue"}
+    assert library.match(GOAL)[1] == PARAMS
+    assert library.match("what is the weather in Paris") is None
+
+    reloaded = MacroLibrary(library.path)
+    assert reloaded.macros[macro.goal_template].to_dict() == macro.to_dict()
+
+
+def test_checkpoint_compares_dom_signature_only_for_exact_replays():
+    state = replace(make_step("https://en.wikipedia.org/wiki/Vue.js", "left_click").state, dom_signature="b")
+    checkpoint = Checkpoint("https://en.wikipedia.org/wiki/*", dom_sig="a")
+    assert checkpoint_matches(checkpoint, state, exact=False)
+    assert not checkpoint_matches(checkpoint, state, exact=True)
+    assert not checkpoint_matches(Checkpoint("https://example.com/*"), state, exact=False)
+
+
+class FakeAgent:
+    """Walks through `urls` one applied action at a time."""
+
+    def __init__(self, goal, urls):
+        self.goal = goal
+        self.urls = list(urls)
+        self.applied = []
+        self.history = []
+        self.status = BrowserGoalState.INITIAL
+
+    async def get_state(self):
+        return make_step(self.urls[min(len(self.applied), len(self.urls) - 1)], "left_click").state
+
+    async def apply_action(self, action, state):
+        self.applied.append(action)
+        return True
+
+    async def start(self):
+        self.history = [make_step(u, "left_click") for u in self.urls]
+        self.status = BrowserGoalState.SUCCESS
+
+
+def test_replay_fills_parameters_and_stops_at_first_mismatch():
+    macro = record_macro(GOAL, recorded_history(), PARAMS)
+    agent = FakeAgent("give me the wikipedia page of Vue", [
+        "https://www.wikipedia.org/", "https://www.wikipedia.org/",
+        "https://en.wikipedia.org/w/index.php?search=Vue", "https://example.com/unexpected",
+    ])
+    done = asyncio.run(replay_macro(agent, macro, {"topic": "Vue"}, step_delay_ms=0))
+    assert done == 3
+    assert agent.applied[1].text == "Vue"
+
+
+def test_typed_text_outside_the_parameters_is_not_stored(tmp_path):
+    history = [
+        make_step("https://example.com/login", "type", "alice@example.com"),
+        make_step("https://example.com/login", "type", "hunter2"),
+        make_step("https://example.com/login", "type", "wikipedia Vue"),
+    ]
+    macro = record_macro("log in and open the wikipedia page of Vue", history, {"topic": "Vue"})
+    assert [s.redacted for s in macro.steps] == [True, True, False]
+    assert macro.steps[2].action["text"] == "wikipedia {topic}"
+    library = MacroLibrary(str(tmp_path / "macros.json"))
+    library.add(macro)
+    with open(library.path, encoding="utf-8") as f:
+        saved = f.read()
+    assert "hunter2" not in saved and "alice" not in saved
+    assert MacroLibrary(library.path).macros[macro.goal_template].steps[0].redacted
+
+    agent = FakeAgent("log in and open the wikipedia page of Vue", ["https://example.com/login"])
+    assert asyncio.run(replay_macro(agent, macro, {"topic": "Vue"}, step_delay_ms=0)) == 0
+    assert agent.applied == []
+
+    kept = record_macro("log in", history, keep_typed_text=True)
+    assert not any(s.redacted for s in kept.steps) and kept.steps[1].action["text"] == "hunter2"
+
+
+def test_run_with_macros_counts_fallbacks_and_rerecords(tmp_path):
+    library = MacroLibrary(str(tmp_path / "macros.json"))
+    library.add(record_macro(GOAL, recorded_history(), PARAMS))
+    agent = FakeAgent("give me the wikipedia page of Vue", ["https://example.com/"])
+    asyncio.run(run_with_macros(agent, library, step_delay_ms=0))
+    macro = library.macros["give me the wikipedia page of {topic}"]
+    assert (macro.replays, macro.fallbacks) == (1, 1)
+    assert MacroLibrary(library.path).macros[macro.goal_template].replays == 1
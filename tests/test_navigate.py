@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+from browser import BrowserAction, BrowserActionType, BrowserAgent
+from test_zoom import make_state
+
+
+class FakePage:
+    """goto follows the redirect map like a browser would; history only grows on goto."""
+
+    keyboard = mouse = None
+
+    def __init__(self, redirects=None):
+        self.redirects = redirects or {}
+        self.history = ["about:blank"]
+
+    @property
+    def url(self):
+        return self.history[-1]
+
+    async def goto(self, url, **kwargs):
+        request = None
+        while True:
+            request = SimpleNamespace(url=url, redirected_from=request)
+            if url not in self.redirects:
+                break
+            url = self.redirects[url]
+        self.history.append(url)
+        return SimpleNamespace(request=request)
+
+    async def go_back(self, **kwargs):
+        if len(self.history) > 1:
+            self.history.pop()
+
+    async def evaluate(self, *args, **kwargs):
+        raise RuntimeError("no layout in a fake page")
+
+
+def make_agent(page, allow=(), deny=()):
+    agent = BrowserAgent.__new__(BrowserAgent)
+    agent.page = page
+    agent._tool_output = None
+    agent.navigate_allow_domains = list(allow)
+    agent.navigate_deny_domains = list(deny)
+    agent.navigate_wait_until = "domcontentloaded"
+    return agent
+
+
+def navigate(agent, url):
+    action = BrowserAction(BrowserActionType.NAVIGATE, None, url, "", "toolu_1")
+    asyncio.run(agent.take_action(action, make_state()))
+    return agent._pop_tool_output()
+
+
+def test_malformed_urls_are_refused_not_raised():
+    agent = make_agent(FakePage())
+    for url in ("http://[::1", "http://example.com:99999", "https://example.com:port/"):
+        assert agent.navigation_blocked(url), url
+    assert agent.navigation_blocked("https://example.com/") is None
+
+
+def test_allow_and_deny_lists():
+    agent = make_agent(FakePage(), allow=["example.com"], deny=["ads.example.com"])
+    assert agent.navigation_blocked("https://docs.example.com/a") is None
+    assert agent.navigation_blocked("https://ads.example.com/")
+    assert agent.navigation_blocked("https://example.org/")
+    assert agent.navigation_blocked("ftp://example.com/")
+
+
+def test_redirect_to_denied_host_is_backed_out_of():
+    page = FakePage({"https://example.com/go": "https://evil.test/landing"})
+    asyncio.run(page.goto("https://example.com/"))
+    agent = make_agent(page, deny=["evil.test"])
+    output = navigate(agent, "example.com/go")
+    assert output["tool"] == "navigate" and "evil.test" in output["error"]
+    assert page.url == "https://example.com/"
+
+
+def test_blocked_hop_in_the_middle_of_a_chain_is_caught():
+    page = FakePage({"https://a.example.com/": "https://tracker.test/r", "https://tracker.test/r": "https://b.example.com/"})
+    agent = make_agent(page, allow=["example.com"])
+    output = navigate(agent, "https://a.example.com/")
+    assert "tracker.test" in output["error"]
+    assert page.url == "about:blank"
+
+
+def test_redirect_with_nothing_to_go_back_to_leaves_blank_page():
+    page = FakePage({"https://example.com/": "https://evil.test/"})
+    page.history = []
+    agent = make_agent(page, deny=["evil.test"])
+    output = navigate(agent, "https://example.com/")
+    assert output["error"]
+    assert page.url == "about:blank"
+
+
+def test_allowed_redirect_is_left_alone():
+    page = FakePage({"https://example.com/": "https://www.example.com/"})
+    agent = make_agent(page, allow=["example.com"])
+    assert navigate(agent, "https://example.com/") is None
+    assert page.url == "https://www.example.com/"
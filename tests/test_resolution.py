@@ -0,0 +1,75 @@
+import io
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, ResolutionPolicy
+from browser import BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab, Coordinate, ScrollBar
+
+
+def png(width=1280, height=800):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 255, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def make_state(width=1280, height=800, url="https://example.com/", dom_signature="sig|100", mouse=Coordinate(1, 1)):
+    return BrowserState(png(width, height), height, width, ScrollBar(0, 1),
+                        [BrowserTab("tab-0", url, "t", True, False, 0)], "tab-0", mouse, dom_signature=dom_signature)
+
+
+def planner(policy=None):
+    p = AnthropicPlanner(AnthropicPlannerOptions(resolution_policy=policy))
+    p.debug_img_path = None
+    p.start_run()
+    return p
+
+
+def test_without_a_policy_small_viewports_are_still_scaled_up():
+    scaling = planner().choose_resolution(make_state(1024, 640), [])
+    assert scaling.new_size == Coordinate(1280, 800)
+    assert scaling.ratio_x == 0.8
+
+
+def test_policy_fits_the_token_budget_and_keeps_the_aspect_ratio():
+    scaling = planner(ResolutionPolicy(image_token_budget=1000)).choose_resolution(make_state(), [])
+    size = scaling.new_size
+    assert size.x * size.y / 750 <= 1000
+    assert size.x < 1280 and abs(size.x / size.y - 1.6) < 0.01
+
+
+def test_policy_never_scales_small_viewports_up():
+    scaling = planner(ResolutionPolicy(image_token_budget=5000)).choose_resolution(make_state(800, 500), [])
+    assert scaling.new_size == Coordinate(800, 500)
+
+
+def test_text_heavy_arrival_is_scaled_down_further():
+    p = planner(ResolutionPolicy(image_token_budget=1000, text_page_chars=4000, text_page_scale=0.6))
+    normal = p.choose_resolution(make_state(), []).new_size
+    text_page = p.choose_resolution(make_state(dom_signature="sig|9000"), []).new_size
+    assert text_page.x < normal.x
+    assert text_page.x >= 640
+
+
+def test_missed_click_gets_full_size():
+    p = planner(ResolutionPolicy(image_token_budget=500))
+    before = make_state()
+    click = BrowserStep(before, BrowserAction(BrowserActionType.LEFT_CLICK, None, None, "", "toolu_1"))
+    assert p.choose_resolution(make_state(), [click]).new_size == Coordinate(1280, 800)
+    # a click that changed the DOM did land
+    assert p.choose_resolution(make_state(dom_signature="other|100"), [click]).new_size.x < 1280
+
+
+def test_history_replays_coordinates_at_the_scaling_each_step_was_sent_at():
+    p = planner(ResolutionPolicy(image_token_budget=500))
+    first = make_state()
+    p.format_final_msg("goal", "None", first, [])
+    sent = p.scaling_for(first)
+    assert sent.new_size.x < 1280
+
+    move = BrowserStep(first, BrowserAction(BrowserActionType.MOUSE_MOVE, Coordinate(640, 400), None, "", "toolu_1"))
+    p2 = p.format_final_msg("goal", "None", make_state(dom_signature="sig|9000", url="https://example.com/b"), [move])
+    tool_use = next(block for msg in p2 if msg["role"] == "assistant" for block in msg["content"]
+                    if block.get("type") == "tool_use" and block["input"].get("action") == "mouse_move")
+    expected = p.browser_to_llm_coordinate(Coordinate(640, 400), sent)
+    assert tool_use["input"]["coordinate"] == [expected.x, expected.y]
+    assert expected != Coordinate(640, 400)
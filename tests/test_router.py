@@ -0,0 +1,111 @@
+import asyncio
+import io
+import random
+import threading
+
+from PIL import Image
+
+import anthropicAgent
+from browser import (ActionPlanner, BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab,
+                     Coordinate, ScrollBar)
+from router import ModelTier, RouterPlanner
+
+
+def frame(seed: int) -> bytes:
+    rnd = random.Random(seed)
+    img = Image.frombytes("L", (64, 40), bytes(rnd.randrange(256) for _ in range(64 * 40))).resize((1280, 800))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+FRAMES = {seed: frame(seed) for seed in range(6)}
+
+
+def state(seed: int) -> BrowserState:
+    return BrowserState(FRAMES[seed], 800, 1280, ScrollBar(0, 1),
+                        [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)], "tab-0", Coordinate(1, 1))
+
+
+CLICK = BrowserAction(BrowserActionType.LEFT_CLICK, Coordinate(200, 300), None, "", "t")
+MOVE = BrowserAction(BrowserActionType.MOUSE_MOVE, Coordinate(200, 300), None, "", "t")
+SCROLL = BrowserAction(BrowserActionType.SCROLL_DOWN, None, None, "", "t")
+PAGE_DOWN = BrowserAction(BrowserActionType.KEY, None, "Page_Down", "", "t")
+TAB = BrowserAction(BrowserActionType.KEY, None, "Tab", "", "t")
+
+
+class Fixed(ActionPlanner):
+    def __init__(self):
+        self.calls = 0
+
+    async def plan_action(self, goal, additional_context, additional_instructions, current_state, session_history):
+        self.calls += 1
+        return CLICK
+
+
+def replay(steps):
+    """steps: [(frame seed seen, action taken)]; the router plans on every state. Returns the router."""
+    router = RouterPlanner([ModelTier("fast", Fixed()), ModelTier("large", Fixed())])
+
+    async def run():
+        history = []
+        for seed, action in steps:
+            await router.plan_action("g", "", [], state(seed), history)
+            history.append(BrowserStep(state(seed), action))
+    asyncio.run(run())
+    return router
+
+
+def escalations(router):
+    return {k: v for k, v in router.escalations.items() if v}
+
+
+def test_repeated_scrolls_do_not_escalate():
+    # reading down a page, and scrolling on at its end where the frame stops changing
+    assert escalations(replay([(0, SCROLL), (1, SCROLL), (2, PAGE_DOWN), (3, PAGE_DOWN), (3, SCROLL), (3, SCROLL)])) == {}
+
+
+def test_mouse_moves_do_not_look_like_stalls():
+    # move_then_click: every click is preceded by a move that leaves the raw frame unchanged
+    assert escalations(replay([(0, MOVE), (0, CLICK), (1, MOVE), (1, CLICK), (2, MOVE), (2, CLICK), (3, None)])) == {}
+
+
+def test_repeated_key_that_moves_the_page_is_progress():
+    assert escalations(replay([(0, TAB), (1, TAB), (2, TAB), (3, TAB), (4, None)])) == {}
+
+
+def test_repeated_click_without_effect_escalates():
+    router = replay([(0, CLICK), (1, CLICK), (1, None)])
+    assert escalations(router) == {"repeat": 1}
+    assert router.tiers[1].planner.calls >= 1
+
+
+def test_returning_to_an_earlier_page_escalates():
+    # A -> B -> C -> A after clicks: the run is going in circles
+    router = replay([(0, CLICK), (1, CLICK), (2, CLICK), (0, None)])
+    assert escalations(router) == {"stall": 1}
+
+
+def test_fingerprints_are_hashed_once_per_frame_off_the_loop(monkeypatch):
+    calls = []
+    real = anthropicAgent.screenshot_hash
+
+    def recording(shot):
+        calls.append((shot, threading.current_thread() is threading.main_thread()))
+        return real(shot)
+
+    monkeypatch.setattr(anthropicAgent, "screenshot_hash", recording)
+    shots = [frame(100 + i) for i in range(3)]
+    router = RouterPlanner([ModelTier("fast", Fixed()), ModelTier("large", Fixed())])
+
+    async def run():
+        history = []
+        for shot in shots:
+            current = BrowserState(shot, 800, 1280, ScrollBar(0, 1),
+                                   [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)], "tab-0",
+                                   Coordinate(1, 1))
+            await router.plan_action("g", "", [], current, history)
+            history.append(BrowserStep(current, CLICK))
+    asyncio.run(run())
+    assert [shot for shot, _ in calls] == shots
+    assert not any(on_loop for _, on_loop in calls)
@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from anthropic import AsyncAnthropic, BadRequestError
+
+import scheduler as scheduler_module
+from scheduler import PlannerScheduler, TokenBucket
+
+
+def test_bucket_refills_continuously_up_to_capacity():
+    bucket = TokenBucket(60)  # one token per second
+    bucket.updated = 0.0
+    bucket.take(60, 0.0)
+    assert bucket.wait_time(30, 0.0) == pytest.approx(30.0)
+    assert bucket.wait_time(30, 10.0) == pytest.approx(20.0)
+    assert bucket.wait_time(30, 30.0) == 0.0
+    assert bucket.wait_time(1, 500.0) == 0.0 and bucket.level == 60
+
+
+def test_oversized_request_waits_for_a_full_bucket_only():
+    bucket = TokenBucket(60)
+    bucket.updated = 0.0
+    bucket.take(60, 0.0)
+    assert bucket.wait_time(1000, 0.0) == pytest.approx(60.0)
+
+
+def test_give_back_is_capped_and_unlimited_bucket_never_waits():
+    bucket = TokenBucket(100)
+    bucket.give_back(50)
+    assert bucket.level == 100
+    unlimited = TokenBucket(None)
+    unlimited.take(10 ** 9, 0.0)
+    assert unlimited.wait_time(10 ** 9, 0.0) == 0.0
+
+
+@pytest.fixture
+def frozen(monkeypatch):
+    """Scheduler with frozen time (no refill) and no real waiting between retries."""
+    monkeypatch.setattr(scheduler_module, "time", SimpleNamespace(monotonic=lambda: 1000.0))
+    sched = PlannerScheduler(requests_per_minute=100, input_tokens_per_minute=10000, output_tokens_per_minute=1000)
+    monkeypatch.setattr(sched, "back_off", lambda error, attempt: None)
+    monkeypatch.setattr(sched, "retry_delay", lambda error, attempt: 0.0)
+    return sched
+
+
+def test_settle_corrects_reservation_with_real_usage(frozen):
+    async def call():
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=100, output_tokens=20))
+
+    asyncio.run(frozen.submit(call, 300, 50))
+    assert frozen.input_tokens.level == 10000 - 100
+    assert frozen.output_tokens.level == 1000 - 20
+    assert frozen.requests.level == 99
+
+
+def test_streamed_usage_is_settled_when_the_stream_finishes(frozen):
+    async def run():
+        final = asyncio.get_running_loop().create_future()
+
+        async def call():
+            return SimpleNamespace(usage=final)
+
+        await frozen.submit(call, 300, 50)
+        assert frozen.input_tokens.level == 10000 - 300
+        final.set_result(SimpleNamespace(input_tokens=120, output_tokens=30))
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert frozen.input_tokens.level == 10000 - 120
+    assert frozen.output_tokens.level == 1000 - 30
+
+
+def client_call(stub_api):
+    client = AsyncAnthropic(api_key="k", base_url=stub_api.url, max_retries=0)
+    return lambda: client.messages.create(model="stub", max_tokens=16, messages=[{"role": "user", "content": "hi"}])
+
+
+def test_429_retry_releases_the_first_reservation(frozen, stub_api):
+    stub_api.statuses = [429, 200]
+    response = asyncio.run(frozen.submit(client_call(stub_api), 300, 50))
+    assert response.content[0].text == "reply 2"
+    # only the successful attempt's real usage (100 in, 10 out) is charged
+    assert frozen.input_tokens.level == 10000 - 100
+    assert frozen.output_tokens.level == 1000 - 10
+
+
+@pytest.mark.parametrize("status", [500, 529])
+def test_transient_errors_are_retried(frozen, stub_api, status):
+    stub_api.statuses = [status, 200]
+    response = asyncio.run(frozen.submit(client_call(stub_api), 300, 50))
+    assert response.content[0].text == "reply 2"
+    assert frozen.stats.retried == 1
+    assert frozen.input_tokens.level == 10000 - 100
+
+
+def test_client_errors_are_not_retried(frozen, stub_api):
+    stub_api.statuses = [400]
+    with pytest.raises(BadRequestError):
+        asyncio.run(frozen.submit(client_call(stub_api), 300, 50))
+    assert stub_api.requests == 1
+    assert frozen.input_tokens.level == 10000
@@ -0,0 +1,53 @@
+import io
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions
+from browser import (BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab,
+                     Coordinate, ScrollBar)
+
+
+def png(color=(255, 255, 255)):
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 800), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def state(elements, shot):
+    return BrowserState(shot, 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)],
+                        "tab-0", Coordinate(1, 1), elements=elements)
+
+
+def planner():
+    p = AnthropicPlanner(AnthropicPlannerOptions(set_of_marks=True, skip_unchanged_screenshots=True))
+    p.debug_img_path = None
+    return p
+
+
+def has_image(messages):
+    return any(block.get("type") == "image" for block in messages[-1]["content"][0]["content"])
+
+
+MARKS = [{"id": 1, "role": "button", "name": "Go", "box": [10, 10, 40, 20]}]
+
+
+def second_step(elements):
+    p = planner()
+    shot = png()
+    first = state(MARKS, shot)
+    p.start_run()
+    p.format_final_msg("goal", "None", first, [])
+    p.commit_sent_image()
+    action = BrowserAction(BrowserActionType.SCROLL_DOWN, None, None, "", "toolu_1")
+    return p.format_final_msg("goal", "None", state(elements, shot), [BrowserStep(first, action)])
+
+
+def test_unchanged_frame_is_reused_when_marks_match():
+    assert not has_image(second_step(list(MARKS)))
+
+
+def test_unchanged_frame_is_resent_when_marks_moved():
+    moved = [{"id": 1, "role": "button", "name": "Go", "box": [10, 60, 40, 20]}]
+    messages = second_step(moved)
+    assert has_image(messages)
+    assert "[1] button" in messages[-1]["content"][0]["content"][0]["text"]
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions
+
+REQUEST = dict(model="stub", max_tokens=64, messages=[{"role": "user", "content": "hi"}],
+               betas=["computer-use-2024-10-22"])
+
+
+def streaming_planner(url):
+    return AnthropicPlanner(AnthropicPlannerOptions(streaming=True, base_url=url, shared_client=False))
+
+
+def test_returns_when_the_tool_use_closes_and_drains_the_rest(stub_api):
+    stub_api.stream_tool = {"action": "mouse_move", "coordinate": [10, 20]}
+    stub_api.stream_tail_s = 1.0
+    planner = streaming_planner(stub_api.url)
+
+    async def run():
+        started = time.perf_counter()
+        response = await planner.stream_until_action(REQUEST)
+        early = time.perf_counter() - started
+        assert not response.usage.done()
+        usage = await asyncio.wait_for(response.usage, 5)
+        return response, early, usage
+
+    response, early, usage = asyncio.run(run())
+    assert early < 0.8
+    assert [block.type for block in response.content] == ["text", "tool_use"]
+    assert response.content[1].input == {"action": "mouse_move", "coordinate": [10, 20]}
+    # the tail was still consumed: final usage and the trailing text arrive after the action
+    assert (usage.input_tokens, usage.output_tokens) == (100, 42)
+    assert (planner.input_token_usage, planner.output_token_usage) == (100, 42)
+    assert not planner._background_tasks
+
+
+def test_batch_mode_waits_for_the_whole_reply(stub_api):
+    stub_api.stream_tail_s = 0.3
+    planner = streaming_planner(stub_api.url)
+    response = asyncio.run(planner.stream_until_action(REQUEST, early=False))
+    assert [block.type for block in response.content] == ["text", "tool_use", "text"]
+    assert response.usage.output_tokens == 42
+    assert planner.output_token_usage == 42
+
+
+def test_interrupted_tail_leaves_usage_unsettled(stub_api):
+    for started in (False, True):
+        check_interrupted_tail(stub_api, started)
+
+
+def check_interrupted_tail(stub_api, started):
+    stub_api.stream_tail_s = 2.0
+    planner = streaming_planner(stub_api.url)
+
+    async def run():
+        response = await planner.stream_until_action(REQUEST)
+        task = next(iter(planner._background_tasks))
+        if started:
+            await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return response
+
+    response = asyncio.run(run())
+    assert response.content[1].input == {"action": "screenshot"}
+    # without the final count the scheduler keeps its reservation instead of under-charging
+    assert response.usage.done() and response.usage.result() is None
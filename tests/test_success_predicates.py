@@ -0,0 +1,134 @@
+import asyncio
+
+from browser import BrowserAction, BrowserActionType, BrowserAgent, BrowserGoalState, SuccessPredicate
+from test_zoom import make_state
+
+
+class FakePage:
+    """evaluate answers SUCCESS_PROBE_JS from a set of matching selectors and the body text."""
+
+    def __init__(self, url, selectors=(), body=""):
+        self.url = url
+        self.selectors = set(selectors)
+        self.body = body
+        self.evaluations = 0
+
+    async def wait_for_load_state(self, *args, **kwargs):
+        pass
+
+    async def evaluate(self, js, checks):
+        self.evaluations += 1
+        for idx, (selector, text) in enumerate(checks):
+            if selector and selector not in self.selectors:
+                continue
+            if text and text.lower() not in self.body.lower():
+                continue
+            return idx
+        return -1
+
+
+def make_agent(page, predicates):
+    agent = BrowserAgent.__new__(BrowserAgent)
+    agent.page = page
+    agent.success_predicates = list(predicates)
+    agent._status = BrowserGoalState.RUNNING
+    agent._zoom_state = None
+    return agent
+
+
+def check(page, *predicates):
+    return asyncio.run(make_agent(page, predicates).check_success())
+
+
+def test_describe():
+    assert SuccessPredicate(url="*/wiki/React*", name="on the React article").describe() == "on the React article"
+    assert SuccessPredicate(url="*/wiki/*", text="React").describe() == "url='*/wiki/*', text='React'"
+    assert SuccessPredicate().describe() == "empty predicate"
+
+
+def test_url_glob_alone_needs_no_page_call():
+    page = FakePage("https://en.wikipedia.org/wiki/React_(software)")
+    assert check(page, SuccessPredicate(url="*.wikipedia.org/wiki/React*")) is not None
+    assert check(page, SuccessPredicate(url="*.wikipedia.org/wiki/Vue*")) is None
+    assert page.evaluations == 0
+
+
+def test_url_glob_is_case_sensitive_and_covers_the_full_url():
+    page = FakePage("https://en.wikipedia.org/wiki/react")
+    assert check(page, SuccessPredicate(url="*/wiki/React")) is None
+    assert check(page, SuccessPredicate(url="en.wikipedia.org/wiki/react")) is None
+
+
+def test_every_set_field_must_hold():
+    page = FakePage("https://shop.example.com/cart", selectors={"#cart"}, body="Your cart: 1 item")
+    both = SuccessPredicate(url="*/cart", selector="#cart", text="1 ITEM")
+    assert check(page, both) == both
+    assert check(page, SuccessPredicate(url="*/cart", selector="#checkout", text="1 item")) is None
+    assert check(page, SuccessPredicate(selector="#cart", text="2 items")) is None
+
+
+def test_url_filter_runs_before_the_page_probe():
+    page = FakePage("https://shop.example.com/cart", selectors={"#cart"})
+    assert check(page, SuccessPredicate(url="*/checkout", selector="#cart")) is None
+    assert page.evaluations == 0
+
+
+def test_first_matching_predicate_wins_in_one_probe():
+    page = FakePage("https://shop.example.com/done", selectors={"#receipt"}, body="Thank you")
+    predicates = [SuccessPredicate(selector="#missing", name="a"), SuccessPredicate(text="thank you", name="b"),
+                  SuccessPredicate(selector="#receipt", name="c")]
+    assert check(page, *predicates).name == "b"
+    assert page.evaluations == 1
+
+
+def test_step_ends_the_run_when_a_predicate_matches():
+    page = FakePage("https://example.com/start")
+    agent = make_agent(page, [SuccessPredicate(url="https://example.com/done", name="reached done")])
+
+    async def get_state():
+        return make_state()
+
+    async def get_action(state):
+        return BrowserAction(BrowserActionType.LEFT_CLICK, None, None, "", "")
+
+    async def apply_action(action, state):
+        page.url = "https://example.com/done" if len(applied) else page.url
+        applied.append(action)
+        return True
+
+    applied = []
+    agent.get_state, agent.get_action, agent.apply_action = get_state, get_action, apply_action
+    asyncio.run(agent.step())
+    assert agent.status == "running"
+    asyncio.run(agent.step())
+    assert agent.status == "success"
+    assert agent.success_reason == "reached done"
+
+
+def test_zoom_answers_skip_the_check():
+    page = FakePage("https://example.com/done")
+    agent = make_agent(page, [SuccessPredicate(url="https://example.com/done")])
+    agent._zoom_state = make_state()
+
+    async def get_action(state):
+        return BrowserAction(BrowserActionType.ZOOM, None, None, "", "")
+
+    async def apply_action(action, state):
+        agent._zoom_state = state
+        return True
+
+    agent.get_action, agent.apply_action = get_action, apply_action
+    asyncio.run(agent.step())
+    assert agent.status == "running"
+
+
+PAGE = "<h1 id='title'>React</h1><p>A JavaScript library</p>"
+
+
+def test_probe_script_in_browser(in_page):
+    async def fn(page):
+        agent = make_agent(page, [SuccessPredicate(selector="#nope"),
+                                  SuccessPredicate(selector="h1#title", text="javascript")])
+        return await agent.check_success()
+
+    assert in_page(PAGE, fn).selector == "h1#title"
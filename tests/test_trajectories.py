@@ -0,0 +1,118 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from browser import (BrowserAction, BrowserActionType, BrowserGoalState, BrowserState, BrowserStep, BrowserTab,
+                     Coordinate, ScrollBar)
+from trajectories import TrajectoryIndex, compact_trace, run_with_hints
+
+
+def make_step(url, kind, text=None):
+    state = BrowserState(b"", 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", url, "t", True, False, 0)],
+                         "tab-0", Coordinate(1, 1))
+    return BrowserStep(state, BrowserAction(BrowserActionType(kind), None, text, "", ""))
+
+
+def make_history(url, query, steps=3):
+    history = [make_step(url, "left_click"), make_step(url, "type", query)]
+    history += [make_step(url + "/results", "scroll_down") for _ in range(steps - 2)]
+    return history
+
+
+def make_index(tmp_path):
+    index = TrajectoryIndex(str(tmp_path / "runs" / "trajectories.jsonl"))
+    index.add("give me the wikipedia page of React", "https://www.wikipedia.org/",
+              make_history("https://www.wikipedia.org", "React", 5), success=True)
+    index.add("find the weather forecast for Paris", "https://weather.example.com/",
+              make_history("https://weather.example.com", "Paris"), success=True)
+    index.add("give me the wikipedia page of Vue", "https://www.wikipedia.org/",
+              make_history("https://www.wikipedia.org", "Vue", 3), success=True)
+    index.add("give me the wikipedia page of Svelte", "https://www.wikipedia.org/",
+              make_history("https://www.wikipedia.org", "Svelte", 2), success=False)
+    return index
+
+
+def test_most_similar_goal_ranks_first(tmp_path):
+    index = make_index(tmp_path)
+    found = index.search("find the weather forecast for Berlin", "https://weather.example.com/")
+    assert found[0][1]["goal"] == "find the weather forecast for Paris"
+    assert all(found[i][0] >= found[i + 1][0] for i in range(len(found) - 1))
+
+
+def test_rare_terms_outweigh_common_ones(tmp_path):
+    index = make_index(tmp_path)
+    found = index.search("wikipedia page of React", "https://www.wikipedia.org/")
+    assert found[0][1]["goal"].endswith("React")
+
+
+def test_equal_scores_prefer_the_shorter_run(tmp_path):
+    index = TrajectoryIndex(str(tmp_path / "t.jsonl"))
+    history = make_history("https://shop.example.com", "socks")
+    # mouse moves are left out of the trace, so both runs index identically
+    moves = [make_step("https://shop.example.com/results", "mouse_move")] * 4
+    index.add("buy socks", "https://shop.example.com/", history + moves, success=True)
+    index.add("buy socks", "https://shop.example.com/", history, success=True)
+    (s1, first), (s2, second) = index.search("buy socks", "https://shop.example.com/")
+    assert s1 == s2
+    assert (first["steps"], second["steps"]) == (3, 7)
+
+
+def test_failed_runs_are_only_returned_on_request(tmp_path):
+    index = make_index(tmp_path)
+    goals = lambda found: [r["goal"] for _, r in found]
+    assert "give me the wikipedia page of Svelte" not in goals(index.search("wikipedia page of Svelte", k=10))
+    assert goals(index.search("wikipedia page of Svelte", k=1, successful_only=False)) == [
+        "give me the wikipedia page of Svelte"]
+
+
+def test_unrelated_goal_finds_nothing(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search("book a table for two tonight") == []
+    assert index.hint("book a table for two tonight") is None
+
+
+def test_hint_lists_goal_steps_and_trace(tmp_path):
+    index = make_index(tmp_path)
+    hint = index.hint("find the weather forecast for Rome", "https://weather.example.com/", k=1)
+    lines = hint.splitlines()
+    assert len(lines) == 2
+    assert '"find the weather forecast for Paris" in 3 steps' in lines[1]
+    assert 'type "Paris"' in lines[1]
+
+
+def test_index_reloads_from_disk(tmp_path):
+    index = make_index(tmp_path)
+    reloaded = TrajectoryIndex(index.path)
+    assert reloaded.records == index.records
+    query = ("give me the wikipedia page of Angular", "https://www.wikipedia.org/")
+    assert reloaded.search(*query) == index.search(*query)
+    with open(index.path, encoding="utf-8") as f:
+        assert len([json.loads(line) for line in f]) == 4
+
+
+def test_compact_trace_skips_passive_actions_and_truncates():
+    history = [make_step("https://a.test/x", "mouse_move"), make_step("https://a.test/x", "type", "y" * 40)]
+    history += [make_step(f"https://a.test/{i}", "left_click") for i in range(10)]
+    trace = compact_trace(history, max_items=6)
+    assert trace[0] == "@a.test/x"
+    assert trace[1] == 'type "' + "y" * 27 + '..."'
+    assert len(trace) == 6 and trace[-1].startswith("... ")
+
+
+def test_run_with_hints_adds_context_and_records_outcome(tmp_path):
+    index = make_index(tmp_path)
+
+    class Agent:
+        goal = "find the weather forecast for Oslo"
+        page = SimpleNamespace(url="https://weather.example.com/")
+        additional_context = "None"
+        history = make_history("https://weather.example.com", "Oslo")
+        status = BrowserGoalState.SUCCESS
+
+        async def start(self):
+            pass
+
+    agent = Agent()
+    asyncio.run(run_with_hints(agent, index))
+    assert "Paris" in agent.additional_context
+    assert index.records[-1]["goal"] == agent.goal and index.records[-1]["success"] is True
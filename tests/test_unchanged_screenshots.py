@@ -0,0 +1,126 @@
+import io
+from dataclasses import replace
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner, AnthropicPlannerOptions, HistoryPolicy, hash_distance, screenshot_hash
+from browser import BrowserAction, BrowserActionType, BrowserState, BrowserStep, BrowserTab, Coordinate, ScrollBar
+
+
+def png(color=(255, 255, 255)):
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 800), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def make_state(shot, mouse=Coordinate(1, 1)):
+    return BrowserState(shot, 800, 1280, ScrollBar(0, 1), [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)],
+                        "tab-0", mouse)
+
+
+def planner(**options):
+    p = AnthropicPlanner(AnthropicPlannerOptions(skip_unchanged_screenshots=True, **options))
+    p.debug_img_path = None
+    p.start_run()
+    return p
+
+
+def fading():
+    # brightness falling left to right flips every "left brighter than right" bit
+    return Image.linear_gradient("L").rotate(-90).resize((1280, 800)).convert("RGB")
+
+
+def has_image(message):
+    return any(block.get("type") == "image" for block in message["content"][0]["content"])
+
+
+def note(message):
+    return message["content"][0]["content"][0]["text"]
+
+
+def run_steps(p, states, kind=BrowserActionType.SCROLL_DOWN):
+    """format_final_msg for each state in turn, as if every request went through; returns the last request."""
+    history = []
+    for idx, state in enumerate(states):
+        messages = p.format_final_msg("goal", "None", state, history)
+        p.commit_sent_image()
+        history.append(BrowserStep(state, BrowserAction(kind, None, None, "", f"toolu_{idx}")))
+    return messages
+
+
+def encode(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_screenshot_hash_tolerates_noise_but_not_new_content():
+    base = Image.new("RGB", (1280, 800), (250, 250, 250))
+    noisy = base.copy()
+    noisy.putpixel((5, 5), (0, 0, 0))
+    assert hash_distance(screenshot_hash(encode(base)), screenshot_hash(encode(noisy))) == 0
+    assert hash_distance(screenshot_hash(encode(base)), screenshot_hash(encode(fading()))) > 3
+
+
+def test_unchanged_frame_is_replaced_by_a_note():
+    shot = png()
+    messages = run_steps(planner(), [make_state(shot), make_state(shot)])
+    assert not has_image(messages[-1])
+    assert "Screen unchanged" in note(messages[-1])
+
+
+def test_unchanged_page_is_resent_when_the_pointer_moved():
+    # mouse_move on a static page: the pinned frame would show the cursor at its old position
+    shot = png()
+    messages = run_steps(planner(), [make_state(shot), make_state(shot, Coordinate(600, 400))],
+                         kind=BrowserActionType.MOUSE_MOVE)
+    assert has_image(messages[-1])
+    assert "Screen unchanged" not in note(messages[-1])
+
+
+def images(messages):
+    found = []
+    for i, message in enumerate(messages):
+        for block in message["content"]:
+            nested = block.get("content") if isinstance(block.get("content"), list) else [block]
+            found += [i for b in nested if b.get("type") == "image"]
+    return found
+
+
+def test_last_frame_is_pinned_into_history_and_unpinned():
+    shot = png()
+    p = planner()
+    messages = run_steps(p, [make_state(shot)] * 3)
+    conv = p.conversation
+    # the frame sent with step 0 is carried by its tool_result while the screen stays the same
+    assert conv.pinned_index == conv.step_slice(0)
+    assert images(messages) == [conv.step_slice(0)]
+    assert conv.pinned_image() is p._last_image_block
+
+    conv.unpin_image()
+    assert conv.pinned_index is None and conv.pinned_image() is None
+    assert images(conv.messages) == []
+
+
+def test_pinned_frame_moves_into_the_head_when_its_step_is_folded():
+    shot = png()
+    p = planner(history_policy=HistoryPolicy(token_budget=1, keep_last=2))
+    states = [make_state(shot)] * 6
+    messages = run_steps(p, states)
+    folded = p.apply_history_policy(messages, states[-1], 0)
+    # 2 steps folded, including the pinned step 0; the model still needs the frame the note refers to
+    assert images(folded) == [0]
+    assert folded[0]["content"][-2]["text"].startswith("Latest screenshot")
+    assert folded[0]["content"][-1] is p.conversation.pinned_image()
+
+
+def test_pinned_frame_stays_in_place_when_its_step_is_kept():
+    white, gradient = png(), encode(fading())
+    p = planner(history_policy=HistoryPolicy(token_budget=1, keep_last=2))
+    states = [make_state(s) for s in (white, gradient, white, white, white, white)]
+    messages = run_steps(p, states)
+    conv = p.conversation
+    assert conv.pinned_index == conv.step_slice(2)
+    folded = p.apply_history_policy(messages, states[-1], 0)
+    # step 2 opens the kept tail, so the pinned tool_result comes right after the head
+    assert images(folded) == [2]
@@ -0,0 +1,59 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+from PIL import Image
+
+from anthropicAgent import AnthropicPlanner
+from browser import (BrowserAction, BrowserActionType, BrowserAgent, BrowserState, BrowserTab, Coordinate,
+                     ScrollBar)
+
+
+def make_state():
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 800), (200, 200, 200)).save(buf, format="PNG")
+    return BrowserState(buf.getvalue(), 800, 1280, ScrollBar(0, 1),
+                        [BrowserTab("tab-0", "https://example.com/", "t", True, False, 0)], "tab-0", Coordinate(1, 1))
+
+
+def parse_zoom(region):
+    planner = AnthropicPlanner()
+    state = make_state()
+    block = SimpleNamespace(type="tool_use", name="zoom", id="toolu_1", input={"region": region})
+    return planner.parse_tool_use(block, "", planner.scaling_for(state), state)
+
+
+def test_inverted_region_is_sorted():
+    action = parse_zoom([300, 200, 100, 50])
+    assert action.action == BrowserActionType.ZOOM
+    assert action.region == (100, 50, 300, 200)
+    assert action.text is None
+
+
+def test_region_is_clamped_to_viewport():
+    assert parse_zoom([1200, 700, 5000, 5000]).region == (1200, 700, 1280, 800)
+
+
+def test_unusable_regions_become_tool_errors():
+    for region in ([10, 10, 10, 300], [5000, 5000, 6000, 6000], [1, 2, 3], "top left", None):
+        action = parse_zoom(region)
+        assert action.action == BrowserActionType.ZOOM, region
+        assert action.region is None and action.text, region
+
+
+def test_rejected_zoom_reaches_the_model_instead_of_raising():
+    agent = BrowserAgent.__new__(BrowserAgent)
+    agent.page = SimpleNamespace(keyboard=None, mouse=None)
+    agent._zoom_state, agent._tool_output, agent.zoom_steps = None, None, 0
+    state = make_state()
+    for action in (
+        BrowserAction(BrowserActionType.ZOOM, None, "zoom region has no area", "", "toolu_1"),
+        BrowserAction(BrowserActionType.ZOOM, None, None, "", "toolu_2", region=(5000, 5000, 6000, 6000)),
+    ):
+        asyncio.run(agent.take_action(action, state))
+        assert agent._zoom_state is None and agent.zoom_steps == 0
+        assert agent._pop_tool_output()["tool"] == "zoom"
+
+    planner = AnthropicPlanner()
+    text = planner.format_tool_output(BrowserState(**{**state.__dict__, "tool_output": {"tool": "zoom", "error": "bad"}}))
+    assert text == "zoom failed: bad"